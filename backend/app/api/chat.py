@@ -3,12 +3,16 @@ Chat API endpoints for RAG conversations.
 """
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from app.core.auth import get_current_user_id
+from app.core.database import db_manager
+from app.core.ownership import assert_owns_chat, invalidate_chat_ownership
 from app.services.chat_service import (
     create_chat_session,
     process_chat_message,
+    stream_chat_message,
     get_chat_history,
     get_user_chat_sessions
 )
@@ -16,6 +20,13 @@ from app.services.chat_service import (
 router = APIRouter()
 
 
+# SQL kept as module-level constants so asyncpg's per-connection statement
+# cache is keyed on the exact same text for every request
+DELETE_CHAT_SESSION_QUERY = """
+    DELETE FROM chat_sessions WHERE id = $1 AND "userId" = $2
+"""
+
+
 # Request/Response models
 class CreateChatRequest(BaseModel):
     document_id: Optional[str] = None
@@ -68,26 +79,16 @@ async def create_chat(
         )
 
 
-@router.get("/sessions")
+@router.get("/sessions", response_model=List[ChatSessionResponse])
 async def list_chat_sessions(
     user_id: str = Depends(get_current_user_id),
     limit: int = 20
-) -> List[ChatSessionResponse]:
+):
     """List user's chat sessions."""
     try:
-        sessions = await get_user_chat_sessions(user_id, limit)
-
-        return [
-            ChatSessionResponse(
-                id=session["id"],
-                title=session["title"],
-                document_name=session["document_name"],
-                last_message=session["last_message"],
-                created_at=session["created_at"],
-                updated_at=session["updated_at"]
-            )
-            for session in sessions
-        ]
+        # The service already returns response-shaped dicts; the response_model
+        # validates them once on the way out
+        return await get_user_chat_sessions(user_id, limit)
 
     except Exception as e:
         raise HTTPException(
@@ -104,26 +105,10 @@ async def send_message(
 ):
     """Send a message and get AI response."""
     try:
-        # Get document_id from chat session if needed
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            chat_info = await conn.fetchrow("""
-                SELECT "documentIds", "userId" FROM chat_sessions
-                WHERE id = $1 AND "userId" = $2
-            """, chat_id, user_id)
-
-        if not chat_info:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
+        # Ownership check also yields the session's document
+        document_id = await assert_owns_chat(chat_id, user_id)
 
         # Process the message through RAG pipeline
-        # Get the first document ID from the array
-        document_id = None
-        if chat_info["documentIds"] and len(chat_info["documentIds"]) > 0:
-            document_id = chat_info["documentIds"][0]
 
         response = await process_chat_message(
             message=request.message,
@@ -132,12 +117,7 @@ async def send_message(
             chat_id=chat_id
         )
 
-        return ChatMessageResponse(
-            message=response["message"],
-            citations=response["citations"],
-            has_context=response["has_context"],
-            chunks_found=response["chunks_found"]
-        )
+        return response
 
     except HTTPException:
         raise
@@ -148,6 +128,34 @@ async def send_message(
         )
 
 
+@router.post("/sessions/{chat_id}/messages/stream")
+async def stream_message(
+    chat_id: str,
+    request: ChatMessageRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Send a message and stream the AI response as server-sent events.
+
+    Emits "delta" events with {"text"} as the answer is generated, then a
+    "done" event shaped like ChatMessageResponse, or an "error" event.
+    """
+    # Ownership is checked before streaming starts, so it can still fail with a status code
+    document_id = await assert_owns_chat(chat_id, user_id)
+
+    return StreamingResponse(
+        stream_chat_message(
+            message=request.message,
+            document_id=document_id,
+            user_id=user_id,
+            chat_id=chat_id
+        ),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/sessions/{chat_id}/messages")
 async def get_messages(
     chat_id: str,
@@ -157,18 +165,7 @@ async def get_messages(
     """Get chat message history."""
     try:
         # Verify user owns this chat
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            chat_exists = await conn.fetchval("""
-                SELECT EXISTS(SELECT 1 FROM chat_sessions WHERE id = $1 AND "userId" = $2)
-            """, chat_id, user_id)
-
-        if not chat_exists:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
+        await assert_owns_chat(chat_id, user_id)
 
         messages = await get_chat_history(chat_id, limit)
 
@@ -194,18 +191,14 @@ async def delete_chat_session(
 ):
     """Delete a chat session and all its messages."""
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            result = await conn.execute("""
-                DELETE FROM chat_sessions WHERE id = $1 AND "userId" = $2
-            """, chat_id, user_id)
-
-            if result == "DELETE 0":
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Chat session not found"
-                )
+        result = await db_manager.execute(DELETE_CHAT_SESSION_QUERY, chat_id, user_id)
+        invalidate_chat_ownership(chat_id, user_id)
+
+        if result == "DELETE 0":
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found"
+            )
 
         return {
             "success": True,
@@ -3,134 +3,351 @@ Document management API endpoints.
 Handles file upload, processing status, and document management.
 """
 import uuid
-from typing import List, Optional
+import hashlib
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+import numpy as np
 from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status
 from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from pydantic import AliasGenerator, BaseModel, ConfigDict
+from pydantic.alias_generators import to_camel
 
 from app.core.auth import get_current_user_id
 from app.core.config import settings
-from app.core.supabase_client import get_supabase_client, DOCUMENTS_BUCKET
-from app.services.document_processor import process_document_file
-from app.services.embedding_service import generate_embeddings
-from app.services.vector_search import store_embeddings_in_database
+from app.core.database import db_manager
+from app.core.supabase_client import get_supabase_client, supabase_manager, DOCUMENTS_BUCKET
+from app.services.chat_service import delete_chat_sessions_for_document
+from app.services.document_processor import DocumentChunks, iter_document_chunks
+from app.services.embedding_service import (
+    HASHING_STRATEGY, LEGACY_STRATEGY, active_embedding_strategy, encode_with_model, generate_embeddings
+)
+from app.services.vector_search import (
+    fetch_cached_embeddings,
+    store_cached_embeddings,
+    store_embeddings_in_database,
+    delete_document_embeddings,
+    copy_document_embeddings
+)
+from app.services.processing_queue import document_queue, QueueFullError
 import asyncio
 
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Every PDF starts with this header
+PDF_MAGIC = b"%PDF-"
+
+# Read size used when streaming uploads through to storage
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Suggested client back-off when the processing queue is full
+PROCESSING_RETRY_AFTER_SECONDS = 30
+
+# Chunks per embedding call and how many of those calls may run at once
+EMBEDDING_BATCH_SIZE = 64
+EMBEDDING_CONCURRENCY = 4
+
+
+# SQL kept as module-level constants so asyncpg's per-connection statement
+# cache is keyed on the exact same text for every request
+DOCUMENT_INFO_QUERY = 'SELECT "originalName", "contentSha" FROM documents WHERE id = $1'
+
+# An already processed upload of the exact same bytes, if any
+DUPLICATE_DOCUMENT_QUERY = """
+    SELECT id, "embeddingModel" FROM documents
+    WHERE "contentSha" = $1 AND status = 'COMPLETED' AND id <> $2
+    LIMIT 1
+"""
+
+# Documents waiting to be re-embedded (see LEGACY_DOCUMENTS_QUERY in vector_search)
+LEGACY_DOCUMENTS_QUERY = """
+    SELECT id, "userId", filename FROM documents
+    WHERE "embeddingModel" = $1 AND status = 'PROCESSING'
+"""
+
+# Takes a legacy document for re-embedding; only one worker's claim succeeds
+CLAIM_LEGACY_DOCUMENT_QUERY = """
+    UPDATE documents SET "embeddingModel" = NULL
+    WHERE id = $1 AND "embeddingModel" = $2
+"""
+
+MARK_DOCUMENT_COMPLETED_QUERY = """
+    UPDATE documents
+    SET status = $1, "processedAt" = $2, "embeddingModel" = $4
+    WHERE id = $3
+"""
+
+MARK_DOCUMENT_FAILED_QUERY = """
+    UPDATE documents
+    SET status = $1, "errorMessage" = $2
+    WHERE id = $3
+"""
+
+LATEST_USER_DOCUMENT_QUERY = """
+    SELECT id, "originalName", status FROM documents
+    WHERE "userId" = $1
+    ORDER BY "uploadedAt" DESC
+    LIMIT 1
+"""
+
+# Ensures the (minimal) user row exists and inserts the document in a single
+# statement; the FK check runs at statement end so it sees the CTE's insert
+INSERT_DOCUMENT_QUERY = """
+    WITH ensured_user AS (
+        INSERT INTO users (id, email, "createdAt", "updatedAt")
+        VALUES ($1, $2, NOW(), NOW())
+        ON CONFLICT (id) DO NOTHING
+    )
+    INSERT INTO documents (
+        id, "userId", filename, "originalName", "mimeType", size, status, "contentSha"
+    ) VALUES ($3, $1, $4, $5, $6, $7, $8, $9)
+"""
+
+CURRENT_DOCUMENT_QUERY = """
+    SELECT
+        id, filename, "originalName", "mimeType", size, status,
+        "uploadedAt", "processedAt", "errorMessage"
+    FROM documents
+    WHERE "userId" = $1
+    ORDER BY "uploadedAt" DESC
+    LIMIT 1
+"""
+
+# COUNT(*) OVER() is evaluated before LIMIT/OFFSET, so every row carries the
+# user's total document count
+LIST_DOCUMENTS_QUERY = """
+    SELECT
+        id, filename, "originalName", "mimeType", size, status,
+        "uploadedAt", "processedAt", "errorMessage",
+        COUNT(*) OVER() AS total
+    FROM documents
+    WHERE "userId" = $1
+    ORDER BY "uploadedAt" DESC
+    LIMIT $2 OFFSET $3
+"""
+
+COUNT_DOCUMENTS_QUERY = 'SELECT COUNT(*) FROM documents WHERE "userId" = $1'
+
+GET_DOCUMENT_QUERY = """
+    SELECT
+        id, filename, "originalName", "mimeType", size, status,
+        "uploadedAt", "processedAt", "errorMessage"
+    FROM documents
+    WHERE id = $1 AND "userId" = $2
+"""
+
+DOCUMENT_STATUS_QUERY = """
+    SELECT status, "errorMessage"
+    FROM documents
+    WHERE id = $1 AND "userId" = $2
+"""
+
+DOCUMENT_FILENAME_QUERY = """
+    SELECT filename FROM documents
+    WHERE id = $1 AND "userId" = $2
+"""
+
+DELETE_DOCUMENT_QUERY = 'DELETE FROM documents WHERE id = $1 AND "userId" = $2'
+
+
+async def embed_chunk_texts(texts: List[str], strategy: str) -> np.ndarray:
+    """
+    Embed chunk texts with the document's strategy, reusing model embeddings
+    persisted for identical content.
+
+    Only SentenceTransformer embeddings are persisted; the hashed fallback is
+    cheaper to recompute than to look up.
+    """
+    if strategy == HASHING_STRATEGY:
+        return await asyncio.to_thread(generate_embeddings, texts, HASHING_STRATEGY)
 
-async def process_document_background(document_id: str, user_id: str, storage_filename: str):
+    model = strategy
+
+    hashes = [hashlib.sha256(text.encode("utf-8")).digest() for text in texts]
+    cached = await fetch_cached_embeddings(hashes, model)
+
+    # Encode each distinct uncached text once
+    missing: Dict[bytes, int] = {}
+    for i, digest in enumerate(hashes):
+        if digest not in cached and digest not in missing:
+            missing[digest] = i
+
+    if missing:
+        # No fallback here: the whole document has to share one vector space
+        encoded = await asyncio.to_thread(encode_with_model, [texts[i] for i in missing.values()])
+        await store_cached_embeddings(list(missing), model, encoded)
+        cached.update(zip(missing, encoded))
+
+    return np.vstack([cached[digest] for digest in hashes])
+
+
+async def embed_and_store_chunks(
+    document_id: str,
+    chunks: DocumentChunks,
+    strategy: str,
+    semaphore: Optional[asyncio.Semaphore] = None
+) -> int:
+    """
+    Generate embeddings in concurrent batches and store each batch as soon as it is ready.
+
+    Embedding runs in worker threads so the event loop stays free, and each
+    batch's database write overlaps with the encoding of the remaining batches.
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+
+    async def _process_batch(batch: DocumentChunks) -> int:
+        async with semaphore:
+            embeddings = await embed_chunk_texts(batch.contents, strategy)
+        await store_embeddings_in_database(document_id, batch, embeddings)
+        return len(embeddings)
+
+    batches = [
+        chunks.slice(i, i + EMBEDDING_BATCH_SIZE)
+        for i in range(0, len(chunks), EMBEDDING_BATCH_SIZE)
+    ]
+    stored_counts = await asyncio.gather(*(_process_batch(batch) for batch in batches))
+    return sum(stored_counts)
+
+
+async def embed_and_store_document(
+    document_id: str,
+    chunk_groups: AsyncIterator[DocumentChunks],
+    strategy: str
+) -> int:
+    """
+    Embed and store chunks while the rest of the document is still being processed.
+
+    Each group of chunks is handed to embed_and_store_chunks as soon as it is
+    yielded, sharing one concurrency limit and one embedding strategy.
+    """
+    semaphore = asyncio.Semaphore(EMBEDDING_CONCURRENCY)
+    tasks = []
+    try:
+        async for group in chunk_groups:
+            tasks.append(asyncio.create_task(embed_and_store_chunks(document_id, group, strategy, semaphore)))
+        return sum(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def process_document_background(
+    document_id: str,
+    user_id: str,
+    storage_filename: str,
+    reembed: bool = False
+):
     """
     Background document processing without Celery.
     Downloads PDF from storage, extracts text, creates chunks, generates embeddings, and stores them.
+    With reembed, the document is a legacy one queued by requeue_legacy_documents
+    and is skipped if another worker already claimed it.
     """
-    print(f"🚀 BG_PROCESS: Starting background processing for document {document_id}")
+    logger.info("🚀 BG_PROCESS: Starting background processing for document %s", document_id)
 
     try:
-        from app.core.database import db_manager
-        from app.core.supabase_client import supabase_manager, DOCUMENTS_BUCKET
-        from datetime import datetime
-        import tempfile
-        import os
+        if reembed:
+            claimed = await db_manager.execute(CLAIM_LEGACY_DOCUMENT_QUERY, document_id, LEGACY_STRATEGY)
+            if claimed == "UPDATE 0":
+                return
+
+        # Get document info for filename and content hash
+        doc_info = await db_manager.fetchrow(DOCUMENT_INFO_QUERY, document_id)
+
+        # Identical bytes were already processed - reuse their chunks and embeddings
+        content_sha = doc_info["contentSha"] if doc_info else None
+        if content_sha:
+            duplicate = await db_manager.fetchrow(DUPLICATE_DOCUMENT_QUERY, content_sha, document_id)
+            if duplicate:
+                duplicate_id = duplicate["id"]
+                copied_count = await copy_document_embeddings(duplicate_id, document_id)
+                if copied_count:
+                    await db_manager.execute(
+                        MARK_DOCUMENT_COMPLETED_QUERY, "COMPLETED", datetime.utcnow(), document_id,
+                        duplicate["embeddingModel"]
+                    )
+                    logger.info(
+                        "🎉 BG_PROCESS: Document %s COMPLETED (%d embeddings reused from %s)",
+                        document_id, copied_count, duplicate_id
+                    )
+                    return
 
         # Step 1: Download PDF from Supabase Storage
-        print(f"📥 BG_PROCESS: Downloading PDF from Supabase storage...")
+        logger.debug("📥 BG_PROCESS: Downloading PDF from Supabase storage...")
         pdf_content = await supabase_manager.download_file(
             bucket=DOCUMENTS_BUCKET,
             file_path=storage_filename
         )
-        print(f"✅ BG_PROCESS: PDF downloaded - {len(pdf_content)} bytes")
-
-        # Step 2: Save to temporary file and process
-        print(f"📄 BG_PROCESS: Processing document...")
-        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp_file:
-            temp_file.write(pdf_content)
-            temp_file_path = temp_file.name
+        logger.debug("✅ BG_PROCESS: PDF downloaded - %d bytes", len(pdf_content))
 
-        try:
-            # Get document info for filename
-            async with db_manager.get_connection() as conn:
-                doc_info = await conn.fetchrow(
-                    'SELECT "originalName" FROM documents WHERE id = $1',
-                    document_id
-                )
-
-            # Process the document
-            processing_result = await process_document_file(
-                file_path=temp_file_path,
-                document_id=document_id,
-                filename=doc_info["originalName"] if doc_info else "unknown.pdf"
-            )
+        # Steps 2-4: Extract and chunk the PDF straight from memory, embedding
+        # and storing each page range's chunks while later pages are processed
+        logger.debug("📄 BG_PROCESS: Processing document...")
+        chunk_groups = iter_document_chunks(
+            source=pdf_content,
+            document_id=document_id,
+            filename=doc_info["originalName"] if doc_info else "unknown.pdf"
+        )
+        # Chosen once, so a model finishing loading mid-document can't mix vector spaces
+        strategy = active_embedding_strategy()
+        stored_count = await embed_and_store_document(document_id, chunk_groups, strategy)
+        logger.debug("✅ BG_PROCESS: Generated and stored %d embeddings (%s)", stored_count, strategy)
+
+        # Step 5: Update document status to completed
+        await db_manager.execute(
+            MARK_DOCUMENT_COMPLETED_QUERY, "COMPLETED", datetime.utcnow(), document_id, strategy
+        )
 
-            # Clean up temp file
-            os.unlink(temp_file_path)
-
-            if not processing_result["success"]:
-                raise Exception(f"Document processing failed: {processing_result.get('error')}")
-
-            chunks = processing_result["chunks"]
-            print(f"✅ BG_PROCESS: Document processed - {len(chunks)} chunks created")
-
-            # Step 3: Generate embeddings
-            print(f"🧠 BG_PROCESS: Generating embeddings...")
-            texts = [chunk["content"] for chunk in chunks]
-            embeddings = generate_embeddings(texts)
-            print(f"✅ BG_PROCESS: Generated {len(embeddings)} embeddings")
-
-            # Step 4: Store in database
-            print(f"💾 BG_PROCESS: Storing embeddings in database...")
-            await store_embeddings_in_database(document_id, chunks, embeddings)
-            print(f"✅ BG_PROCESS: Embeddings stored successfully")
-
-            # Step 5: Update document status to completed
-            print(f"🏁 BG_PROCESS: Updating document status to COMPLETED...")
-            async with db_manager.get_connection() as conn:
-                await conn.execute("""
-                    UPDATE documents
-                    SET status = $1, "processedAt" = $2
-                    WHERE id = $3
-                """, "COMPLETED", datetime.utcnow(), document_id)
-
-            print(f"🎉 BG_PROCESS: Document processing completed successfully!")
-
-        except Exception as process_error:
-            # Clean up temp file if it exists
-            try:
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-            except:
-                pass
-            raise process_error
+        logger.info("🎉 BG_PROCESS: Document %s COMPLETED", document_id)
 
     except Exception as e:
-        print(f"❌ BG_PROCESS: Processing failed: {e}")
+        logger.error(f"❌ BG_PROCESS: Processing failed for document {document_id}: {e}")
 
         # Update document status to failed
         try:
-            async with db_manager.get_connection() as conn:
-                await conn.execute("""
-                    UPDATE documents
-                    SET status = $1, "errorMessage" = $2
-                    WHERE id = $3
-                """, "FAILED", str(e), document_id)
-            print(f"💾 BG_PROCESS: Document status updated to FAILED")
+            await db_manager.execute(MARK_DOCUMENT_FAILED_QUERY, "FAILED", str(e), document_id)
+            logger.info("💾 BG_PROCESS: Document %s FAILED", document_id)
         except Exception as status_error:
-            print(f"❌ BG_PROCESS: Failed to update status: {status_error}")
+            logger.error(f"❌ BG_PROCESS: Failed to update status: {status_error}")
+
 
 
 
+async def requeue_legacy_documents():
+    """Queue every document waiting to be re-embedded, waiting for queue room as needed."""
+    try:
+        rows = await db_manager.fetch(LEGACY_DOCUMENTS_QUERY, LEGACY_STRATEGY)
+        for row in rows:
+            await document_queue.put(row["id"], row["userId"], row["filename"], True)
+        if rows:
+            logger.info(f"🔄 Queued {len(rows)} legacy documents for re-embedding")
+    except Exception as e:
+        logger.error(f"❌ Failed to queue legacy documents for re-embedding: {e}")
+
 
 # Response models
 class DocumentResponse(BaseModel):
+    # Validation accepts the camelCase column names straight from asyncpg rows;
+    # serialization keeps the snake_case field names
+    model_config = ConfigDict(
+        alias_generator=AliasGenerator(validation_alias=to_camel),
+        populate_by_name=True
+    )
+
     id: str
     filename: str
     original_name: str
     mime_type: str
     size: int
     status: str
-    uploaded_at: str
-    processed_at: Optional[str] = None
+    uploaded_at: datetime
+    processed_at: Optional[datetime] = None
     error_message: Optional[str] = None
 
 
@@ -153,10 +370,37 @@ class StatusResponse(BaseModel):
     error_message: Optional[str] = None
 
 
-def validate_pdf_file(file: UploadFile) -> None:
-    """Validate uploaded PDF file."""
+async def _iter_upload_chunks(
+    file: UploadFile,
+    hasher=None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+):
+    """
+    Yield the uploaded file in fixed-size chunks so it is never fully buffered.
+
+    If a hasher is given it is updated with every chunk, so the content hash is
+    ready once the stream has been consumed.
+    """
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+
+async def validate_pdf_file(file: UploadFile) -> None:
+    """Validate uploaded PDF file, including its %PDF- header, without reading the body."""
     # Check file size
-    if file.size and file.size > settings.max_file_size:
+    if file.size is None:
+        raise HTTPException(
+            status_code=status.HTTP_411_LENGTH_REQUIRED,
+            detail="File size could not be determined"
+        )
+
+    if file.size > settings.max_file_size:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File size exceeds maximum limit of {settings.max_file_size // (1024*1024)}MB"
@@ -177,6 +421,24 @@ def validate_pdf_file(file: UploadFile) -> None:
             detail="File must have .pdf extension"
         )
 
+    # Check magic bytes - content type and extension are client-controlled
+    header = await file.read(len(PDF_MAGIC))
+    await file.seek(0)
+    if header != PDF_MAGIC:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File content is not a valid PDF"
+        )
+
+
+def _processing_busy_error() -> HTTPException:
+    """503 returned when the processing queue has no room for another document."""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Document processing is busy, please retry shortly",
+        headers={"Retry-After": str(PROCESSING_RETRY_AFTER_SECONDS)}
+    )
+
 
 @router.post("/upload", response_model=UploadResponse)
 async def upload_document(
@@ -190,103 +452,81 @@ async def upload_document(
     - **file**: PDF file to upload (max 10MB)
     - **Returns**: Document ID and processing status
     """
-    print(f"🚀 UPLOAD_START: Document upload initiated")
-    print(f"🚀 UPLOAD_START: User ID: {user_id}")
-    print(f"🚀 UPLOAD_START: Filename: {file.filename}")
-    print(f"🚀 UPLOAD_START: Content type: {file.content_type}")
-    print(f"🚀 UPLOAD_START: File size: {file.size} bytes")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "🚀 UPLOAD_START: user=%s filename=%s content_type=%s size=%s",
+            user_id, file.filename, file.content_type, file.size
+        )
 
     try:
+        # Shed load before doing any work if processing is backed up
+        if document_queue.is_full():
+            raise _processing_busy_error()
+
+        # Validate file before touching the database
+        await validate_pdf_file(file)
+
         # Check if user already has a document (one document per user policy)
-        print(f"🔍 UPLOAD_CHECK: Checking for existing documents...")
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            existing_doc = await conn.fetchrow("""
-                SELECT id, "originalName", status FROM documents
-                WHERE "userId" = $1
-                ORDER BY "uploadedAt" DESC
-                LIMIT 1
-            """, user_id)
-
-            if existing_doc:
-                print(f"❌ UPLOAD_CHECK: User already has document: {existing_doc['originalName']} ({existing_doc['status']})")
-                raise HTTPException(
-                    status_code=status.HTTP_409_CONFLICT,
-                    detail=f"User already has a document: '{existing_doc['originalName']}' (Status: {existing_doc['status']}). Please delete the existing document before uploading a new one."
-                )
-
-        print(f"✅ UPLOAD_CHECK: No existing documents found, proceeding with upload")
-
-        # Validate file
-        print(f"🔍 UPLOAD_VALIDATE: Validating PDF file...")
-        validate_pdf_file(file)
-        print(f"✅ UPLOAD_VALIDATE: File validation passed")
+        existing_doc = await db_manager.fetchrow(LATEST_USER_DOCUMENT_QUERY, user_id)
+
+        if existing_doc:
+            logger.debug(
+                "❌ UPLOAD_CHECK: User already has document: %s (%s)",
+                existing_doc['originalName'], existing_doc['status']
+            )
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"User already has a document: '{existing_doc['originalName']}' (Status: {existing_doc['status']}). Please delete the existing document before uploading a new one."
+            )
+
 
         # Generate unique document ID and filename
         document_id = str(uuid.uuid4())
         file_extension = ".pdf"
         storage_filename = f"{user_id}/{document_id}{file_extension}"
-        print(f"🔧 UPLOAD_PREPARE: Generated document ID: {document_id}")
-        print(f"🔧 UPLOAD_PREPARE: Storage filename: {storage_filename}")
-
-        # Read file content
-        print(f"📖 UPLOAD_READ: Reading file content...")
-        file_content = await file.read()
-        print(f"✅ UPLOAD_READ: File read successfully - {len(file_content)} bytes")
-
-        # Upload to Supabase Storage
-        print(f"☁️ UPLOAD_STORAGE: Uploading to Supabase storage...")
-        print(f"☁️ UPLOAD_STORAGE: Bucket: {DOCUMENTS_BUCKET}")
-        print(f"☁️ UPLOAD_STORAGE: Path: {storage_filename}")
+        logger.debug("🔧 UPLOAD_PREPARE: document_id=%s storage_path=%s", document_id, storage_filename)
+
+        # Size comes from the spooled upload itself (checked during validation);
+        # the body is streamed below
+        file_size = file.size
+
+        # Upload to Supabase Storage, hashing the bytes as they stream through
+        content_hasher = hashlib.sha256()
+        logger.debug("☁️ UPLOAD_STORAGE: Streaming %s bytes to %s/%s", file_size, DOCUMENTS_BUCKET, storage_filename)
         upload_result = await supabase_client.upload_file(
             bucket=DOCUMENTS_BUCKET,
             file_path=storage_filename,
-            file_content=file_content,
-            content_type=file.content_type
+            file_content=_iter_upload_chunks(file, content_hasher),
+            content_type=file.content_type,
+            content_length=file_size
         )
-        print(f"✅ UPLOAD_STORAGE: Upload result: {upload_result.get('success', 'Unknown')}")
 
         # Check if upload was successful
         if not upload_result.get("success", False):
             error_msg = upload_result.get('error', 'Upload failed - unknown error')
-            print(f"❌ UPLOAD_STORAGE: Upload failed: {error_msg}")
+            logger.error(f"❌ UPLOAD_STORAGE: Upload failed: {error_msg}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Failed to upload file: {error_msg}"
             )
 
-        print(f"✅ UPLOAD_STORAGE: File uploaded successfully to Supabase")
-
-        # Create document record in database (reuse the existing connection)
-        print(f"📝 UPLOAD_DB: Creating document record in database...")
-        async with db_manager.get_connection() as conn:
-            # Ensure user exists (create if not) - minimal record to satisfy FK
-            print(f"👤 UPLOAD_DB: Ensuring user record exists...")
-            await conn.execute("""
-                INSERT INTO users (id, email, "createdAt", "updatedAt")
-                VALUES ($1, $2, NOW(), NOW())
-                ON CONFLICT (id) DO NOTHING
-            """, user_id, f"user-{user_id}@temp.com")
-            print(f"✅ UPLOAD_DB: User record verified/created")
-
-            print(f"📄 UPLOAD_DB: Inserting document record...")
-            await conn.execute("""
-                INSERT INTO documents (
-                    id, "userId", filename, "originalName", "mimeType", size, status
-                ) VALUES ($1, $2, $3, $4, $5, $6, $7)
-            """, document_id, user_id, storage_filename, file.filename,
-                file.content_type, len(file_content), "PROCESSING")
-            print(f"✅ UPLOAD_DB: Document record created with status PROCESSING")
-
-        # Trigger background processing (without Celery)
-        print(f"🔄 UPLOAD: Starting background processing for document {document_id}")
+
+        # Create document record in database, ensuring the user exists
+        # (minimal record to satisfy FK) in the same round trip
+        await db_manager.execute(
+            INSERT_DOCUMENT_QUERY, user_id, f"user-{user_id}@temp.com",
+            document_id, storage_filename, file.filename,
+            file.content_type, file_size, "PROCESSING", content_hasher.hexdigest()
+        )
+        logger.info("📝 UPLOAD_DB: Document %s PROCESSING", document_id)
+
+        # Queue background processing (without Celery)
         try:
-            # Start background processing task
-            asyncio.create_task(process_document_background(document_id, user_id, storage_filename))
-            print(f"✅ UPLOAD: Background processing started successfully for document {document_id}")
-        except Exception as bg_error:
-            print(f"❌ UPLOAD: Background processing could not be started: {bg_error}")
+            document_queue.submit(document_id, user_id, storage_filename)
+        except QueueFullError as bg_error:
+            logger.error(f"❌ UPLOAD: Background processing could not be queued: {bg_error}")
+            await db_manager.execute(MARK_DOCUMENT_FAILED_QUERY, "FAILED", str(bg_error), document_id)
+            raise _processing_busy_error()
 
         return UploadResponse(
             success=True,
@@ -313,18 +553,7 @@ async def get_current_document(
     Returns 404 if no document exists.
     """
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            document = await conn.fetchrow("""
-                SELECT
-                    id, filename, "originalName", "mimeType", size, status,
-                    "uploadedAt", "processedAt", "errorMessage"
-                FROM documents
-                WHERE "userId" = $1
-                ORDER BY "uploadedAt" DESC
-                LIMIT 1
-            """, user_id)
+        document = await db_manager.fetchrow(CURRENT_DOCUMENT_QUERY, user_id)
 
         if not document:
             raise HTTPException(
@@ -332,17 +561,7 @@ async def get_current_document(
                 detail="No document found for user"
             )
 
-        return DocumentResponse(
-            id=document["id"],
-            filename=document["filename"],
-            original_name=document["originalName"],
-            mime_type=document["mimeType"],
-            size=document["size"],
-            status=document["status"],
-            uploaded_at=document["uploadedAt"].isoformat(),
-            processed_at=document["processedAt"].isoformat() if document["processedAt"] else None,
-            error_message=document["errorMessage"]
-        )
+        return dict(document)
 
     except HTTPException:
         raise
@@ -366,44 +585,23 @@ async def list_documents(
     - **offset**: Number of documents to skip (default: 0)
     """
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            # Get documents with count
-            documents = await conn.fetch("""
-                SELECT
-                    id, filename, "originalName", "mimeType", size, status,
-                    "uploadedAt", "processedAt", "errorMessage"
-                FROM documents
-                WHERE "userId" = $1
-                ORDER BY "uploadedAt" DESC
-                LIMIT $2 OFFSET $3
-            """, user_id, limit, offset)
-
-            # Get total count
-            total = await conn.fetchval("""
-                SELECT COUNT(*) FROM documents WHERE "userId" = $1
-            """, user_id)
-
-        document_list = [
-            DocumentResponse(
-                id=doc["id"],
-                filename=doc["filename"],
-                original_name=doc["originalName"],
-                mime_type=doc["mimeType"],
-                size=doc["size"],
-                status=doc["status"],
-                uploaded_at=doc["uploadedAt"].isoformat(),
-                processed_at=doc["processedAt"].isoformat() if doc["processedAt"] else None,
-                error_message=doc["errorMessage"]
-            )
-            for doc in documents
-        ]
-
-        return DocumentListResponse(
-            documents=document_list,
-            total=total or 0
-        )
+        # Get documents and the total count in one round trip
+        documents = await db_manager.fetch(LIST_DOCUMENTS_QUERY, user_id, limit, offset)
+
+        if documents:
+            total = documents[0]["total"]
+        elif offset > 0:
+            # Paged past the end - no row to carry the window count
+            total = await db_manager.fetchval(COUNT_DOCUMENTS_QUERY, user_id)
+        else:
+            total = 0
+
+        # Plain dicts: the response_model validates and serializes them once,
+        # instead of building models that FastAPI would dump and revalidate
+        return {
+            "documents": [dict(doc) for doc in documents],
+            "total": total or 0
+        }
 
     except Exception as e:
         raise HTTPException(
@@ -423,16 +621,7 @@ async def get_document(
     - **document_id**: Unique document identifier
     """
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            document = await conn.fetchrow("""
-                SELECT
-                    id, filename, "originalName", "mimeType", size, status,
-                    "uploadedAt", "processedAt", "errorMessage"
-                FROM documents
-                WHERE id = $1 AND "userId" = $2
-            """, document_id, user_id)
+        document = await db_manager.fetchrow(GET_DOCUMENT_QUERY, document_id, user_id)
 
         if not document:
             raise HTTPException(
@@ -440,17 +629,7 @@ async def get_document(
                 detail="Document not found"
             )
 
-        return DocumentResponse(
-            id=document["id"],
-            filename=document["filename"],
-            original_name=document["originalName"],
-            mime_type=document["mimeType"],
-            size=document["size"],
-            status=document["status"],
-            uploaded_at=document["uploadedAt"].isoformat(),
-            processed_at=document["processedAt"].isoformat() if document["processedAt"] else None,
-            error_message=document["errorMessage"]
-        )
+        return dict(document)
 
     except HTTPException:
         raise
@@ -472,14 +651,7 @@ async def get_document_status(
     - **document_id**: Unique document identifier
     """
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            document = await conn.fetchrow("""
-                SELECT status, "errorMessage"
-                FROM documents
-                WHERE id = $1 AND "userId" = $2
-            """, document_id, user_id)
+        document = await db_manager.fetchrow(DOCUMENT_STATUS_QUERY, document_id, user_id)
 
         if not document:
             raise HTTPException(
@@ -524,55 +696,36 @@ async def delete_document(
     - **document_id**: Unique document identifier
     """
     try:
-        from app.core.database import db_manager
-        from app.services.vector_search import delete_document_embeddings
-
-        async with db_manager.get_connection() as conn:
-            # Get document info
-            document = await conn.fetchrow("""
-                SELECT filename FROM documents
-                WHERE id = $1 AND "userId" = $2
-            """, document_id, user_id)
-
-            if not document:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Document not found"
-                )
-
-            # Delete document embeddings first (maintain referential integrity)
-            try:
-                await delete_document_embeddings(document_id)
-                print(f"✅ Deleted embeddings for document {document_id}")
-            except Exception as e:
-                print(f"Warning: Failed to delete embeddings: {e}")
-                # Continue with document deletion even if embedding cleanup fails
-
-            # Clean up chat sessions that reference this document
-            try:
-                from app.services.chat_service import delete_chat_sessions_for_document
-                await delete_chat_sessions_for_document(document_id, user_id)
-                print(f"✅ Cleaned up chat sessions for document {document_id}")
-            except Exception as e:
-                print(f"Warning: Failed to clean up chat sessions: {e}")
-                # Continue with document deletion even if chat cleanup fails
-
-            # Delete from Supabase Storage
-            try:
-                await supabase_client.delete_file(
-                    bucket=DOCUMENTS_BUCKET,
-                    file_path=document["filename"]
-                )
-                print(f"✅ Deleted file from storage: {document['filename']}")
-            except Exception as e:
-                print(f"Warning: Failed to delete file from storage: {e}")
-
-            # Delete from database (this will cascade to any other related tables)
-            await conn.execute("""
-                DELETE FROM documents WHERE id = $1 AND "userId" = $2
-            """, document_id, user_id)
-
-            print(f"✅ Deleted document {document_id} from database")
+        # Get document info
+        storage_filename = await db_manager.fetchval(DOCUMENT_FILENAME_QUERY, document_id, user_id)
+
+        if storage_filename is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Document not found"
+            )
+
+        # Embeddings, chat sessions and the stored file are independent, so clean
+        # them up concurrently; failures are logged and don't block the deletion
+        cleanup_steps = {
+            "embeddings": delete_document_embeddings(document_id),
+            "chat sessions": delete_chat_sessions_for_document(document_id, user_id),
+            "storage file": supabase_client.delete_file(
+                bucket=DOCUMENTS_BUCKET,
+                file_path=storage_filename
+            ),
+        }
+        results = await asyncio.gather(*cleanup_steps.values(), return_exceptions=True)
+        for step, result in zip(cleanup_steps, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Failed to clean up {step} for document {document_id}: {result}")
+            else:
+                logger.debug("✅ Cleaned up %s for document %s", step, document_id)
+
+        # Delete from database (this will cascade to any other related tables)
+        await db_manager.execute(DELETE_DOCUMENT_QUERY, document_id, user_id)
+
+        logger.info(f"✅ Deleted document {document_id}")
 
         return {"success": True, "message": "Document and all associated data deleted successfully"}
 
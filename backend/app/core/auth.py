@@ -1,15 +1,131 @@
 """
 Authentication utilities for Supabase JWT token validation.
 """
-from typing import Optional
+from typing import Optional, Tuple
+import base64
+import binascii
+import hashlib
+import hmac
+import time
 import jwt
+import orjson
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from app.core.cache import TTLCache
 from app.core.config import settings
 
 
 security = HTTPBearer()
 
+# Clients send the same bearer token on every request until it is refreshed,
+# so decoded payloads and the user dicts built from them are cached briefly.
+TOKEN_CACHE_TTL = 60  # seconds
+_token_payload_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+_current_user_cache = TTLCache(maxsize=4096, ttl=TOKEN_CACHE_TTL)
+
+# HS256 signing key for strict verification, encoded once instead of per request.
+# This would be the Supabase JWT secret, not the anon key.
+_STRICT_HMAC_KEY = settings.supabase_key.encode()
+
+
+def _load_rsa_public_key(pem: Optional[str]):
+    """Load the RS256 verification key once, so PyJWT gets a ready key object."""
+    if not pem:
+        return None
+    from cryptography.hazmat.primitives import serialization
+    return serialization.load_pem_public_key(pem.encode())
+
+
+_PREPARED_RSA_PUBKEY = _load_rsa_public_key(settings.supabase_jwt_public_key)
+
+
+def _token_cache_key(token: str) -> bytes:
+    """Short digest of the token so cached entries don't hold raw credentials."""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _token_cache_ttl(payload: dict) -> Optional[float]:
+    """Seconds a payload may be cached: never past the token's own expiry."""
+    exp = payload.get("exp")
+    if exp is None:
+        return TOKEN_CACHE_TTL
+    if not isinstance(exp, (int, float)):
+        # Raised inside verify_supabase_token, so the client gets a 401
+        raise jwt.DecodeError("Expiration Time claim (exp) must be a number")
+    remaining = exp - time.time()
+    if remaining <= 0:
+        return None
+    return min(TOKEN_CACHE_TTL, remaining)
+
+
+def _fast_segments(token: str) -> Tuple[str, str, str]:
+    """Split a compact JWT into header, payload and signature segments in one scan."""
+    first = token.find(".")
+    second = token.find(".", first + 1) if first != -1 else -1
+    if second == -1 or token.find(".", second + 1) != -1:
+        raise jwt.DecodeError("Not enough segments")
+    return token[:first], token[first + 1:second], token[second + 1:]
+
+
+def _b64url_decode(segment: str) -> bytes:
+    """Decode an unpadded base64url JWT segment."""
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _decode_json_segment(segment: str, name: str) -> dict:
+    """Decode a base64url JSON object segment (header or payload)."""
+    try:
+        value = orjson.loads(_b64url_decode(segment))
+    except (binascii.Error, ValueError) as e:
+        raise jwt.DecodeError(f"Invalid {name} segment: {e}")
+
+    if not isinstance(value, dict):
+        raise jwt.DecodeError(f"Invalid {name}: must be a JSON object")
+    return value
+
+
+def _decode_unverified_payload(token: str) -> dict:
+    """Decode the payload segment without signature checks (development mode)."""
+    _, payload_b64, _ = _fast_segments(token)
+    return _decode_json_segment(payload_b64, "payload")
+
+
+def _verify_hs256(signing_input: bytes, signature: bytes, key: bytes) -> bool:
+    """Constant-time HS256 signature check using the stdlib (OpenSSL) HMAC."""
+    return hmac.compare_digest(hmac.new(key, signing_input, hashlib.sha256).digest(), signature)
+
+
+def _validate_claims(payload: dict, audience: str, issuer: str):
+    """Apply the registered-claim checks jwt.decode performs for the strict path."""
+    now = time.time()
+
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)):
+            raise jwt.DecodeError("Expiration Time claim (exp) must be a number")
+        if exp <= now:
+            raise jwt.ExpiredSignatureError("Signature has expired")
+
+    nbf = payload.get("nbf")
+    if nbf is not None:
+        if not isinstance(nbf, (int, float)):
+            raise jwt.DecodeError("Not Before claim (nbf) must be a number")
+        if nbf > now:
+            raise jwt.ImmatureSignatureError("The token is not yet valid (nbf)")
+
+    if "aud" not in payload:
+        raise jwt.MissingRequiredClaimError("aud")
+    token_audience = payload["aud"]
+    if isinstance(token_audience, str):
+        token_audience = [token_audience]
+    if not isinstance(token_audience, list) or audience not in token_audience:
+        raise jwt.InvalidAudienceError("Audience doesn't match")
+
+    if "iss" not in payload:
+        raise jwt.MissingRequiredClaimError("iss")
+    if payload["iss"] != issuer:
+        raise jwt.InvalidIssuerError("Invalid issuer")
+
 
 class AuthError(HTTPException):
     """Authentication error exception."""
@@ -35,15 +151,17 @@ def verify_supabase_token(token: str) -> dict:
     Raises:
         AuthError: If token is invalid or expired
     """
+    key = _token_cache_key(token)
+    cached = _token_payload_cache.get(key)
+    if cached is not None:
+        return cached
+
     try:
         # For Supabase tokens, we need to verify with the JWT secret
         # In production, you should verify the signature with Supabase's public key
-        # For now, we'll decode without verification for development
-        payload = jwt.decode(
-            token,
-            options={"verify_signature": False},  # Disable signature verification for development
-            algorithms=["HS256", "RS256"]
-        )
+        # For now, we'll decode without verification for development, which
+        # only needs the payload segment - see verify_supabase_token_strict
+        payload = _decode_unverified_payload(token)
 
         # Check if token has required fields
         if "sub" not in payload:
@@ -52,6 +170,10 @@ def verify_supabase_token(token: str) -> dict:
         if "email" not in payload:
             raise AuthError("Invalid token: missing email")
 
+        ttl = _token_cache_ttl(payload)
+        if ttl is not None:
+            _token_payload_cache.set(key, payload, ttl=ttl)
+
         return payload
 
     except jwt.InvalidTokenError as e:
@@ -78,9 +200,17 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     if not token:
         raise AuthError("Missing bearer token")
 
+    key = _token_cache_key(token)
+    current_user = _current_user_cache.get(key)
+    if current_user is not None:
+        return current_user
+
+    # Decoding runs inline on the event loop with no await before the cache is
+    # filled, so a burst of requests carrying the same new token is already
+    # coalesced: the first one populates the cache and the rest hit it.
     user_data = verify_supabase_token(token)
 
-    return {
+    current_user = {
         "id": user_data["sub"],
         "email": user_data["email"],
         "role": user_data.get("role", "authenticated"),
@@ -88,6 +218,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         "user_metadata": user_data.get("user_metadata", {}),
     }
 
+    ttl = _token_cache_ttl(user_data)
+    if ttl is not None:
+        _current_user_cache.set(key, current_user, ttl=ttl)
+
+    return current_user
+
 
 async def get_current_user_id(current_user: dict = Depends(get_current_user)) -> str:
     """
@@ -111,16 +247,34 @@ def verify_supabase_token_strict(token: str) -> dict:
     try:
         # In production, use the actual Supabase JWT secret
         # You can get this from your Supabase project settings
-        # For now, we'll use a placeholder
-        secret = settings.supabase_key  # This would be the JWT secret, not the anon key
-
-        payload = jwt.decode(
-            token,
-            secret,
-            algorithms=["HS256"],
-            audience="authenticated",
-            issuer="supabase"
-        )
+        # For now, we'll use a placeholder (see _STRICT_HMAC_KEY)
+        header_b64, payload_b64, signature_b64 = _fast_segments(token)
+
+        header = _decode_json_segment(header_b64, "header")
+        alg = header.get("alg")
+        if alg == "RS256" and _PREPARED_RSA_PUBKEY is not None:
+            # PyJWT uses an already-loaded key object as-is
+            return jwt.decode(
+                token,
+                _PREPARED_RSA_PUBKEY,
+                algorithms=["RS256"],
+                audience="authenticated",
+                issuer="supabase"
+            )
+        if alg != "HS256":
+            raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+
+        try:
+            signature = _b64url_decode(signature_b64)
+        except (binascii.Error, ValueError):
+            raise jwt.DecodeError("Invalid crypto padding")
+
+        signing_input = token[:len(header_b64) + 1 + len(payload_b64)].encode()
+        if not _verify_hs256(signing_input, signature, _STRICT_HMAC_KEY):
+            raise jwt.InvalidSignatureError("Signature verification failed")
+
+        payload = _decode_json_segment(payload_b64, "payload")
+        _validate_claims(payload, audience="authenticated", issuer="supabase")
 
         return payload
 
@@ -3,7 +3,7 @@ Configuration settings for the RAG application.
 Handles environment variables and application settings.
 """
 import os
-from functools import lru_cache
+from functools import cached_property, lru_cache
 from typing import Optional
 from pydantic import Field
 from pydantic_settings import BaseSettings
@@ -15,9 +15,13 @@ class Settings(BaseSettings):
     # Application
     app_name: str = "AI Knowledge Assistant API"
     debug: bool = False
+    log_level: str = "INFO"  # DEBUG enables per-step pipeline logging
+    web_workers: int = 1  # uvicorn worker processes; ignored when debug reload is on
 
     # Database
     database_url: str = Field(alias="DATABASE_URL")
+    db_pool_min: int = 10
+    db_pool_max: int = 50
 
     AZURE_OPENAI_API_KEY: str
     AZURE_OPENAI_ENDPOINT: str
@@ -28,9 +32,12 @@ class Settings(BaseSettings):
     supabase_url: str = Field(alias="NEXT_PUBLIC_SUPABASE_URL")
     supabase_key: str = Field(alias="NEXT_PUBLIC_SUPABASE_ANON_KEY")
     supabase_service_key: Optional[str] = Field(default=None, alias="SUPABASE_SERVICE_KEY")
+    # PEM public key for RS256-signed tokens (optional, strict verification only)
+    supabase_jwt_public_key: Optional[str] = Field(default=None, alias="SUPABASE_JWT_PUBLIC_KEY")
 
-    # Redis (removed - no longer using Celery)
-    # redis_url: str = "redis://localhost:6379/0"
+    # Redis (optional) - only used for the chat response cache
+    redis_url: Optional[str] = Field(default=None, alias="REDIS_URL")
+    response_cache_ttl: int = 3600  # seconds
 
     # AI Models
     embedding_model: str = "sentence-transformers/paraphrase-MiniLM-L3-v2"
@@ -38,13 +45,15 @@ class Settings(BaseSettings):
     max_tokens: int = 512
 
     # Vector Search
-    similarity_threshold: float = 0.01  # Lowered for TF-IDF embeddings which have lower similarity scores
+    similarity_threshold: float = 0.01  # Lowered for bag-of-words embeddings which have lower similarity scores
     max_chunks: int = 5
 
     # Document Processing
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     chunk_size: int = 1000
     chunk_overlap: int = 100
+    processing_queue_size: int = 256
+    processing_workers: Optional[int] = None  # Defaults to min(cpu_count, 4)
 
     # Security
     secret_key: str = "your-super-secret-key-change-in-production"
@@ -55,9 +64,17 @@ class Settings(BaseSettings):
         "env_file": ".env",
         "case_sensitive": False,
         "extra": "ignore",
-        "populate_by_name": True
+        "populate_by_name": True,
+        # Settings never change at runtime
+        "frozen": True,
+        "validate_assignment": False
     }
 
+    @cached_property
+    def supabase_url_normalized(self) -> str:
+        """Supabase URL with exactly one trailing slash."""
+        return self.supabase_url.rstrip('/') + '/'
+
 
 @lru_cache()
 def get_settings() -> Settings:
@@ -3,43 +3,260 @@ Database configuration and utilities.
 Handles Prisma client connection and database operations.
 """
 import asyncio
-from typing import Optional
-from contextlib import asynccontextmanager
+from typing import List, NamedTuple, Optional
 
 import asyncpg
+import numpy as np
+import orjson
+from pgvector.asyncpg import register_vector
 from app.core.config import settings
 
 
+# HNSW graph parameters for the embedding index and the query-time candidate list
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 100
+SET_HNSW_EF_SEARCH = f"SET LOCAL hnsw.ef_search = {HNSW_EF_SEARCH}"
+
+# Approximate neighbours fetched from the index per requested result, then
+# reranked by exact cosine similarity; with limit=5 this matches ef_search
+RERANK_CANDIDATES = 20
+
+# Constant SQL so asyncpg's per-connection statement cache reuses the plan.
+# {order} is the distance the HNSW index is built on (see _vector_order); the
+# candidates it returns are reranked on full-precision similarity.
+_VECTOR_SEARCH_SELECT = """
+    SELECT
+        de."chunkId" as id,
+        de.content,
+        de."pageNumber",
+        de."chunkIndex",
+        de."documentId",
+        d."originalName" as document_name,
+        1 - (de."embeddingVec" <=> $1::vector) as similarity
+    FROM document_embeddings de
+    JOIN documents d ON de."documentId" = d.id
+    WHERE de."embeddingVec" IS NOT NULL
+"""
+
+VECTOR_SEARCH_ALL_QUERY = "SELECT * FROM (" + _VECTOR_SEARCH_SELECT + f"""
+    ORDER BY {{order}}
+    LIMIT $3 * {RERANK_CANDIDATES}
+) candidate
+WHERE similarity >= $2
+ORDER BY similarity DESC
+LIMIT $3
+"""
+
+# Document-filtered searches rank by exact similarity instead: the HNSW scan
+# applies the filter after its ef_search candidates, so a small document can
+# come back short or empty. Ordering on the similarity expression keeps the
+# planner off the index and on the documentId btree.
+VECTOR_SEARCH_DOCUMENT_QUERY = _VECTOR_SEARCH_SELECT + """
+      AND de."documentId" = ANY($2::text[])
+      AND 1 - (de."embeddingVec" <=> $1::vector) >= $3
+    ORDER BY similarity DESC
+    LIMIT $4
+"""
+
+_VECTOR_SEARCH_BATCH_SELECT = """
+            SELECT
+                de."chunkId" as id,
+                de.content,
+                de."pageNumber",
+                de."chunkIndex",
+                de."documentId",
+                d."originalName" as document_name,
+                1 - (de."embeddingVec" <=> q.emb) as similarity
+            FROM document_embeddings de
+            JOIN documents d ON de."documentId" = d.id
+            WHERE de."embeddingVec" IS NOT NULL
+"""
+
+# Top-k per query embedding in one round trip: $1 query positions, $2 embeddings,
+# $3 per-query limit, $4 similarity threshold
+VECTOR_SEARCH_BATCH_QUERY = """
+    WITH q AS (
+        SELECT * FROM unnest($1::int[], $2::vector[]) AS q(qid, emb)
+    )
+    SELECT q.qid, hit.*
+    FROM q
+    CROSS JOIN LATERAL (
+        SELECT * FROM (""" + _VECTOR_SEARCH_BATCH_SELECT + f"""
+            ORDER BY {{batch_order}}
+            LIMIT $3 * {RERANK_CANDIDATES}
+        ) candidate
+        ORDER BY similarity DESC
+        LIMIT $3
+    ) hit
+    WHERE hit.similarity >= $4
+    ORDER BY q.qid, hit.similarity DESC
+"""
+
+# As above restricted to $5 document IDs, ranked exactly like
+# VECTOR_SEARCH_DOCUMENT_QUERY
+VECTOR_SEARCH_BATCH_DOCUMENT_QUERY = """
+    WITH q AS (
+        SELECT * FROM unnest($1::int[], $2::vector[]) AS q(qid, emb)
+    )
+    SELECT q.qid, hit.*
+    FROM q
+    CROSS JOIN LATERAL (""" + _VECTOR_SEARCH_BATCH_SELECT + """
+              AND de."documentId" = ANY($5::text[])
+            ORDER BY similarity DESC
+            LIMIT $3
+    ) hit
+    WHERE hit.similarity >= $4
+    ORDER BY q.qid, hit.similarity DESC
+"""
+
+
+def _vector_order(operand: str, half_dimensions: Optional[int] = None) -> str:
+    """Distance expression for ORDER BY, cast to halfvec when the index is fp16."""
+    if half_dimensions is None:
+        return f'de."embeddingVec" <=> {operand}'
+    return f'de."embeddingVec"::halfvec({half_dimensions}) <=> {operand}::halfvec({half_dimensions})'
+
+
+class VSRow(NamedTuple):
+    """A vector similarity search hit, in VECTOR_SEARCH_*_QUERY column order."""
+    id: str
+    content: str
+    page_number: Optional[int]
+    chunk_index: int
+    document_id: str
+    document_name: str
+    similarity: float
+
+
+# Schema holding pgvector's vector type, if the extension is installed
+VECTOR_SCHEMA_QUERY = """
+SELECT n.nspname FROM pg_type t
+JOIN pg_namespace n ON n.oid = t.typnamespace
+WHERE t.typname = 'vector'
+LIMIT 1
+"""
+
+
+class _ConnectionContext:
+    """Acquire/release a pooled connection without a generator-based context manager."""
+
+    __slots__ = ("manager", "pool", "conn")
+
+    def __init__(self, manager: "DatabaseManager"):
+        self.manager = manager
+        self.pool: Optional[asyncpg.Pool] = None
+        self.conn: Optional[asyncpg.Connection] = None
+
+    async def __aenter__(self) -> asyncpg.Connection:
+        self.pool = await self.manager._get_pool()
+        self.conn = await self.pool.acquire()
+        return self.conn
+
+    async def __aexit__(self, *exc_info):
+        await self.pool.release(self.conn)
+
+
 class DatabaseManager:
     """Manages database connections and operations."""
 
     def __init__(self):
         self.pool: Optional[asyncpg.Pool] = None
+        # Set once the vector column and its HNSW index exist
+        self.vector_enabled = False
+        # "halfvec" or "vector": the precision the HNSW index is built on
+        self.vector_index: Optional[str] = None
+        self._set_vector_queries()
+        # Serializes pool creation so concurrent lazy connects share one pool
+        self._lock = asyncio.Lock()
+
+    def use_vector_index(self, index_type: Optional[str], dimensions: int):
+        """Enable vector search against an existing index of the given precision."""
+        self.vector_index = index_type
+        self.vector_enabled = index_type is not None
+        self._set_vector_queries(dimensions if index_type == "halfvec" else None)
+
+    def _set_vector_queries(self, half_dimensions: Optional[int] = None):
+        """Build the vector search SQL for the distance the HNSW index uses."""
+        order = _vector_order("$1::vector", half_dimensions)
+        self._search_all_query = VECTOR_SEARCH_ALL_QUERY.format(order=order)
+        self._search_batch_query = VECTOR_SEARCH_BATCH_QUERY.format(
+            batch_order=_vector_order("q.emb", half_dimensions)
+        )
 
     async def connect(self):
         """Create database connection pool."""
-        if not self.pool:
-            self.pool = await asyncpg.create_pool(
-                settings.database_url,
-                min_size=1,
-                max_size=10,
-                command_timeout=60,
+        if self.pool:
+            return
+
+        async with self._lock:
+            if not self.pool:
+                self.pool = await asyncpg.create_pool(
+                    settings.database_url,
+                    min_size=settings.db_pool_min,
+                    max_size=settings.db_pool_max,
+                    max_inactive_connection_lifetime=300,
+                    statement_cache_size=1024,
+                    command_timeout=60,
+                    init=self._init_connection,
+                )
+
+    @staticmethod
+    async def _init_connection(conn: asyncpg.Connection):
+        """Register type codecs on every new connection."""
+        # json/jsonb come back decoded instead of as text
+        for json_type in ("json", "jsonb"):
+            await conn.set_type_codec(
+                json_type,
+                encoder=lambda value: orjson.dumps(value).decode(),
+                decoder=orjson.loads,
+                schema="pg_catalog"
             )
 
+        # Bind numpy arrays to pgvector's binary format. The extension isn't
+        # always in public (Supabase installs it into "extensions"), and the
+        # type doesn't exist at all until enable_pgvector_extension runs.
+        vector_schema = await conn.fetchval(VECTOR_SCHEMA_QUERY)
+        if vector_schema is not None:
+            await register_vector(conn, schema=vector_schema)
+
     async def disconnect(self):
         """Close database connection pool."""
         if self.pool:
             await self.pool.close()
             self.pool = None
 
-    @asynccontextmanager
-    async def get_connection(self):
+    def get_connection(self) -> _ConnectionContext:
         """Get database connection from pool."""
+        # The pool is created in the app lifespan; connecting on enter is only
+        # a fallback for when the database was unreachable at startup
+        return _ConnectionContext(self)
+
+    async def _get_pool(self) -> asyncpg.Pool:
+        """Return the connection pool, creating it on first use."""
         if not self.pool:
             await self.connect()
+        return self.pool
+
+    async def fetch(self, query: str, *args):
+        """Run a query on a pooled connection and return all rows."""
+        pool = await self._get_pool()
+        return await pool.fetch(query, *args)
+
+    async def fetchrow(self, query: str, *args):
+        """Run a query on a pooled connection and return the first row."""
+        pool = await self._get_pool()
+        return await pool.fetchrow(query, *args)
 
-        async with self.pool.acquire() as connection:
-            yield connection
+    async def fetchval(self, query: str, *args):
+        """Run a query on a pooled connection and return a single value."""
+        pool = await self._get_pool()
+        return await pool.fetchval(query, *args)
+
+    async def execute(self, query: str, *args) -> str:
+        """Execute a statement on a pooled connection and return its status."""
+        pool = await self._get_pool()
+        return await pool.execute(query, *args)
 
     async def execute_raw_query(self, query: str, *args):
         """Execute raw SQL query."""
@@ -48,53 +265,75 @@ class DatabaseManager:
 
     async def vector_similarity_search(
         self,
-        embedding: list[float],
-        document_id: Optional[str] = None,
+        embedding: np.ndarray,
+        document_ids: Optional[List[str]] = None,
         limit: int = 5,
         threshold: float = 0.7
-    ):
+    ) -> List[VSRow]:
         """
         Perform vector similarity search using our actual document_embeddings table.
 
         Args:
-            embedding: Query embedding vector
-            document_id: Optional document ID to restrict search
+            embedding: Query embedding vector (float32 array)
+            document_ids: Optional document IDs to restrict search
             limit: Maximum number of results
             threshold: Minimum similarity threshold
 
         Returns:
             List of matching chunks with similarity scores
         """
-        query = """
-            SELECT
-                de."chunkId" as id,
-                de.content,
-                de."pageNumber",
-                de."chunkIndex",
-                d."originalName" as document_name,
-                1 - (de.embedding <=> $1::vector) as similarity
-            FROM document_embeddings de
-            JOIN documents d ON de."documentId" = d.id
-            WHERE de.embedding IS NOT NULL
-        """
+        if document_ids:
+            query, args = VECTOR_SEARCH_DOCUMENT_QUERY, (embedding, document_ids, threshold, limit)
+        else:
+            query, args = self._search_all_query, (embedding, threshold, limit)
+
+        async with self.get_connection() as conn:
+            # SET LOCAL only lasts for the transaction, so the pooled connection
+            # goes back with default settings
+            async with conn.transaction():
+                await conn.execute(SET_HNSW_EF_SEARCH)
+                rows = await conn.fetch(query, *args)
+
+        return [VSRow(*row) for row in rows]
 
-        params = [embedding]
-        param_index = 2
+    async def vector_similarity_search_batch(
+        self,
+        embeddings: List[np.ndarray],
+        document_ids: Optional[List[str]] = None,
+        limit: int = 5,
+        threshold: float = 0.7
+    ) -> List[List[VSRow]]:
+        """
+        Run several vector similarity searches in a single query.
 
-        if document_id:
-            query += f' AND de."documentId" = ${param_index}'
-            params.append(document_id)
-            param_index += 1
+        Args:
+            embeddings: Query embedding vectors (float32 arrays)
+            document_ids: Optional document IDs to restrict search
+            limit: Maximum number of results per embedding
+            threshold: Minimum similarity threshold
 
-        query += f"""
-            AND 1 - (de.embedding <=> $1::vector) >= ${param_index}
-            ORDER BY de.embedding <=> $1::vector
-            LIMIT ${param_index + 1}
+        Returns:
+            One list of matching chunks per embedding, in input order
         """
-        params.extend([threshold, limit])
+        results: List[List[VSRow]] = [[] for _ in embeddings]
+        if not embeddings:
+            return results
+
+        args = [list(range(len(embeddings))), embeddings, limit, threshold]
+        if document_ids:
+            query = VECTOR_SEARCH_BATCH_DOCUMENT_QUERY
+            args.append(document_ids)
+        else:
+            query = self._search_batch_query
 
         async with self.get_connection() as conn:
-            return await conn.fetch(query, *params)
+            async with conn.transaction():
+                await conn.execute(SET_HNSW_EF_SEARCH)
+                rows = await conn.fetch(query, *args)
+
+        for row in rows:
+            results[row["qid"]].append(VSRow(*tuple(row)[1:]))
+        return results
 
     async def enable_pgvector_extension(self):
         """Enable pgvector extension in the database."""
@@ -102,16 +341,45 @@ class DatabaseManager:
         async with self.get_connection() as conn:
             await conn.execute(query)
 
-    async def create_vector_index(self):
-        """Create vector similarity index for better performance."""
-        query = """
-            CREATE INDEX IF NOT EXISTS idx_document_embeddings_embedding
+        # Connections opened before the type existed have no vector codec;
+        # replace them so _init_connection registers it
+        await self.pool.expire_connections()
+
+    async def create_vector_index(self, dimensions: int):
+        """
+        Add the pgvector embedding column and its HNSW cosine index.
+
+        The graph is built over a half-precision cast of the column, halving
+        the index memory that has to stay resident; the column itself keeps
+        full precision. pgvector releases without halfvec (before 0.7) get a
+        full-precision index instead.
+        """
+        column_query = f"""
+            ALTER TABLE document_embeddings
+            ADD COLUMN IF NOT EXISTS "embeddingVec" vector({dimensions});
+            DROP INDEX IF EXISTS idx_document_embeddings_embedding;
+        """
+        half_index_query = f"""
+            CREATE INDEX IF NOT EXISTS idx_document_embeddings_embedding_hnsw_half
+            ON document_embeddings
+            USING hnsw (("embeddingVec"::halfvec({dimensions})) halfvec_cosine_ops)
+            WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
+            DROP INDEX IF EXISTS idx_document_embeddings_embedding_hnsw;
+        """
+        index_query = f"""
+            CREATE INDEX IF NOT EXISTS idx_document_embeddings_embedding_hnsw
             ON document_embeddings
-            USING ivfflat (embedding vector_cosine_ops)
-            WITH (lists = 100);
+            USING hnsw ("embeddingVec" vector_cosine_ops)
+            WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
         """
         async with self.get_connection() as conn:
-            await conn.execute(query)
+            await conn.execute(column_query)
+            try:
+                await conn.execute(half_index_query)
+                self.use_vector_index("halfvec", dimensions)
+            except asyncpg.UndefinedObjectError:
+                await conn.execute(index_query)
+                self.use_vector_index("vector", dimensions)
 
 
 # Global database manager instance
@@ -0,0 +1,28 @@
+"""
+Identifier generation.
+Time-ordered UUIDs keep primary-key inserts at the right edge of the B-tree index.
+"""
+import os
+import time
+import uuid
+
+
+def _uuid7() -> uuid.UUID:
+    """RFC 9562 UUIDv7: 48-bit millisecond timestamp followed by random bits."""
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                            # version
+    value |= ((rand >> 62) & 0xFFF) << 64         # rand_a
+    value |= 0b10 << 62                           # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF         # rand_b
+    return uuid.UUID(int=value)
+
+
+# Python 3.14+ ships uuid7 in the standard library
+uuid7 = getattr(uuid, "uuid7", _uuid7)
+
+
+def new_id() -> str:
+    """Return a new time-ordered UUID string for a primary key."""
+    return str(uuid7())
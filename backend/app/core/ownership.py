@@ -0,0 +1,64 @@
+"""
+Ownership checks for user-scoped resources.
+Caches positive chat-session ownership lookups so hot endpoints skip the authz query.
+"""
+from typing import Optional
+from fastapi import HTTPException, status
+
+from app.core.cache import TTLCache
+from app.core.database import db_manager
+
+
+CHAT_SESSION_DOCUMENT_QUERY = """
+    SELECT "documentIds"[1] AS document_id FROM chat_sessions
+    WHERE id = $1 AND "userId" = $2
+"""
+
+_MISSING = object()
+
+# (user_id, chat_id) -> first document ID of the session. Only sessions that
+# exist are cached, so a newly created session is never reported missing.
+_chat_owner_cache = TTLCache(maxsize=10_000, ttl=60)
+
+
+async def assert_owns_chat(chat_id: str, user_id: str) -> Optional[str]:
+    """
+    Verify the user owns the chat session.
+
+    Args:
+        chat_id: Chat session ID
+        user_id: Current user ID
+
+    Returns:
+        The session's first document ID, or None if it has no document
+
+    Raises:
+        HTTPException: 404 if the session doesn't exist or belongs to another user
+    """
+    key = (user_id, chat_id)
+    cached = _chat_owner_cache.get(key, _MISSING)
+    if cached is not _MISSING:
+        return cached
+
+    # Postgres arrays are 1-indexed and an empty array yields NULL here
+    chat_info = await db_manager.fetchrow(CHAT_SESSION_DOCUMENT_QUERY, chat_id, user_id)
+    if not chat_info:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Chat session not found"
+        )
+
+    document_id = chat_info["document_id"]
+    _chat_owner_cache.set(key, document_id)
+    return document_id
+
+
+def invalidate_chat_ownership(chat_id: str, user_id: str):
+    """Forget the cached ownership of a single chat session."""
+    _chat_owner_cache.pop((user_id, chat_id))
+
+
+def invalidate_user_chat_ownership(user_id: str):
+    """Forget all cached chat ownership for a user (e.g. after a document delete)."""
+    _chat_owner_cache.discard_where(lambda key: key[0] == user_id)
+
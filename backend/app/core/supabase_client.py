@@ -1,79 +1,135 @@
 """
 Supabase client configuration for file storage and services.
 """
-from typing import Optional, BinaryIO
+from typing import Optional, BinaryIO, AsyncIterable, Union
 import aiofiles
 import httpx
+import orjson
 from supabase import create_client, Client
 from app.core.config import settings
 
 
+# Settings read once at import; every storage call uses these
+_SUPABASE_URL = settings.supabase_url_normalized
+_SUPABASE_ANON_KEY = settings.supabase_key
+_SUPABASE_SERVICE_KEY = settings.supabase_service_key or None
+
+
 class SupabaseManager:
     """Manages Supabase client and storage operations."""
 
     def __init__(self):
-        self.client: Optional[Client] = None
-        self._init_client()
+        self._client: Optional[Client] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        # Use service role key for uploads (has full permissions) when configured
+        if _SUPABASE_SERVICE_KEY and _SUPABASE_SERVICE_KEY != "PUT_YOUR_SERVICE_ROLE_KEY_HERE":
+            self._upload_key = _SUPABASE_SERVICE_KEY
+        else:
+            self._upload_key = _SUPABASE_ANON_KEY
+        self._storage_url = f"{_SUPABASE_URL}storage/v1"
+        # Auth headers are fixed for the process, so build them once
+        self._upload_headers = self._auth_headers(self._upload_key)
+        self._anon_headers = self._auth_headers(_SUPABASE_ANON_KEY)
+
+    @property
+    def client(self) -> Client:
+        """Supabase client, created on first use and shared for the process."""
+        if self._client is None:
+            self._init_client()
+        return self._client
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """Shared HTTP/2 client for Storage REST calls, so connections are reused."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20),
+                timeout=60,
+            )
+        return self._http
+
+    async def close(self):
+        """Close the shared HTTP client."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    @staticmethod
+    def _auth_headers(api_key: str) -> dict:
+        """Headers authenticating a Storage REST request with the given key."""
+        return {"Authorization": f"Bearer {api_key}", "apikey": api_key}
+
+    async def _storage_request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        """Send a Storage REST request with the anon key, raising on error responses."""
+        response = await self.http.request(
+            method,
+            f"{self._storage_url}/{path}",
+            headers=self._anon_headers,
+            **kwargs
+        )
+        if response.is_error:
+            raise Exception(f"{response.status_code}: {response.text}")
+        return response
 
     def _init_client(self):
         """Initialize Supabase client."""
-        # Ensure URL has trailing slash to avoid warnings
-        supabase_url = settings.supabase_url.rstrip('/') + '/'
-        self.client = create_client(
-            supabase_url,
-            settings.supabase_key
+        # URL has a trailing slash to avoid warnings
+        self._client = create_client(
+            _SUPABASE_URL,
+            _SUPABASE_ANON_KEY
         )
 
     async def upload_file(
         self,
         bucket: str,
         file_path: str,
-        file_content: bytes,
-        content_type: str = "application/pdf"
+        file_content: Union[bytes, AsyncIterable[bytes]],
+        content_type: str = "application/pdf",
+        content_length: Optional[int] = None
     ) -> dict:
         """
         Upload file to Supabase Storage.
 
+        The body is sent straight to the Storage REST endpoint, so an async
+        iterable of chunks is streamed without being buffered in memory.
+
         Args:
             bucket: Storage bucket name
             file_path: Path where file will be stored
-            file_content: File content as bytes
+            file_content: File content as bytes or an async iterable of byte chunks
             content_type: MIME type of the file
+            content_length: Size in bytes, sent as Content-Length when streaming
 
         Returns:
             Upload response with file URL and metadata
         """
         try:
-            # Use service role key for uploads (has full permissions)
-            client_to_use = self.client
-            if hasattr(settings, 'supabase_service_key') and settings.supabase_service_key and settings.supabase_service_key != "PUT_YOUR_SERVICE_ROLE_KEY_HERE":
-                # Ensure URL has trailing slash
-                supabase_url = settings.supabase_url.rstrip('/') + '/'
-                client_to_use = create_client(
-                    supabase_url,
-                    settings.supabase_service_key
-                )
-
-            response = client_to_use.storage.from_(bucket).upload(
-                path=file_path,
-                file=file_content,
-                file_options={
-                    "content-type": content_type,
-                    "upsert": "true"
-                }
-            )
+            headers = {
+                **self._upload_headers,
+                "Content-Type": content_type,
+                "x-upsert": "true"
+            }
+            if content_length is not None:
+                headers["Content-Length"] = str(content_length)
 
-            # UploadResponse objects don't have errors - they represent successful uploads
-            # If there was an error, Supabase would have thrown an exception already
+            upload_url = f"{self._storage_url}/object/{bucket}/{file_path}"
+            response = await self.http.post(upload_url, content=file_content, headers=headers)
+
+            if response.is_error:
+                return {
+                    "success": False,
+                    "error": f"{response.status_code}: {response.text}"
+                }
 
             # Get public URL for the uploaded file
-            public_url = client_to_use.storage.from_(bucket).get_public_url(file_path)
+            public_url = self.client.storage.from_(bucket).get_public_url(file_path)
 
             return {
                 "success": True,
                 "path": file_path,
                 "public_url": public_url,
-                "response": response
+                "response": orjson.loads(response.content)
             }
 
         except Exception as e:
@@ -97,8 +153,8 @@ class SupabaseManager:
             Exception: If download fails
         """
         try:
-            response = self.client.storage.from_(bucket).download(file_path)
-            return response
+            response = await self._storage_request("GET", f"object/{bucket}/{file_path}")
+            return response.content
 
         except Exception as e:
             raise Exception(f"Download failed: {str(e)}")
@@ -118,11 +174,7 @@ class SupabaseManager:
             Exception: If deletion fails
         """
         try:
-            response = self.client.storage.from_(bucket).remove([file_path])
-
-            if response.get("error"):
-                raise Exception(f"Delete failed: {response['error']}")
-
+            await self._storage_request("DELETE", f"object/{bucket}", json={"prefixes": [file_path]})
             return True
 
         except Exception as e:
@@ -153,12 +205,12 @@ class SupabaseManager:
             True if creation was successful
         """
         try:
-            response = self.client.storage.create_bucket(
-                id=bucket_name,
-                options={"public": public}
+            await self._storage_request(
+                "POST",
+                "bucket",
+                json={"id": bucket_name, "name": bucket_name, "public": public}
             )
-
-            return not response.get("error")
+            return True
 
         except Exception:
             return False
@@ -175,8 +227,17 @@ class SupabaseManager:
             List of file information
         """
         try:
-            response = self.client.storage.from_(bucket).list(folder)
-            return response
+            response = await self._storage_request(
+                "POST",
+                f"object/list/{bucket}",
+                json={
+                    "prefix": folder,
+                    "limit": 100,
+                    "offset": 0,
+                    "sortBy": {"column": "name", "order": "asc"}
+                }
+            )
+            return orjson.loads(response.content)
 
         except Exception as e:
             raise Exception(f"List files failed: {str(e)}")
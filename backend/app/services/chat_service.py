@@ -2,40 +2,250 @@
 Chat service for handling RAG-based conversations.
 Orchestrates the entire RAG pipeline from query to response.
 """
-import uuid
+import orjson
+import asyncio
 import logging
-from typing import List, Dict, Optional
+from collections import Counter
+from typing import AsyncIterator, List, Dict, Optional
+from app.core.cache import TTLCache
 from app.core.database import db_manager
-from app.services.embedding_service import generate_query_embedding
-from app.services.vector_search import search_similar_chunks
-from app.services.llm_service import generate_response
+from app.core.ids import new_id
+from app.core.ownership import invalidate_chat_ownership, invalidate_user_chat_ownership
+from app.services.embedding_service import (
+    LEGACY_STRATEGY, EmbeddingStrategyUnavailable, generate_query_embedding, query_embedding_batcher
+)
+from app.services.vector_search import chunk_search_batcher, search_similar_chunks
+from app.services.llm_service import (
+    build_rag_prompt, build_smalltalk_prompt, generate_response, generate_smalltalk_response,
+    not_found_response, rag_response, smalltalk_response, stream_llm
+)
+from app.services.response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
+# Strong references to in-flight message saves so they aren't garbage collected
+_background_saves = set()
+
+# (chat_id, limit) -> (message count, history). The count is re-read on every
+# call, so an entry is only served while no message has been added or removed.
+_history_cache = TTLCache(maxsize=2048, ttl=5)
+
+# document_id -> embedding strategy; only cached once the document is processed,
+# after which it never changes
+_document_strategy_cache = TTLCache(maxsize=4096, ttl=3600)
+
+# Greetings and acknowledgements that never need document retrieval
+SMALLTALK_WORDS = frozenset({
+    "hi", "hello", "hey", "hiya", "yo", "thanks", "thank", "you", "thx", "ty",
+    "ok", "okay", "cool", "great", "nice", "bye", "goodbye", "good", "morning",
+    "afternoon", "evening", "night", "cheers", "awesome", "perfect",
+})
+
+# Reply while a document's embeddings can't be searched yet; neither cached nor saved
+INDEX_NOT_READY_RESPONSE = {
+    "message": "This document's search index isn't ready yet. Please try again in a minute; if this keeps happening, re-upload the document so it can be processed again.",
+    "citations": [],
+    "has_context": False,
+    "chunks_found": 0
+}
+
+# How often the retrieval fast path is taken ("retrieval" vs "smalltalk"/"no_document")
+retrieval_stats = Counter()
+
+
+def _is_smalltalk(message: str) -> bool:
+    """True for short messages made only of greeting/acknowledgement words."""
+    words = [word.strip(".,!?;:'\"") for word in message.lower().split()]
+    return 0 < len(words) < 4 and all(word in SMALLTALK_WORDS for word in words)
+
+# Hot-path SQL lives in module constants: the text is identical on every call,
+# so asyncpg's per-connection statement cache reuses the prepared plan.
+
+# Insert the message and bump the session's updatedAt in one round trip
+SAVE_CHAT_MESSAGE_QUERY = """
+WITH inserted AS (
+    INSERT INTO chat_messages (id, "sessionId", "userId", query, response, "chunksUsed", "createdAt")
+    VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
+    RETURNING "sessionId"
+)
+UPDATE chat_sessions
+SET "updatedAt" = CURRENT_TIMESTAMP
+WHERE id = (SELECT "sessionId" FROM inserted)
+"""
+
+DOCUMENT_EMBEDDING_MODEL_QUERY = 'SELECT "embeddingModel" FROM documents WHERE id = $1'
+
+CREATE_CHAT_SESSION_QUERY = """
+INSERT INTO chat_sessions (id, "userId", "documentIds", title, "createdAt", "updatedAt")
+VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+"""
+
+# Latest N messages, returned oldest first
+USER_CHAT_HISTORY_QUERY = """
+SELECT * FROM (
+    SELECT id, query, response, "chunksUsed", "createdAt"
+    FROM chat_messages
+    WHERE "sessionId" = $1 AND "userId" = $2
+    ORDER BY "createdAt" DESC
+    LIMIT $3
+) latest
+ORDER BY "createdAt" ASC
+"""
+
+CHAT_MESSAGE_COUNT_QUERY = """
+SELECT COUNT(*) FROM chat_messages WHERE "sessionId" = $1
+"""
+
+# Citations are projected to chunk_id/page_number in SQL, so the stored chunk
+# content never leaves the database and rows arrive with citations decoded
+CHAT_HISTORY_QUERY = """
+SELECT id, query, response, "createdAt",
+       COALESCE(
+           (SELECT jsonb_agg(jsonb_build_object(
+                       'chunk_id', chunk->>'chunk_id',
+                       'page_number', chunk->'page_number'))
+            FROM jsonb_array_elements("chunksUsed"::jsonb) AS chunk),
+           '[]'::jsonb
+       ) as citations
+FROM chat_messages
+WHERE "sessionId" = $1
+ORDER BY "createdAt" ASC
+LIMIT $2
+"""
+
+USER_CHAT_SESSIONS_QUERY = """
+WITH cs AS (
+    SELECT id, title, "documentIds", "createdAt", "updatedAt"
+    FROM chat_sessions
+    WHERE "userId" = $1
+    ORDER BY "updatedAt" DESC
+    LIMIT $2
+),
+m AS (
+    SELECT "sessionId",
+           COUNT(*) as message_count,
+           (ARRAY_AGG(query ORDER BY "createdAt" DESC))[1] as last_message
+    FROM chat_messages
+    WHERE "sessionId" IN (SELECT id FROM cs)
+    GROUP BY "sessionId"
+)
+SELECT cs.id, cs.title, cs."createdAt", cs."updatedAt",
+       d."originalName" as document_name,
+       m.last_message,
+       COALESCE(m.message_count, 0) as message_count
+FROM cs
+LEFT JOIN m ON m."sessionId" = cs.id
+LEFT JOIN documents d ON d.id = cs."documentIds"[1]
+ORDER BY cs."updatedAt" DESC
+"""
+
+# Messages go first (due to foreign key), in the same round trip as the session
+DELETE_CHAT_SESSION_QUERY = """
+WITH deleted_messages AS (
+    DELETE FROM chat_messages WHERE "sessionId" = $1 AND "userId" = $2
+)
+DELETE FROM chat_sessions WHERE id = $1 AND "userId" = $2
+"""
+
+# Set-based cleanup after a document is deleted: clear the messages of every
+# session that referenced it, drop the document from sessions that keep other
+# documents, and delete the sessions left with none. Sessions are either
+# updated or deleted, never both, since CTEs share one snapshot.
+DOCUMENT_CHAT_CLEANUP_QUERY = """
+WITH affected AS (
+    SELECT id, array_remove("documentIds", $2::varchar) as remaining
+    FROM chat_sessions
+    WHERE "userId" = $1 AND "documentIds" @> ARRAY[$2]::varchar[]
+),
+deleted_messages AS (
+    DELETE FROM chat_messages
+    WHERE "userId" = $1 AND "sessionId" IN (SELECT id FROM affected)
+),
+updated_sessions AS (
+    UPDATE chat_sessions cs
+    SET "documentIds" = affected.remaining, "updatedAt" = CURRENT_TIMESTAMP
+    FROM affected
+    WHERE cs.id = affected.id AND array_length(affected.remaining, 1) IS NOT NULL
+)
+DELETE FROM chat_sessions
+WHERE id IN (SELECT id FROM affected WHERE array_length(remaining, 1) IS NULL)
+"""
+
 async def create_chat_session(user_id: str, document_id: str = None, title: str = None) -> str:
     """Create a new chat session."""
-    session_id = str(uuid.uuid4())
+    session_id = new_id()
 
     # Convert single document_id to array for storage
     document_ids = [document_id] if document_id else []
     chat_title = title if title else "New Chat"
 
-    query = """
-    INSERT INTO chat_sessions (id, "userId", "documentIds", title, "createdAt", "updatedAt")
-    VALUES ($1, $2, $3, $4, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-    """
-
     try:
         async with db_manager.get_connection() as conn:
-            await conn.execute(query, session_id, user_id, document_ids, chat_title)
-        print(f"CHAT_SESSION: Created chat session {session_id} for user {user_id}")
+            await conn.execute(CREATE_CHAT_SESSION_QUERY, session_id, user_id, document_ids, chat_title)
         logger.info(f"✅ Created chat session: {session_id}")
         return session_id
     except Exception as e:
-        print(f"CHAT_SESSION: Failed to create session: {e}")
         logger.error(f"❌ Failed to create chat session: {e}")
         raise
 
+async def _document_embedding_strategy(document_id: str) -> Optional[str]:
+    """
+    Embedding strategy a document was embedded with, so its queries match.
+
+    LEGACY_STRATEGY while a document from before the strategy was recorded
+    waits to be re-embedded, then None until that finishes.
+    """
+    strategy = _document_strategy_cache.get(document_id)
+    if strategy is None:
+        strategy = await db_manager.fetchval(DOCUMENT_EMBEDDING_MODEL_QUERY, document_id)
+        if strategy is not None and strategy != LEGACY_STRATEGY:
+            _document_strategy_cache.set(document_id, strategy)
+    return strategy
+
+async def _retrieve_chunks(message: str, document_id: str) -> List[Dict]:
+    """
+    Embed the message and find the document's most similar chunks.
+
+    Raises:
+        EmbeddingStrategyUnavailable: If the document can't be searched yet
+    """
+    # Generate query embedding (batched with concurrent requests)
+    strategy = await _document_embedding_strategy(document_id)
+    query_embedding = await query_embedding_batcher.submit(message, strategy)
+    logger.debug("CHAT_MESSAGE: Query embedding generated - %d dimensions", len(query_embedding))
+
+    # Search for similar chunks (batched with concurrent requests)
+    similar_chunks = await chunk_search_batcher.submit(
+        query_embedding=query_embedding,
+        document_ids=[document_id],
+        limit=5,
+        similarity_threshold=0.01  # Lowered to match the actual similarity scores we're getting
+    )
+    logger.debug("CHAT_MESSAGE: Found %d similar chunks", len(similar_chunks))
+    return similar_chunks
+
+def _finish_message(message: str, document_id: Optional[str], user_id: str, chat_id: str, response_data: Dict) -> Dict:
+    """Save the turn without holding up the response and return the API payload."""
+    message_id = new_id()
+    logger.debug("CHAT_MESSAGE: Saving message %s in the background", message_id)
+    save_task = asyncio.create_task(save_chat_message(
+        session_id=chat_id,
+        user_id=user_id,
+        query=message,
+        response=response_data["response"],
+        chunks_used=response_data["citations"],
+        message_id=message_id
+    ))
+    _background_saves.add(save_task)
+    save_task.add_done_callback(_background_saves.discard)
+
+    return {
+        "message": response_data["response"],
+        "citations": response_data["citations"],
+        "has_context": response_data["has_context"],
+        "chunks_found": response_data["chunks_found"]
+    }
+
 async def process_chat_message(
     message: str,
     document_id: str,
@@ -43,51 +253,42 @@ async def process_chat_message(
     chat_id: str
 ) -> Dict:
     """Process a chat message for the API."""
-    print(f"CHAT_MESSAGE: Processing message for chat {chat_id}")
-    print(f"CHAT_MESSAGE: Message: {message[:100]}...")
-    print(f"CHAT_MESSAGE: Document ID: {document_id}")
+    logger.debug("CHAT_MESSAGE: Processing message for chat %s (document %s)", chat_id, document_id)
 
     try:
-        # Generate query embedding
-        print(f"CHAT_MESSAGE: Generating query embedding...")
-        query_embedding = await generate_query_embedding(message)
-        print(f"CHAT_MESSAGE: Query embedding generated - {len(query_embedding)} dimensions")
-
-        # Search for similar chunks
-        print(f"CHAT_MESSAGE: Searching for similar chunks...")
-        similar_chunks = await search_similar_chunks(
-            query_embedding=query_embedding,
-            document_ids=[document_id] if document_id else None,
-            limit=5,
-            similarity_threshold=0.01  # Lowered to match the actual similarity scores we're getting
-        )
-        print(f"CHAT_MESSAGE: Found {len(similar_chunks)} similar chunks")
-
-        # Generate response using LLM
-        print(f"CHAT_MESSAGE: Generating LLM response...")
-        response_data = await generate_response(message, similar_chunks)
-        print(f"CHAT_MESSAGE: LLM response generated")
-
-        # Save message to database
-        print(f"CHAT_MESSAGE: Saving message to database...")
-        message_id = await save_chat_message(
-            session_id=chat_id,
-            user_id=user_id,
-            query=message,
-            response=response_data["response"],
-            chunks_used=similar_chunks
-        )
-        print(f"CHAT_MESSAGE: Message saved with ID {message_id}")
-
-        return {
-            "message": response_data["response"],
-            "citations": response_data["citations"],
-            "has_context": response_data["has_context"],
-            "chunks_found": len(similar_chunks)
-        }
+        # Repeated questions against the same document reuse the cached answer
+        cached = await response_cache.get(document_id, message)
+        if cached:
+            logger.debug("CHAT_MESSAGE: Response cache hit")
+            response_data = cached
+        elif not document_id:
+            # Nothing to retrieve from
+            retrieval_stats["no_document"] += 1
+            response_data = await generate_response(message, [])
+        elif _is_smalltalk(message):
+            retrieval_stats["smalltalk"] += 1
+            logger.debug("CHAT_MESSAGE: Small talk, skipping retrieval")
+            response_data = await generate_smalltalk_response(message)
+        else:
+            retrieval_stats["retrieval"] += 1
+            try:
+                similar_chunks = await _retrieve_chunks(message, document_id)
+            except EmbeddingStrategyUnavailable as e:
+                logger.warning(f"⚠️ CHAT_MESSAGE: Document {document_id} not searchable yet: {e}")
+                return dict(INDEX_NOT_READY_RESPONSE)
+
+            # Generate response using LLM
+            response_data = await generate_response(message, similar_chunks)
+            logger.debug("CHAT_MESSAGE: LLM response generated")
+
+            # Only grounded answers are cached; a "not found" reply may just mean
+            # the document is still being processed
+            if response_data["has_context"]:
+                await response_cache.set(document_id, message, response_data)
+
+        return _finish_message(message, document_id, user_id, chat_id, response_data)
 
     except Exception as e:
-        print(f"CHAT_MESSAGE: Error processing message: {e}")
         logger.error(f"❌ Chat processing failed: {e}")
         return {
             "message": f"Sorry, I encountered an error: {str(e)}",
@@ -96,6 +297,71 @@ async def process_chat_message(
             "chunks_found": 0
         }
 
+def _sse(event: str, data: Dict) -> bytes:
+    """Encode one server-sent event with a JSON payload."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+async def stream_chat_message(
+    message: str,
+    document_id: str,
+    user_id: str,
+    chat_id: str
+) -> AsyncIterator[bytes]:
+    """
+    Process a chat message, streaming the answer as server-sent events.
+
+    "delta" events carry answer text as the LLM produces it; a final "done"
+    event carries the same payload process_chat_message returns. Cached and
+    canned answers arrive as a single delta.
+    """
+    logger.debug("CHAT_STREAM: Processing message for chat %s (document %s)", chat_id, document_id)
+
+    try:
+        cached = await response_cache.get(document_id, message)
+        if cached:
+            logger.debug("CHAT_STREAM: Response cache hit")
+            response_data = cached
+            yield _sse("delta", {"text": response_data["response"]})
+        elif not document_id:
+            retrieval_stats["no_document"] += 1
+            response_data = not_found_response()
+            yield _sse("delta", {"text": response_data["response"]})
+        else:
+            if _is_smalltalk(message):
+                retrieval_stats["smalltalk"] += 1
+                similar_chunks = None
+                prompt = build_smalltalk_prompt(message)
+            else:
+                retrieval_stats["retrieval"] += 1
+                try:
+                    similar_chunks = await _retrieve_chunks(message, document_id)
+                except EmbeddingStrategyUnavailable as e:
+                    logger.warning(f"⚠️ CHAT_STREAM: Document {document_id} not searchable yet: {e}")
+                    yield _sse("done", INDEX_NOT_READY_RESPONSE)
+                    return
+                prompt = build_rag_prompt(message, similar_chunks) if similar_chunks else None
+
+            if prompt is None:
+                response_data = not_found_response()
+                yield _sse("delta", {"text": response_data["response"]})
+            else:
+                parts = []
+                async for delta in stream_llm(prompt):
+                    parts.append(delta)
+                    yield _sse("delta", {"text": delta})
+                answer = "".join(parts).strip()
+                if similar_chunks is None:
+                    response_data = smalltalk_response(answer)
+                else:
+                    response_data = rag_response(answer, similar_chunks)
+                    await response_cache.set(document_id, message, response_data)
+
+        yield _sse("done", _finish_message(message, document_id, user_id, chat_id, response_data))
+
+    except Exception as e:
+        logger.error(f"❌ Chat streaming failed: {e}")
+        yield _sse("error", {"detail": f"Sorry, I encountered an error: {str(e)}"})
+
 async def process_chat_message_old(
     session_id: str,
     user_id: str,
@@ -112,7 +378,7 @@ async def process_chat_message_old(
             query_embedding=query_embedding,
             document_ids=document_ids,
             limit=5,
-            similarity_threshold=0.01  # Lowered to match actual TF-IDF similarity scores
+            similarity_threshold=0.01  # Lowered to match bag-of-words similarity scores
         )
 
         # Generate response using LLM
@@ -124,7 +390,7 @@ async def process_chat_message_old(
             user_id=user_id,
             query=query,
             response=response_data["response"],
-            chunks_used=similar_chunks
+            chunks_used=response_data["citations"]
         )
 
         return {
@@ -132,7 +398,7 @@ async def process_chat_message_old(
             "response": response_data["response"],
             "citations": response_data["citations"],
             "has_context": response_data["has_context"],
-            "chunks_found": len(similar_chunks)
+            "chunks_found": response_data["chunks_found"]
         }
 
     except Exception as e:
@@ -150,48 +416,30 @@ async def save_chat_message(
     user_id: str,
     query: str,
     response: str,
-    chunks_used: List[Dict]
+    chunks_used: List[Dict],
+    message_id: Optional[str] = None
 ) -> str:
-    """Save chat message to database."""
-    message_id = str(uuid.uuid4())
+    """
+    Save chat message to database.
 
-    query_sql = """
-    INSERT INTO chat_messages (id, "sessionId", "userId", query, response, "chunksUsed", "createdAt")
-    VALUES ($1, $2, $3, $4, $5, $6, CURRENT_TIMESTAMP)
+    chunks_used takes the citations from generate_response as-is: chunk text
+    already lives in document_embeddings under its chunk_id, so only the
+    references (chunk_id, page_number, similarity) are stored.
     """
+    message_id = message_id or new_id()
 
     try:
-        # Convert chunks to JSON-serializable format
-        chunks_data = [
-            {
-                "chunk_id": chunk["chunk_id"],
-                "content": chunk["content"][:500],  # Truncate for storage
-                "page_number": chunk.get("page_number"),
-                "similarity": chunk.get("similarity")
-            }
-            for chunk in chunks_used
-        ]
-
-        print(f"CHAT_SAVE: Saving message with {len(chunks_data)} chunks")
-
-        async with db_manager.get_connection() as conn:
-            import json
-            await conn.execute(
-                query_sql,
-                message_id,
-                session_id,
-                user_id,
-                query,
-                response,
-                json.dumps(chunks_data)  # Convert list to JSON string
-            )
-
-            # Update the chat session's updatedAt timestamp
-            await conn.execute("""
-                UPDATE chat_sessions
-                SET "updatedAt" = CURRENT_TIMESTAMP
-                WHERE id = $1
-            """, session_id)
+        logger.debug("CHAT_SAVE: Saving message with %d chunks", len(chunks_used))
+
+        await db_manager.execute(
+            SAVE_CHAT_MESSAGE_QUERY,
+            message_id,
+            session_id,
+            user_id,
+            query,
+            response,
+            orjson.dumps(chunks_used).decode()  # Convert list to JSON string
+        )
 
         logger.info(f"✅ Saved chat message: {message_id}")
         return message_id
@@ -202,29 +450,20 @@ async def save_chat_message(
 
 async def get_chat_history_with_user(session_id: str, user_id: str, limit: int = 50) -> List[Dict]:
     """Get chat history for a session."""
-    query = """
-    SELECT id, query, response, "chunksUsed", "createdAt"
-    FROM chat_messages
-    WHERE "sessionId" = $1 AND "userId" = $2
-    ORDER BY "createdAt" DESC
-    LIMIT $3
-    """
-
     try:
-        async with db_manager.get_connection() as conn:
-            rows = await conn.fetch(query, session_id, user_id, limit)
-
-            history = []
-            for row in rows:
-                history.append({
-                    "message_id": row["id"],
-                    "query": row["query"],
-                    "response": row["response"],
-                    "chunks_used": row["chunksUsed"],
-                    "created_at": row["createdAt"].isoformat()
-                })
+        rows = await db_manager.fetch(USER_CHAT_HISTORY_QUERY, session_id, user_id, limit)
 
-            return list(reversed(history))  # Return in chronological order
+        # Rows already arrive in chronological order
+        return [
+            {
+                "message_id": message_id,
+                "query": query,
+                "response": response,
+                "chunks_used": chunks_used,
+                "created_at": created_at.isoformat()
+            }
+            for message_id, query, response, chunks_used, created_at in rows
+        ]
 
     except Exception as e:
         logger.error(f"❌ Failed to get chat history: {e}")
@@ -232,136 +471,82 @@ async def get_chat_history_with_user(session_id: str, user_id: str, limit: int =
 
 async def get_chat_history(chat_id: str, limit: int = 50) -> List[Dict]:
     """Get chat history for API (without requiring user_id)."""
-    query = """
-    SELECT id, query, response, "chunksUsed", "createdAt", "userId"
-    FROM chat_messages
-    WHERE "sessionId" = $1
-    ORDER BY "createdAt" ASC
-    LIMIT $2
-    """
-
-    print(f"CHAT_HISTORY: Getting history for chat {chat_id}")
+    logger.debug("CHAT_HISTORY: Getting history for chat %s", chat_id)
 
     try:
         async with db_manager.get_connection() as conn:
-            rows = await conn.fetch(query, chat_id, limit)
+            # Polling clients re-read unchanged histories; an index-only count
+            # tells whether the cached copy is still current
+            message_count = await conn.fetchval(CHAT_MESSAGE_COUNT_QUERY, chat_id)
+            cached = _history_cache.get((chat_id, limit))
+            if cached is not None and cached[0] == message_count:
+                return cached[1]
+
+            rows = await conn.fetch(CHAT_HISTORY_QUERY, chat_id, limit)
 
             history = []
-            for row in rows:
-                # Handle chunks_used - it might be JSON string or already parsed
-                chunks_used = row["chunksUsed"]
-                if isinstance(chunks_used, str):
-                    try:
-                        import json
-                        chunks_used = json.loads(chunks_used)
-                    except:
-                        chunks_used = []
-                elif chunks_used is None:
-                    chunks_used = []
+            # Rows unpack positionally in CHAT_HISTORY_QUERY column order
+            for message_id, query, response, created_at, citations in rows:
+                created_at = created_at.isoformat()
 
                 # Convert each conversation turn into separate USER and ASSISTANT messages
                 # This matches the frontend's Message interface expectations
-
-                # Add USER message
-                user_message = {
-                    "id": f"{row['id']}_user",
+                history.append({
+                    "id": f"{message_id}_user",
                     "role": "USER",
-                    "content": row["query"],
-                    "created_at": row["createdAt"].isoformat()
-                }
-                history.append(user_message)
-
-                # Add ASSISTANT message
-                assistant_message = {
-                    "id": f"{row['id']}_assistant",
+                    "content": query,
+                    "created_at": created_at
+                })
+                history.append({
+                    "id": f"{message_id}_assistant",
                     "role": "ASSISTANT",
-                    "content": row["response"],
-                    "created_at": row["createdAt"].isoformat(),
-                    "citations": [
-                        {
-                            "chunk_id": chunk["chunk_id"],
-                            "page_number": chunk.get("page_number")
-                        }
-                        for chunk in chunks_used
-                    ] if chunks_used else []
-                }
-                history.append(assistant_message)
-
-            print(f"CHAT_HISTORY: Found {len(rows)} conversation turns, returning {len(history)} messages")
+                    "content": response,
+                    "created_at": created_at,
+                    "citations": citations
+                })
+
+            logger.debug("CHAT_HISTORY: Found %d conversation turns, returning %d messages", len(rows), len(history))
+            _history_cache.set((chat_id, limit), (message_count, history))
             return history
 
     except Exception as e:
-        print(f"CHAT_HISTORY: Failed to get chat history: {e}")
         logger.error(f"❌ Failed to get chat history: {e}")
         return []
 
 async def get_user_chat_sessions(user_id: str, limit: int = 20) -> List[Dict]:
     """Get user's chat sessions."""
-    query = """
-    SELECT cs.id, cs.title, cs."documentIds", cs."createdAt", cs."updatedAt",
-           (SELECT query FROM chat_messages WHERE "sessionId" = cs.id ORDER BY "createdAt" DESC LIMIT 1) as last_message,
-           (SELECT COUNT(*) FROM chat_messages WHERE "sessionId" = cs.id) as message_count
-    FROM chat_sessions cs
-    WHERE "userId" = $1
-    ORDER BY cs."updatedAt" DESC
-    LIMIT $2
-    """
 
-    print(f"CHAT_SESSIONS: Getting chat sessions for user {user_id}")
+    logger.debug("CHAT_SESSIONS: Getting chat sessions for user %s", user_id)
 
     try:
         async with db_manager.get_connection() as conn:
-            rows = await conn.fetch(query, user_id, limit)
+            rows = await conn.fetch(USER_CHAT_SESSIONS_QUERY, user_id, limit)
 
             sessions = []
             for row in rows:
-                # Get document name from documentIds (take first document)
-                document_name = None
-                if row["documentIds"] and len(row["documentIds"]) > 0:
-                    doc_id = row["documentIds"][0]
-                    try:
-                        doc_info = await conn.fetchrow(
-                            'SELECT "originalName" FROM documents WHERE id = $1',
-                            doc_id
-                        )
-                        if doc_info:
-                            document_name = doc_info["originalName"]
-                    except Exception:
-                        pass
-
+                # Document name comes from the session's first document
                 sessions.append({
                     "id": row["id"],
                     "title": row["title"] or "New Chat",
-                    "document_name": document_name,
+                    "document_name": row["document_name"],
                     "last_message": row["last_message"],
                     "created_at": row["createdAt"].isoformat(),
                     "updated_at": row["updatedAt"].isoformat() if row["updatedAt"] else row["createdAt"].isoformat(),
                     "message_count": row["message_count"]
                 })
 
-            print(f"CHAT_SESSIONS: Found {len(sessions)} chat sessions")
+            logger.debug("CHAT_SESSIONS: Found %d chat sessions", len(sessions))
             return sessions
 
     except Exception as e:
-        print(f"CHAT_SESSIONS: Failed to get chat sessions: {e}")
         logger.error(f"❌ Failed to get chat sessions: {e}")
         return []
 
 async def delete_chat_session(session_id: str, user_id: str):
     """Delete a chat session and all its messages."""
     try:
-        async with db_manager.get_connection() as conn:
-            # Delete messages first (due to foreign key)
-            await conn.execute(
-                'DELETE FROM chat_messages WHERE "sessionId" = $1 AND "userId" = $2',
-                session_id, user_id
-            )
-
-            # Delete session
-            await conn.execute(
-                'DELETE FROM chat_sessions WHERE id = $1 AND "userId" = $2',
-                session_id, user_id
-            )
+        await db_manager.execute(DELETE_CHAT_SESSION_QUERY, session_id, user_id)
+        invalidate_chat_ownership(session_id, user_id)
 
         logger.info(f"✅ Deleted chat session: {session_id}")
 
@@ -372,37 +557,10 @@ async def delete_chat_session(session_id: str, user_id: str):
 async def delete_chat_sessions_for_document(document_id: str, user_id: str):
     """Delete all chat sessions that reference a specific document."""
     try:
-        # Find sessions that include this document
-        query = """
-        SELECT id FROM chat_sessions
-        WHERE "userId" = $1 AND $2 = ANY("documentIds")
-        """
-
-        async with db_manager.get_connection() as conn:
-            sessions = await conn.fetch(query, user_id, document_id)
-
-            for session in sessions:
-                session_id = session["id"]
-
-                # Delete messages first
-                await conn.execute(
-                    'DELETE FROM chat_messages WHERE "sessionId" = $1 AND "userId" = $2',
-                    session_id, user_id
-                )
-
-                # Update documentIds array by removing the deleted document
-                await conn.execute("""
-                    UPDATE chat_sessions
-                    SET "documentIds" = array_remove("documentIds", $1), "updatedAt" = CURRENT_TIMESTAMP
-                    WHERE id = $2 AND "userId" = $3
-                """, document_id, session_id, user_id)
-
-                # If no documents left in the session, delete it entirely
-                await conn.execute("""
-                    DELETE FROM chat_sessions
-                    WHERE id = $1 AND "userId" = $2 AND array_length("documentIds", 1) IS NULL
-                """, session_id, user_id)
+        await db_manager.execute(DOCUMENT_CHAT_CLEANUP_QUERY, user_id, document_id)
 
+        # Sessions may have lost their document or been deleted outright
+        invalidate_user_chat_ownership(user_id)
         logger.info(f"✅ Cleaned up chat sessions for document {document_id}")
 
     except Exception as e:
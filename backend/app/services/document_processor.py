@@ -2,18 +2,68 @@
 Document processing service for handling PDF files.
 Extracts text, creates chunks, and prepares documents for embedding.
 """
+import io
 import os
-import uuid
+import atexit
+import mmap
+import secrets
 import logging
-from typing import List, Dict, Optional, Tuple
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from app.core.config import settings
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 logger = logging.getLogger(__name__)
 
-# Thread pool for CPU-intensive operations
-executor = ThreadPoolExecutor(max_workers=2)
+# Sentence boundaries used by chunk_text: "!" and "?" are mapped to "." so
+# one str.split finds every boundary. Runs of punctuation leave empty pieces,
+# which the length filter drops, matching a split on [.!?]+.
+SENTENCE_END_TABLE = str.maketrans("!?", "..")
+
+# Upper bound on the number of page ranges one PDF is split into when
+# extracting pages in parallel.
+PDF_PAGE_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Process pool for the full parse + chunk pipeline, created on first use.
+# Workers are spawned rather than forked so they never inherit the torch
+# threads or locks held by the API process.
+process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Get the shared document processing pool, creating it if needed."""
+    global process_pool
+    if process_pool is None:
+        process_pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return process_pool
+
+
+def shutdown_process_pool():
+    """Shut down the document processing pool if it was started."""
+    global process_pool
+    if process_pool is not None:
+        process_pool.shutdown(wait=False, cancel_futures=True)
+        process_pool = None
+
+# Also stop the workers when the pool is used outside the API lifespan
+atexit.register(shutdown_process_pool)
 
 async def extract_pdf_text(file_path: str) -> Dict:
     """Extract text from PDF file."""
@@ -27,10 +77,16 @@ async def extract_pdf_text(file_path: str) -> Dict:
         file_size = os.path.getsize(file_path)
         print(f"📄 PDF_EXTRACT: File exists, size: {file_size} bytes")
 
-        # Run in thread pool to avoid blocking
-        print(f"📄 PDF_EXTRACT: Starting sync extraction in thread pool...")
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(executor, _extract_pdf_sync, file_path)
+        loop = asyncio.get_running_loop()
+        if fitz is not None:
+            # Split the page range across the process pool; each worker opens
+            # the file itself so no document state crosses process boundaries.
+            print(f"📄 PDF_EXTRACT: Starting parallel PyMuPDF extraction...")
+            result = await _extract_pdf_parallel(loop, file_path)
+        else:
+            # Parse in the process pool to avoid blocking
+            print(f"📄 PDF_EXTRACT: Starting sync extraction in process pool...")
+            result = await loop.run_in_executor(get_process_pool(), _extract_pdf_sync, file_path)
 
         print(f"📄 PDF_EXTRACT: Extraction completed, success: {result.get('success', False)}")
         if result.get('success'):
@@ -44,192 +100,393 @@ async def extract_pdf_text(file_path: str) -> Dict:
         print(f"❌ PDF_EXTRACT: Exception occurred: {e}")
         return {"success": False, "error": str(e), "pages": []}
 
-def _extract_pdf_sync(file_path: str) -> Dict:
-    """Synchronous PDF extraction using PyPDF2."""
-    print(f"📖 PDF_SYNC: Starting synchronous PDF extraction")
+@contextmanager
+def _mmap_pdf(file_path: str):
+    """
+    Map a PDF file read-only into memory.
+
+    PDF parsing jumps between the xref table and object streams, so the
+    mapping is advised as random access to keep the kernel from reading ahead.
+    """
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        mm = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+    finally:
+        os.close(fd)
+    try:
+        if hasattr(mmap, "MADV_RANDOM"):
+            mm.madvise(mmap.MADV_RANDOM)
+        yield mm
+    finally:
+        mm.close()
+
+def _open_pdf_source(source: Union[str, bytes]):
+    """Open a PDF given either a file path (memory-mapped) or its raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return _mmap_pdf(source)
+
+def _open_fitz_document(source: Union[str, bytes]):
+    """Open a PyMuPDF document given either a file path or its raw bytes."""
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=bytes(source), filetype="pdf")
+    return fitz.open(source)
+
+def _fitz_pages(doc, start: int, stop: int) -> List[Dict]:
+    """Extract the non-empty pages in [start, stop) of an open PyMuPDF document."""
+    pages = []
+    for page_index in range(start, min(stop, doc.page_count)):
+        try:
+            text = doc[page_index].get_text("text").strip()
+        except Exception as e:
+            logger.warning("⚠️ Failed to extract page %d: %s", page_index + 1, e)
+            continue
+        if text:  # Only add non-empty pages
+            pages.append({
+                "page_number": page_index + 1,
+                "text": text
+            })
+    return pages
+
+def _extract_page_range(
+    source: Union[str, bytes],
+    start: int = 0,
+    stop: Optional[int] = None
+) -> List[Dict]:
+    """Extract the non-empty pages in [start, stop) with PyMuPDF."""
+    with _open_fitz_document(source) as doc:
+        return _fitz_pages(doc, start, doc.page_count if stop is None else stop)
+
+async def _extract_pdf_parallel(loop: asyncio.AbstractEventLoop, file_path: str) -> Dict:
+    """Extract a PDF on disk by fanning contiguous page ranges out to the process pool."""
+    try:
+        with fitz.open(file_path) as doc:
+            page_count = doc.page_count
+
+        step = max(1, -(-page_count // PDF_PAGE_WORKERS))
+        pool = get_process_pool()
+        ranges = await asyncio.gather(*(
+            loop.run_in_executor(pool, _extract_page_range, file_path, start, start + step)
+            for start in range(0, page_count, step)
+        ))
+        pages = [page for page_range in ranges for page in page_range]
+        logger.info("✅ Extracted %d pages from PDF", len(pages))
+
+        return {
+            "success": True,
+            "pages": pages,
+            "total_pages": len(pages)
+        }
+    except Exception as e:
+        logger.error("❌ PDF extraction error: %s", e)
+        return {"success": False, "error": str(e), "pages": []}
+
+# Error reported when neither PyMuPDF nor PyPDF2 can be imported
+PDF_LIBRARY_MISSING = "PyPDF2 not installed"
+
+def _open_and_extract_all(source: Union[str, bytes], extract_text: bool = True) -> Dict:
+    """
+    Open a PDF once and read its metadata, page count and page text together.
+
+    Validation, metadata and text extraction all share this single parse of
+    the header and xref table. extract_text=False skips the page text for
+    callers that only need the metadata.
+
+    Returns:
+        Dict with success, pages, total_pages (non-empty pages), metadata
+        (including page_count) and, on failure, error
+    """
+    if fitz is None:
+        return _open_and_extract_all_pypdf2(source, extract_text)
+
+    try:
+        with _open_fitz_document(source) as doc:
+            doc_info = doc.metadata or {}
+            metadata = {
+                "page_count": doc.page_count,
+                "title": doc_info.get("title", ""),
+                "author": doc_info.get("author", ""),
+                "subject": doc_info.get("subject", ""),
+                "creator": doc_info.get("creator", ""),
+                "producer": doc_info.get("producer", ""),
+                "creation_date": doc_info.get("creationDate", ""),
+                "modification_date": doc_info.get("modDate", "")
+            }
+            pages = _fitz_pages(doc, 0, doc.page_count) if extract_text else []
+    except Exception as e:
+        logger.error("❌ PDF extraction error: %s", e)
+        return {"success": False, "error": str(e), "pages": [], "metadata": {"page_count": 0}}
+
+    if extract_text:
+        logger.info("✅ Extracted %d pages from PDF", len(pages))
+
+    return {
+        "success": True,
+        "pages": pages,
+        "total_pages": len(pages),
+        "metadata": metadata
+    }
+
+def _open_and_extract_all_pypdf2(source: Union[str, bytes], extract_text: bool = True) -> Dict:
+    """PyPDF2 implementation of _open_and_extract_all."""
     try:
-        print(f"📖 PDF_SYNC: Importing PyPDF2...")
         import PyPDF2
-        print(f"✅ PDF_SYNC: PyPDF2 imported successfully")
 
-        print(f"📖 PDF_SYNC: Opening PDF file: {file_path}")
         pages = []
-        with open(file_path, 'rb') as file:
-            print(f"📖 PDF_SYNC: Creating PdfReader...")
+        with _open_pdf_source(source) as file:
             pdf_reader = PyPDF2.PdfReader(file)
 
-            total_pages = len(pdf_reader.pages)
-            print(f"📖 PDF_SYNC: PDF has {total_pages} pages")
+            metadata = {"page_count": len(pdf_reader.pages)}
+            if pdf_reader.metadata:
+                doc_info = pdf_reader.metadata
+                metadata.update({
+                    "title": doc_info.get("/Title", ""),
+                    "author": doc_info.get("/Author", ""),
+                    "subject": doc_info.get("/Subject", ""),
+                    "creator": doc_info.get("/Creator", ""),
+                    "producer": doc_info.get("/Producer", ""),
+                    "creation_date": str(doc_info.get("/CreationDate", "")),
+                    "modification_date": str(doc_info.get("/ModDate", ""))
+                })
 
-            for page_num, page in enumerate(pdf_reader.pages, 1):
-                print(f"📖 PDF_SYNC: Processing page {page_num}/{total_pages}")
+            for page_num, page in enumerate(pdf_reader.pages if extract_text else (), 1):
                 try:
-                    text = page.extract_text()
-                    text_length = len(text.strip())
-                    print(f"📖 PDF_SYNC: Page {page_num} extracted {text_length} characters")
-
-                    if text.strip():  # Only add non-empty pages
-                        pages.append({
-                            "page_number": page_num,
-                            "text": text.strip()
-                        })
-                        print(f"✅ PDF_SYNC: Page {page_num} added to results")
-                    else:
-                        print(f"⚠️ PDF_SYNC: Page {page_num} is empty, skipping")
+                    text = page.extract_text().strip()
                 except Exception as e:
-                    print(f"❌ PDF_SYNC: Failed to extract page {page_num}: {e}")
-                    logger.warning(f"⚠️ Failed to extract page {page_num}: {e}")
+                    logger.warning("⚠️ Failed to extract page %d: %s", page_num, e)
                     continue
 
-        print(f"✅ PDF_SYNC: Successfully extracted {len(pages)} non-empty pages from PDF")
-        logger.info(f"✅ Extracted {len(pages)} pages from PDF")
+                if text:  # Only add non-empty pages
+                    pages.append({
+                        "page_number": page_num,
+                        "text": text
+                    })
+
+            if extract_text and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "PDF_SYNC: %d of %d pages had text",
+                    len(pages), len(pdf_reader.pages)
+                )
+
+        if extract_text:
+            logger.info("✅ Extracted %d pages from PDF", len(pages))
 
         return {
             "success": True,
             "pages": pages,
-            "total_pages": len(pages)
+            "total_pages": len(pages),
+            "metadata": metadata
         }
 
     except ImportError:
-        error_msg = "PyPDF2 not installed. Install with: pip install PyPDF2"
-        print(f"❌ PDF_SYNC: {error_msg}")
-        logger.error(f"❌ {error_msg}")
-        return {"success": False, "error": "PyPDF2 not installed", "pages": []}
+        logger.error("❌ PyPDF2 not installed. Install with: pip install PyPDF2")
+        return {"success": False, "error": PDF_LIBRARY_MISSING, "pages": [], "metadata": {"page_count": 0}}
     except Exception as e:
-        print(f"❌ PDF_SYNC: PDF extraction error: {e}")
-        logger.error(f"❌ PDF extraction error: {e}")
-        return {"success": False, "error": str(e), "pages": []}
+        logger.error("❌ PDF extraction error: %s", e)
+        return {"success": False, "error": str(e), "pages": [], "metadata": {"page_count": 0}}
+
+def _extract_pdf_sync(source: Union[str, bytes]) -> Dict:
+    """Synchronous PDF extraction from a file path or in-memory bytes.
+
+    Uses PyMuPDF when it is installed and falls back to PyPDF2 otherwise.
+    """
+    return _open_and_extract_all(source)
+
+@dataclass
+class DocumentChunks:
+    """
+    A document's chunks stored column-wise.
+
+    Embedding reads only the contents and storage zips the columns into COPY
+    records, so the chunks are kept as parallel columns rather than one dict
+    per chunk. document_id and filename are shared by every chunk and stored
+    once.
+    """
+    chunk_ids: List[str] = field(default_factory=list)
+    contents: List[str] = field(default_factory=list)
+    chunk_indices: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    page_numbers: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    sentence_counts: np.ndarray = field(default_factory=lambda: np.empty(0, dtype=np.int32))
+    document_id: Optional[str] = None
+    filename: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def slice(self, start: int, stop: int) -> "DocumentChunks":
+        """Chunks [start, stop) as a new DocumentChunks sharing the metadata."""
+        return DocumentChunks(
+            chunk_ids=self.chunk_ids[start:stop],
+            contents=self.contents[start:stop],
+            chunk_indices=self.chunk_indices[start:stop],
+            page_numbers=self.page_numbers[start:stop],
+            sentence_counts=self.sentence_counts[start:stop],
+            document_id=self.document_id,
+            filename=self.filename
+        )
+
+    def renumber(self, first_index: int):
+        """Assign consecutive chunk indices (and matching IDs) from first_index."""
+        self.chunk_indices = np.arange(first_index, first_index + len(self), dtype=np.int32)
+        self.chunk_ids = [new_chunk_id(index) for index in self.chunk_indices.tolist()]
+
+def new_chunk_id(chunk_index: int) -> str:
+    """Chunk IDs keep the chunk index plus a random suffix for uniqueness."""
+    return f"chunk_{chunk_index}_{secrets.token_hex(4)}"
+
+def _chunk_boundaries(sentence_lengths, chunk_size, overlap_count):
+    """
+    Compute chunk boundaries for one page as sentence index ranges.
+
+    Returns the start and end (exclusive) sentence index of every chunk.
+    Only integer lengths are involved, so the loop is compiled with Numba
+    when it is installed.
+    """
+    n = len(sentence_lengths)
+    # prefix[i] is the total length of sentences [0, i)
+    prefix = np.zeros(n + 1, dtype=np.int64)
+    prefix[1:] = np.cumsum(sentence_lengths)
+    starts = np.empty(n, dtype=np.int64)
+    ends = np.empty(n, dtype=np.int64)
+    chunk_count = 0
+
+    # Current chunk is sentences [start, start + count), whose space-joined
+    # text is current_len characters long
+    start = 0
+    count = 0
+    current_len = 0
+
+    for i in range(n):
+        sentence_len = sentence_lengths[i]
+        proposed_chunk_len = current_len + 1 + sentence_len
+
+        if proposed_chunk_len <= chunk_size:
+            current_len = proposed_chunk_len if count else sentence_len
+            count += 1
+            continue
+
+        # Save current chunk if it has content
+        if count:
+            starts[chunk_count] = start
+            ends[chunk_count] = i
+            chunk_count += 1
+
+        # Start new chunk with the overlap sentences plus the one that didn't fit
+        count = min(overlap_count, count) + 1
+        start = i + 1 - count
+        current_len = prefix[i + 1] - prefix[start] + count - 1
+
+    # Don't forget the last chunk
+    if count:
+        starts[chunk_count] = start
+        ends[chunk_count] = n
+        chunk_count += 1
+
+    return starts[:chunk_count], ends[:chunk_count]
+
+if njit is not None:
+    _chunk_boundaries = njit(cache=True)(_chunk_boundaries)
 
 def chunk_text(
     pages: List[Dict],
     chunk_size: int = None,
     chunk_overlap: int = None
-) -> List[Dict]:
+) -> DocumentChunks:
     """Create overlapping chunks from extracted text."""
-    print(f"✂️ CHUNKING: Starting text chunking process")
-
     if chunk_size is None:
         chunk_size = settings.chunk_size
     if chunk_overlap is None:
         chunk_overlap = settings.chunk_overlap
 
-    print(f"✂️ CHUNKING: Settings - chunk_size: {chunk_size}, chunk_overlap: {chunk_overlap}")
-    print(f"✂️ CHUNKING: Input - {len(pages)} pages to process")
+    # Number of trailing sentences carried over into the next chunk
+    overlap_count = max(1, chunk_overlap // 100) if chunk_overlap > 0 else 0
 
-    chunks = []
-    chunk_index = 0
+    debug = logger.isEnabledFor(logging.DEBUG)
+    contents = []
+    page_numbers = []
+    sentence_counts = []
 
-    for page_idx, page in enumerate(pages):
+    for page in pages:
         page_text = page["text"]
         page_number = page["page_number"]
 
-        print(f"✂️ CHUNKING: Processing page {page_idx + 1}/{len(pages)} (page number {page_number})")
-        print(f"✂️ CHUNKING: Page text length: {len(page_text)} characters")
-
         # Split text into sentences for better chunking
-        print(f"✂️ CHUNKING: Splitting page {page_number} into sentences...")
         sentences = _split_into_sentences(page_text)
-        print(f"✂️ CHUNKING: Page {page_number} split into {len(sentences)} sentences")
 
-        current_chunk = ""
-        current_sentences = []
+        sentence_lengths = np.fromiter(map(len, sentences), dtype=np.int64, count=len(sentences))
+        starts, ends = _chunk_boundaries(sentence_lengths, chunk_size, overlap_count)
 
-        for sentence_idx, sentence in enumerate(sentences):
-            sentence_len = len(sentence)
-            proposed_chunk_len = len(current_chunk + " " + sentence)
-
-            print(f"✂️ CHUNKING: Sentence {sentence_idx + 1}/{len(sentences)} - length: {sentence_len}, proposed total: {proposed_chunk_len}")
-
-            # Check if adding this sentence would exceed chunk size
-            if proposed_chunk_len <= chunk_size:
-                current_chunk += (" " + sentence) if current_chunk else sentence
-                current_sentences.append(sentence)
-                print(f"✂️ CHUNKING: Added sentence to current chunk (new length: {len(current_chunk)})")
-            else:
-                # Save current chunk if it has content
-                if current_chunk.strip():
-                    chunk_id = f"chunk_{chunk_index}_{uuid.uuid4().hex[:8]}"
-                    chunk_data = {
-                        "chunk_id": chunk_id,
-                        "chunk_index": chunk_index,
-                        "content": current_chunk.strip(),
-                        "page_number": page_number,
-                        "sentence_count": len(current_sentences)
-                    }
-                    chunks.append(chunk_data)
-                    print(f"✅ CHUNKING: Saved chunk {chunk_index} - {len(current_chunk)} chars, {len(current_sentences)} sentences")
-                    chunk_index += 1
-
-                # Start new chunk with overlap
-                if chunk_overlap > 0 and current_sentences:
-                    overlap_count = max(1, chunk_overlap // 100)
-                    overlap_sentences = current_sentences[-overlap_count:] if len(current_sentences) > overlap_count else current_sentences
-                    current_chunk = " ".join(overlap_sentences)
-                    current_sentences = overlap_sentences.copy()
-                    print(f"✂️ CHUNKING: Started new chunk with {len(overlap_sentences)} overlap sentences")
-                else:
-                    current_chunk = ""
-                    current_sentences = []
-                    print(f"✂️ CHUNKING: Started new chunk with no overlap")
-
-                # Add the sentence that didn't fit
-                current_chunk += (" " + sentence) if current_chunk else sentence
-                current_sentences.append(sentence)
-                print(f"✂️ CHUNKING: Added overflow sentence to new chunk")
-
-        # Don't forget the last chunk
-        if current_chunk.strip():
-            chunk_id = f"chunk_{chunk_index}_{uuid.uuid4().hex[:8]}"
-            chunk_data = {
-                "chunk_id": chunk_id,
-                "chunk_index": chunk_index,
-                "content": current_chunk.strip(),
-                "page_number": page_number,
-                "sentence_count": len(current_sentences)
-            }
-            chunks.append(chunk_data)
-            print(f"✅ CHUNKING: Saved final chunk {chunk_index} - {len(current_chunk)} chars")
-            chunk_index += 1
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            contents.append(" ".join(sentences[start:end]))
+        page_numbers.extend([page_number] * len(starts))
+        sentence_counts.append(ends - starts)
 
-        print(f"✅ CHUNKING: Completed page {page_number} - created {chunk_index} chunks so far")
+        if debug:
+            logger.debug(
+                "CHUNKING: Page %d - %d chars, %d sentences, %d chunks",
+                page_number, len(page_text), len(sentences), len(starts)
+            )
 
-    print(f"🎉 CHUNKING: Completed! Created {len(chunks)} total chunks from {len(pages)} pages")
-    logger.info(f"✅ Created {len(chunks)} chunks from {len(pages)} pages")
+    chunks = DocumentChunks(
+        contents=contents,
+        page_numbers=np.asarray(page_numbers, dtype=np.int32),
+        sentence_counts=(
+            np.concatenate(sentence_counts).astype(np.int32)
+            if sentence_counts else np.empty(0, dtype=np.int32)
+        )
+    )
+    chunks.renumber(0)
 
-    # Show chunk statistics
-    if chunks:
-        avg_length = sum(len(chunk["content"]) for chunk in chunks) / len(chunks)
-        min_length = min(len(chunk["content"]) for chunk in chunks)
-        max_length = max(len(chunk["content"]) for chunk in chunks)
-        print(f"📊 CHUNKING: Statistics - avg: {avg_length:.0f} chars, min: {min_length}, max: {max_length}")
+    logger.info("✅ Created %d chunks from %d pages", len(chunks), len(pages))
 
     return chunks
 
 def _split_into_sentences(text: str) -> List[str]:
     """Split text into sentences using simple rules."""
-    import re
-
-    # Simple sentence splitting on periods, exclamation marks, question marks
-    sentences = re.split(r'[.!?]+', text)
+    # Split on periods, exclamation marks and question marks, keeping only
+    # sentences with reasonable length
+    return [
+        sentence
+        for sentence in map(str.strip, text.translate(SENTENCE_END_TABLE).split("."))
+        if len(sentence) > 10
+    ]
 
-    # Clean and filter sentences
-    cleaned_sentences = []
-    for sentence in sentences:
-        sentence = sentence.strip()
-        # Only keep sentences with reasonable length
-        if sentence and len(sentence) > 10:
-            cleaned_sentences.append(sentence)
+async def process_document_file(
+    source: Union[str, bytes],
+    document_id: str,
+    filename: str
+) -> Dict:
+    """
+    Run the document processing pipeline in the process pool, off the event loop.
 
-    return cleaned_sentences
+    The PDF can be given as a file path or as its raw bytes; bytes are parsed
+    from memory without touching the filesystem.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_process_pool(), process_document_file_sync, source, document_id, filename
+        )
+    except Exception as e:
+        print(f"❌ DOC_PROCESS: Process pool execution failed: {e}")
+        logger.error(f"❌ Document processing failed: {e}")
+        return {
+            "success": False,
+            "error": str(e),
+            "chunks": []
+        }
 
-async def process_document_file(
-    file_path: str,
+def process_document_file_sync(
+    source: Union[str, bytes],
     document_id: str,
     filename: str
 ) -> Dict:
-    """Complete document processing pipeline."""
+    """Complete document processing pipeline (synchronous, runs in a worker process)."""
     print(f"🔄 DOC_PROCESS: Starting complete document processing pipeline")
-    print(f"🔄 DOC_PROCESS: File path: {file_path}")
+    if isinstance(source, (bytes, bytearray)):
+        print(f"🔄 DOC_PROCESS: In-memory PDF: {len(source)} bytes")
+    else:
+        print(f"🔄 DOC_PROCESS: File path: {source}")
     print(f"🔄 DOC_PROCESS: Document ID: {document_id}")
     print(f"🔄 DOC_PROCESS: Filename: {filename}")
 
@@ -238,7 +495,9 @@ async def process_document_file(
 
         # Extract text from PDF
         print(f"📄 DOC_PROCESS: Step 1 - Extracting text from PDF...")
-        extraction_result = await extract_pdf_text(file_path)
+        if isinstance(source, str) and not os.path.exists(source):
+            raise Exception(f"PDF file not found: {source}")
+        extraction_result = _extract_pdf_sync(source)
 
         if not extraction_result["success"]:
             error_msg = extraction_result["error"]
@@ -280,13 +539,9 @@ async def process_document_file(
 
         print(f"✅ DOC_PROCESS: Chunking successful - {len(chunks)} chunks created")
 
-        # Add document metadata to chunks
-        print(f"📝 DOC_PROCESS: Adding metadata to chunks...")
-        for i, chunk in enumerate(chunks):
-            chunk["document_id"] = document_id
-            chunk["filename"] = filename
-            if i < 3:  # Show first 3 chunks
-                print(f"📝 DOC_PROCESS: Chunk {i+1} - ID: {chunk['chunk_id']}, length: {len(chunk['content'])}")
+        # Document metadata is shared by every chunk
+        chunks.document_id = document_id
+        chunks.filename = filename
 
         logger.info(f"✅ Document processing complete: {len(chunks)} chunks created")
 
@@ -294,7 +549,8 @@ async def process_document_file(
             "success": True,
             "chunks": chunks,
             "total_pages": len(pages),
-            "total_chunks": len(chunks)
+            "total_chunks": len(chunks),
+            "metadata": extraction_result["metadata"]
         }
 
         print(f"🎉 DOC_PROCESS: Document processing pipeline completed successfully!")
@@ -311,6 +567,67 @@ async def process_document_file(
             "chunks": []
         }
 
+def _pdf_page_count(source: Union[str, bytes]) -> int:
+    with _open_fitz_document(source) as doc:
+        return doc.page_count
+
+def _chunk_page_range_sync(source: Union[str, bytes], start: int, stop: int) -> DocumentChunks:
+    """Extract and chunk pages [start, stop) (runs in a worker process)."""
+    return chunk_text(_extract_page_range(source, start, stop))
+
+async def iter_document_chunks(
+    source: Union[str, bytes],
+    document_id: str,
+    filename: str
+) -> AsyncIterator[DocumentChunks]:
+    """
+    Yield a document's chunks one page range at a time, in page order.
+
+    With PyMuPDF the page ranges are extracted and chunked in parallel in the
+    process pool, and each range is yielded as soon as it and every range
+    before it are done, so callers can embed early pages while later ones are
+    still being parsed. Chunk indices are renumbered across ranges so they
+    stay consecutive for the whole document.
+
+    Raises:
+        Exception: if the PDF can't be processed or contains no text
+    """
+    if fitz is None:
+        result = await process_document_file(source, document_id, filename)
+        if not result["success"]:
+            raise Exception(result["error"])
+        yield result["chunks"]
+        return
+
+    loop = asyncio.get_running_loop()
+    page_count = await asyncio.to_thread(_pdf_page_count, source)
+    step = max(1, -(-page_count // PDF_PAGE_WORKERS))
+    pool = get_process_pool()
+    futures = [
+        loop.run_in_executor(pool, _chunk_page_range_sync, source, start, start + step)
+        for start in range(0, page_count, step)
+    ]
+
+    chunk_index = 0
+    try:
+        for future in futures:
+            chunks = await future
+            if not len(chunks):
+                continue
+            chunks.renumber(chunk_index)
+            chunks.document_id = document_id
+            chunks.filename = filename
+            chunk_index += len(chunks)
+            yield chunks
+    finally:
+        for future in futures:
+            future.cancel()
+
+    if chunk_index == 0:
+        raise Exception("No text content found in PDF")
+
+    logger.info("✅ Document processing complete: %d chunks created", chunk_index)
+
 def validate_pdf_file(file_path: str) -> Dict:
     """Validate PDF file before processing."""
     try:
@@ -331,17 +648,15 @@ def validate_pdf_file(file_path: str) -> Dict:
         if not file_path.lower().endswith('.pdf'):
             return {"valid": False, "error": "File must be a PDF"}
 
-        # Try to open with PyPDF2 to validate
-        try:
-            import PyPDF2
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                if len(pdf_reader.pages) == 0:
-                    return {"valid": False, "error": "PDF has no pages"}
-        except ImportError:
-            logger.warning("⚠️ PyPDF2 not available for validation")
-        except Exception as e:
-            return {"valid": False, "error": f"Invalid PDF file: {e}"}
+        # Open the PDF to validate; only the page count is needed
+        result = _open_and_extract_all(file_path, extract_text=False)
+        if not result["success"]:
+            if result["error"] == PDF_LIBRARY_MISSING:
+                logger.warning("⚠️ PyPDF2 not available for validation")
+            else:
+                return {"valid": False, "error": f"Invalid PDF file: {result['error']}"}
+        elif result["metadata"]["page_count"] == 0:
+            return {"valid": False, "error": "PDF has no pages"}
 
         return {"valid": True}
 
@@ -351,31 +666,7 @@ def validate_pdf_file(file_path: str) -> Dict:
 # Metadata extraction functions
 def extract_pdf_metadata(file_path: str) -> Dict:
     """Extract metadata from PDF file."""
-    try:
-        import PyPDF2
-
-        metadata = {}
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-
-            # Basic info
-            metadata["page_count"] = len(pdf_reader.pages)
-
-            # Document info
-            if pdf_reader.metadata:
-                doc_info = pdf_reader.metadata
-                metadata.update({
-                    "title": doc_info.get("/Title", ""),
-                    "author": doc_info.get("/Author", ""),
-                    "subject": doc_info.get("/Subject", ""),
-                    "creator": doc_info.get("/Creator", ""),
-                    "producer": doc_info.get("/Producer", ""),
-                    "creation_date": str(doc_info.get("/CreationDate", "")),
-                    "modification_date": str(doc_info.get("/ModDate", ""))
-                })
-
-        return metadata
-
-    except Exception as e:
-        logger.warning(f"⚠️ Could not extract PDF metadata: {e}")
-        return {"page_count": 0}
\ No newline at end of file
+    result = _open_and_extract_all(file_path, extract_text=False)
+    if not result["success"]:
+        logger.warning(f"⚠️ Could not extract PDF metadata: {result['error']}")
+    return result["metadata"]
@@ -0,0 +1,153 @@
+"""
+Compact on-disk encoding for chunk embeddings.
+Embeddings are stored as int8 with a per-vector scale instead of float8 arrays.
+"""
+from typing import List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+# Largest int8 magnitude used; symmetric so negatives and positives share a scale
+INT8_MAX = 127
+
+
+def encode_embedding(embedding: Sequence[float]) -> Tuple[bytes, float]:
+    """
+    Quantize an embedding to int8.
+
+    Args:
+        embedding: Float embedding vector
+
+    Returns:
+        Packed int8 bytes and the scale needed to reconstruct the floats
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+    scale = max_abs / INT8_MAX if max_abs > 0 else 1.0
+    quantized = np.round(vector / scale).astype(np.int8)
+    return quantized.tobytes(), scale
+
+
+def decode_embedding(data: bytes, scale: Optional[float]) -> np.ndarray:
+    """Reconstruct a float32 embedding from its int8 encoding."""
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) * (scale or 1.0)
+
+
+def quantize_query(embedding: Sequence[float]) -> np.ndarray:
+    """Quantize a query embedding to int8 for scoring against stored vectors."""
+    data, _ = encode_embedding(embedding)
+    return np.frombuffer(data, dtype=np.int8)
+
+
+def cosine_scores(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of a query against every row of an (N, D) matrix."""
+    return cosine_scores_batch(np.asarray(query, dtype=np.float32)[None, :], matrix)[0]
+
+
+def normalize_embeddings(embeddings: Union[np.ndarray, List[Sequence[float]]]) -> np.ndarray:
+    """L2-normalize each row of an (N, D) batch; all-zero rows stay zero."""
+    matrix = np.array(embeddings, dtype=np.float32)
+    if matrix.ndim != 2:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+def row_norms(matrix: np.ndarray) -> np.ndarray:
+    """L2 norm of each matrix row, computed in float32."""
+    return np.linalg.norm(np.asarray(matrix, dtype=np.float32), axis=1)
+
+
+def cosine_scores_batch(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    norms: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Cosine similarity of (M, D) queries against every row of an (N, D) matrix.
+
+    With SimSIMD installed the whole matrix is scored in one call to its
+    runtime-dispatched SIMD kernel, reading the numpy buffers in place.
+    Otherwise the queries are normalized once up front, so scoring is a
+    single float32 BLAS matrix product. Passing the precomputed row norms
+    (see row_norms) reduces that to the product alone.
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    query_norms = np.linalg.norm(queries, axis=1)
+    if len(matrix) == 0 or not query_norms.any():
+        return np.zeros((len(queries), len(matrix)), dtype=np.float32)
+    if simsimd is not None and norms is None:
+        distances = np.asarray(simsimd.cdist(queries, matrix, metric="cosine"))
+        scores = (1.0 - distances).astype(np.float32)
+    else:
+        unit_queries = np.divide(
+            queries, query_norms[:, None], out=np.zeros_like(queries), where=query_norms[:, None] > 0
+        )
+        dots = unit_queries @ matrix.T
+        if norms is None:
+            norms = row_norms(matrix)
+        scores = np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+    scores[query_norms == 0] = 0.0
+    return scores
+
+
+def int8_cosine_scores(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of an int8 query against every row of an (N, D) int8 matrix."""
+    return int8_cosine_scores_batch(np.asarray(query, dtype=np.int8)[None, :], matrix)[0]
+
+
+def int8_cosine_scores_batch(
+    queries: np.ndarray,
+    matrix: np.ndarray,
+    norms: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Cosine similarity of (M, D) int8 queries against every row of an (N, D) int8 matrix.
+
+    Cosine is scale invariant, so the per-vector scales cancel and the stored
+    values are scored as-is. SimSIMD scores the int8 buffers directly with
+    its integer dot-product kernels (VNNI/NEON dot where available). Without
+    it the product runs in float32 so it goes through BLAS; up to ~1000
+    dimensions the int8 dot products are exact in float32. Precomputed row
+    norms select the BLAS product, skipping the per-row norm work.
+    """
+    if simsimd is not None and norms is None and len(matrix) and np.any(queries):
+        queries = np.ascontiguousarray(queries, dtype=np.int8)
+        matrix = np.ascontiguousarray(matrix, dtype=np.int8)
+        distances = np.asarray(simsimd.cdist(queries, matrix, metric="cosine"))
+        scores = (1.0 - distances).astype(np.float32)
+        scores[~queries.any(axis=1)] = 0.0
+        return scores
+    return cosine_scores_batch(queries.astype(np.float32), matrix.astype(np.float32), norms)
+
+
+def rank_chunks(scores: np.ndarray, topk: int) -> np.ndarray:
+    """Indices of the topk highest scores, best first."""
+    if topk <= 0 or scores.size == 0:
+        return np.empty(0, dtype=np.intp)
+    if topk < scores.size:
+        candidates = np.argpartition(-scores, topk - 1)[:topk]
+    else:
+        candidates = np.arange(scores.size)
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def encode_embeddings(embeddings: Union[np.ndarray, List[Sequence[float]]]) -> List[Tuple[bytes, float]]:
+    """
+    Quantize a batch of embeddings.
+
+    The whole (N, D) batch is scaled and rounded in one vectorized pass; only
+    the final per-row bytes are produced in Python.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] == 0:
+        return [encode_embedding(embedding) for embedding in embeddings]
+
+    max_abs = np.abs(matrix).max(axis=1) if matrix.shape[1] else np.zeros(len(matrix), dtype=np.float32)
+    scales = np.where(max_abs > 0, max_abs / INT8_MAX, 1.0).astype(np.float32)
+    quantized = np.round(matrix / scales[:, None]).astype(np.int8)
+    return [(row.tobytes(), float(scale)) for row, scale in zip(quantized, scales)]
@@ -2,18 +2,125 @@
 Embedding service for generating text embeddings.
 Supports multiple embedding strategies with fallbacks.
 """
+import asyncio
+import hashlib
+import math
+import threading
 import numpy as np
-from typing import List, Dict, Any, Optional
-from sklearn.feature_extraction.text import TfidfVectorizer
+from collections import Counter
+from scipy.sparse import csr_matrix
+from typing import List, Dict, Any, Optional, Tuple
+from sklearn.feature_extraction.text import HashingVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import logging
+from app.core.cache import TTLCache
 from app.core.config import settings
 
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 logger = logging.getLogger(__name__)
 
 # Global variables for models
 sentence_transformer_model = None
-tfidf_vectorizer = None
+
+# Width of every embedding strategy (paraphrase-MiniLM-L3-v2 and the hashing
+# fallback), which is also the dimension of the pgvector column
+EMBEDDING_DIM = 384
+
+# Stateless fallback embedder: hashing needs no fit, so documents and queries
+# always share one vector space across requests, workers and restarts
+hashing_vectorizer = HashingVectorizer(
+    n_features=EMBEDDING_DIM,  # Match sentence transformer dimension
+    stop_words='english',
+    ngram_range=(1, 2),
+    alternate_sign=False,
+    norm='l2'
+)
+
+# Recorded in documents."embeddingModel" for documents embedded by the hashing
+# fallback; SentenceTransformer documents record the model name
+HASHING_STRATEGY = "hashing"
+
+# Marks documents embedded before the strategy was recorded, whose vectors match
+# no current strategy; their chunks are dropped and the document re-embedded
+LEGACY_STRATEGY = "tfidf-legacy"
+
+# How long a query for a model-embedded document waits for the model to finish
+# loading at startup before it is answered as not ready
+MODEL_READY_TIMEOUT = 20.0
+
+# Set once the startup model load has finished, whether or not it succeeded
+model_load_finished = asyncio.Event()
+
+
+class EmbeddingStrategyUnavailable(RuntimeError):
+    """Raised when queries can't be embedded in the vector space of the searched documents."""
+
+
+# SentenceTransformer encode settings
+ENCODE_BATCH_SIZE = 64
+
+# SentenceTransformer embeddings of recently seen chunk texts, keyed by a
+# digest of the text. Hashed vectors are cheaper to recompute than to cache.
+# generate_embeddings runs in worker threads, so access goes through a lock.
+_embedding_cache = TTLCache(maxsize=10_000, ttl=3600)
+_embedding_cache_lock = threading.Lock()
+
+
+def _embedding_cache_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _encode_with_cache(texts: List[str]) -> np.ndarray:
+    """Encode texts with the SentenceTransformer, reusing cached embeddings."""
+    keys = [_embedding_cache_key(text) for text in texts]
+    with _embedding_cache_lock:
+        rows = [_embedding_cache.get(key) for key in keys]
+
+    # Encode each distinct uncached text once
+    missing: Dict[bytes, int] = {}
+    for i, (key, row) in enumerate(zip(keys, rows)):
+        if row is None and key not in missing:
+            missing[key] = i
+
+    if missing:
+        encoded = sentence_transformer_model.encode(
+            [texts[i] for i in missing.values()],
+            batch_size=ENCODE_BATCH_SIZE,
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+        fresh = dict(zip(missing, encoded))
+        with _embedding_cache_lock:
+            for key, row in fresh.items():
+                _embedding_cache.set(key, row)
+        rows = [fresh[key] if row is None else row for key, row in zip(keys, rows)]
+
+    return np.vstack(rows)
+
+def active_embedding_model() -> Optional[str]:
+    """Name of the loaded SentenceTransformer model, or None when using fallbacks."""
+    return settings.embedding_model if sentence_transformer_model is not None else None
+
+def active_embedding_strategy() -> str:
+    """Strategy new documents are embedded with: the loaded model's name, or hashing."""
+    return active_embedding_model() or HASHING_STRATEGY
+
+def encode_with_model(texts: List[str]) -> np.ndarray:
+    """Encode texts with the loaded SentenceTransformer, without fallbacks."""
+    if sentence_transformer_model is None:
+        raise RuntimeError("SentenceTransformer model not loaded")
+    return _encode_with_cache(texts)
 
 def load_embedding_model():
     """Load the sentence transformer model."""
@@ -32,182 +139,225 @@ def load_embedding_model():
 
 async def load_embedding_model_async():
     """Async wrapper for loading the embedding model."""
-    import asyncio
     loop = asyncio.get_event_loop()
-    await loop.run_in_executor(None, load_embedding_model)
+    try:
+        await loop.run_in_executor(None, load_embedding_model)
+    finally:
+        model_load_finished.set()
+
+def generate_embeddings(texts: List[str], method: str = "auto") -> np.ndarray:
+    """
+    Generate embeddings for a list of texts with fallback strategies.
 
-def generate_embeddings(texts: List[str], method: str = "auto") -> List[List[float]]:
-    """Generate embeddings for a list of texts with fallback strategies."""
-    print(f"EMBEDDINGS: Starting embedding generation for {len(texts)} texts")
-    print(f"EMBEDDINGS: Method: {method}")
+    Returns a (len(texts), dimensions) float32 array.
+    """
+    logger.debug("EMBEDDINGS: Generating embeddings for %d texts (method=%s)", len(texts), method)
 
     if not texts:
-        print(f" EMBEDDINGS: No texts provided, returning empty list")
-        return []
+        return np.empty((0, 0), dtype=np.float32)
 
-    # Show sample of input texts
-    for i, text in enumerate(texts[:3]):
-        print(f"EMBEDDINGS: Sample text {i+1}: {text[:100]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, text in enumerate(texts[:3]):
+            logger.debug("EMBEDDINGS: Sample text %d: %s...", i + 1, text[:100])
 
     # Strategy 1: SentenceTransformer (preferred)
-    if method in ["auto", "sentence_transformer"]:
-        print(f"EMBEDDINGS: Trying SentenceTransformer method...")
-        print(f"EMBEDDINGS: SentenceTransformer model available: {sentence_transformer_model is not None}")
+    if method in ["auto", "sentence_transformer"] and sentence_transformer_model:
+        try:
+            result = _encode_with_cache(texts)
+            logger.debug("EMBEDDINGS: SentenceTransformer generated %d x %d embeddings", *result.shape)
+            return result
+        except Exception as e:
+            logger.warning(f"⚠️ SentenceTransformer failed: {e}, falling back to hashing")
 
-        if sentence_transformer_model:
-            try:
-                print(f" EMBEDDINGS: Encoding {len(texts)} texts with SentenceTransformer...")
-                embeddings = sentence_transformer_model.encode(texts)
-                result = [embedding.tolist() for embedding in embeddings]
-                print(f" EMBEDDINGS: SentenceTransformer succeeded - generated {len(result)} embeddings")
-                print(f" EMBEDDINGS: First embedding shape: {len(result[0])} dimensions")
-                return result
-            except Exception as e:
-                print(f" EMBEDDINGS: SentenceTransformer failed: {e}")
-                logger.warning(f"⚠️ SentenceTransformer failed: {e}, falling back to TF-IDF")
-
-    # Strategy 2: TF-IDF fallback
-    if method in ["auto", "tfidf"]:
-        print(f" EMBEDDINGS: Trying TF-IDF fallback method...")
+    # Strategy 2: Hashed bag-of-words fallback
+    if method in ["auto", "hashing"]:
         try:
-            result = _generate_tfidf_embeddings(texts)
-            print(f" EMBEDDINGS: TF-IDF succeeded - generated {len(result)} embeddings")
-            if result:
-                print(f" EMBEDDINGS: TF-IDF embedding shape: {len(result[0])} dimensions")
+            result = _generate_hashed_embeddings(texts)
+            logger.debug("EMBEDDINGS: Hashing generated %d x %d embeddings", *result.shape)
             return result
         except Exception as e:
-            print(f" EMBEDDINGS: TF-IDF failed: {e}")
-            logger.warning(f"⚠️ TF-IDF failed: {e}, using basic embeddings")
+            logger.warning(f"⚠️ Hashing embeddings failed: {e}, using basic embeddings")
 
     # Strategy 3: Basic word-based embeddings (last resort)
-    print(f" EMBEDDINGS: Using basic word-based embeddings as last resort...")
     result = _generate_basic_embeddings(texts)
-    print(f" EMBEDDINGS: Basic embeddings generated - {len(result)} embeddings")
-    if result:
-        print(f" EMBEDDINGS: Basic embedding shape: {len(result[0])} dimensions")
+    logger.debug("EMBEDDINGS: Basic word-count generated %d x %d embeddings", *result.shape)
     return result
 
-def _generate_tfidf_embeddings(texts: List[str]) -> List[List[float]]:
-    """Generate TF-IDF based embeddings."""
-    print(f" TFIDF: Starting TF-IDF embedding generation for {len(texts)} texts")
-    global tfidf_vectorizer
-
-    if tfidf_vectorizer is None:
-        print(f" TFIDF: Creating new TF-IDF vectorizer...")
-        tfidf_vectorizer = TfidfVectorizer(
-            max_features=384,  # Match sentence transformer dimension
-            stop_words='english',
-            ngram_range=(1, 2)
-        )
-        print(f" TFIDF: Fitting vectorizer on {len(texts)} texts...")
-        # Fit on the provided texts
-        tfidf_vectorizer.fit(texts)
-        print(f" TFIDF: Vectorizer fitted successfully")
-    else:
-        print(f" TFIDF: Using existing TF-IDF vectorizer")
+def _generate_hashed_embeddings(texts: List[str]) -> np.ndarray:
+    """Generate L2-normalized hashed uni/bigram embeddings."""
+    return hashing_vectorizer.transform(texts).toarray().astype(np.float32, copy=False)
 
-    try:
-        print(f" TFIDF: Transforming texts to TF-IDF vectors...")
-        # Transform texts to TF-IDF vectors
-        tfidf_matrix = tfidf_vectorizer.transform(texts)
-        result = tfidf_matrix.toarray().tolist()
-        print(f" TFIDF: Successfully transformed {len(result)} texts to vectors")
-        print(f" TFIDF: Matrix shape: {tfidf_matrix.shape}")
-        return result
-    except Exception as e:
-        print(f" TFIDF: Transform failed: {e}, trying refit...")
-        # If transform fails, refit and transform
-        try:
-            tfidf_vectorizer.fit(texts)
-            tfidf_matrix = tfidf_vectorizer.transform(texts)
-            result = tfidf_matrix.toarray().tolist()
-            print(f" TFIDF: Refit and transform succeeded")
-            return result
-        except Exception as refit_error:
-            print(f" TFIDF: Refit also failed: {refit_error}")
-            raise
-
-def _generate_basic_embeddings(texts: List[str]) -> List[List[float]]:
+def _generate_basic_embeddings(texts: List[str]) -> np.ndarray:
     """Generate basic word-count based embeddings as last resort."""
-    all_words = set()
-    for text in texts:
-        words = text.lower().split()
-        all_words.update(words)
-
-    vocab = list(all_words)
-    embeddings = []
-
-    for text in texts:
-        words = text.lower().split()
-        word_counts = {word: words.count(word) for word in vocab}
-        embedding = [word_counts.get(word, 0) for word in vocab]
-        # Normalize
-        total = sum(embedding) or 1
-        normalized = [count/total for count in embedding]
-        embeddings.append(normalized)
-
-    return embeddings
-
-async def generate_query_embedding(query: str) -> List[float]:
-    """Generate embedding for a single query by reconstructing vectorizer from database."""
-    global tfidf_vectorizer
-
-    print(f"QUERY_EMBEDDING: Generating embedding for query: '{query[:50]}...'")
-
-    # Always reconstruct the vectorizer from database to ensure consistency
+    tokenized = [text.lower().split() for text in texts]
+    vocab_index = {word: i for i, word in enumerate(sorted(set().union(*tokenized)))}
+
+    # Build the sparse count matrix in one pass over each text
+    indices = []
+    data = []
+    indptr = [0]
+    for words in tokenized:
+        for word, count in Counter(words).items():
+            indices.append(vocab_index[word])
+            data.append(count)
+        indptr.append(len(indices))
+
+    counts = csr_matrix(
+        (np.asarray(data, dtype=np.float32), indices, indptr),
+        shape=(len(texts), len(vocab_index))
+    )
+    # Normalize each row to word frequencies
+    return normalize(counts, norm='l1', axis=1).toarray()
+
+async def generate_query_embeddings_batch(queries: List[str], strategy: Optional[str] = None) -> List[List[float]]:
+    """
+    Generate embeddings for several queries in one encode call.
+
+    Queries must be embedded with the strategy of the documents they search
+    (defaulting to the active one), otherwise the similarities are meaningless.
+    While the model is still loading, model queries wait up to
+    MODEL_READY_TIMEOUT for it.
+
+    Raises:
+        EmbeddingStrategyUnavailable: If the strategy's model isn't loaded
+    """
+    logger.debug("QUERY_EMBEDDING: Generating embeddings for %d queries", len(queries))
+    strategy = strategy or active_embedding_strategy()
+    if strategy == LEGACY_STRATEGY:
+        raise EmbeddingStrategyUnavailable("Document is queued for re-embedding")
+    if strategy != HASHING_STRATEGY:
+        if strategy != active_embedding_model() and not model_load_finished.is_set():
+            try:
+                await asyncio.wait_for(model_load_finished.wait(), MODEL_READY_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        if strategy != active_embedding_model():
+            raise EmbeddingStrategyUnavailable(f"Embedding model {strategy} is not loaded")
+        return (await asyncio.to_thread(encode_with_model, queries)).tolist()
     try:
-        from app.core.database import db_manager
-
-        async with db_manager.get_connection() as conn:
-            # Get all document content to retrain the vectorizer
-            chunks = await conn.fetch("SELECT content FROM document_embeddings ORDER BY \"chunkIndex\"")
-
-            if not chunks:
-                print("QUERY_EMBEDDING: No chunks found in database - no documents processed yet")
-                return []
-
-            print(f"QUERY_EMBEDDING: Found {len(chunks)} chunks, reconstructing vectorizer...")
-            chunk_texts = [chunk['content'] for chunk in chunks]
-
-            # Create a new TF-IDF vectorizer with the same settings as document processing
-            from sklearn.feature_extraction.text import TfidfVectorizer
-
-            vectorizer = TfidfVectorizer(
-                max_features=384,  # Match the document processing settings
-                stop_words='english',
-                ngram_range=(1, 2)
-            )
-
-            # Fit on all document chunks PLUS the query to ensure query tokens are included
-            all_texts = chunk_texts + [query]
-            vectorizer.fit(all_texts)
-
-            print(f"QUERY_EMBEDDING: Vectorizer fitted on {len(all_texts)} texts")
-
-            # Now transform just the query
-            query_matrix = vectorizer.transform([query])
-            query_embedding = query_matrix.toarray()[0].tolist()
-
-            print(f"QUERY_EMBEDDING: Generated {len(query_embedding)}-dimensional embedding")
-            print(f"QUERY_EMBEDDING: Sample values: {query_embedding[:5]}")
-
-            return query_embedding
-
+        return hashing_vectorizer.transform(queries).toarray().tolist()
     except Exception as e:
-        print(f"QUERY_EMBEDDING: Error reconstructing vectorizer: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        logger.exception(f"❌ QUERY_EMBEDDING: Error generating query embeddings: {e}")
+        return [[] for _ in queries]
+
+
+async def generate_query_embedding(query: str, strategy: Optional[str] = None) -> List[float]:
+    """Generate embedding for a single query."""
+    return (await generate_query_embeddings_batch([query], strategy))[0]
+
+
+class QueryEmbeddingBatcher:
+    """
+    Coalesces concurrent query embedding requests into one batch.
+
+    Queries that arrive within a few milliseconds of each other share one
+    encode call per embedding strategy instead of paying its per-call
+    overhead each.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait: float = 0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, Optional[str], asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        # Strong references to running flushes so they aren't garbage collected
+        self._flushes = set()
+
+    async def submit(self, query: str, strategy: Optional[str] = None) -> List[float]:
+        """Queue a query and wait for its embedding under the given strategy."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query, strategy, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.create_task(self._flush_after_wait())
+
+        return await future
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        groups: Dict[Optional[str], List[Tuple[str, asyncio.Future]]] = {}
+        for query, strategy, future in batch:
+            groups.setdefault(strategy, []).append((query, future))
+        for strategy, group in groups.items():
+            task = asyncio.get_running_loop().create_task(self._flush(strategy, group))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    @staticmethod
+    async def _flush(strategy: Optional[str], batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            embeddings = await generate_query_embeddings_batch([query for query, _ in batch], strategy)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+
+# Global batcher for request-path query embeddings
+query_embedding_batcher = QueryEmbeddingBatcher()
+
+def _cosine(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine similarity of two equal-length float32 vectors in a single pass."""
+    dot = 0.0
+    norm_a = 0.0
+    norm_b = 0.0
+    for i in range(a.shape[0]):
+        dot += a[i] * b[i]
+        norm_a += a[i] * a[i]
+        norm_b += b[i] * b[i]
+    if norm_a == 0.0 or norm_b == 0.0:
+        return 0.0
+    return dot / (math.sqrt(norm_a) * math.sqrt(norm_b))
+
+if njit is not None:
+    _cosine = njit(fastmath=True, cache=True, boundscheck=False)(_cosine)
+
+def warm_similarity_kernel():
+    """Compile the JIT cosine kernel ahead of the first search."""
+    if simsimd is None and njit is not None:
+        sample = np.ones(EMBEDDING_DIM, dtype=np.float32)
+        _cosine(sample, sample)
 
 def cosine_similarity_score(embedding1: List[float], embedding2: List[float]) -> float:
     """Calculate cosine similarity between two embeddings."""
     try:
         # Check if dimensions match
         if len(embedding1) != len(embedding2):
-            print(f"SIMILARITY: Dimension mismatch {len(embedding1)} vs {len(embedding2)} - using fallback")
+            logger.debug("SIMILARITY: Dimension mismatch %d vs %d - using fallback", len(embedding1), len(embedding2))
             # Fallback: simple word overlap similarity
             return _fallback_similarity(embedding1, embedding2)
 
+        if simsimd is not None:
+            # C kernel on float32 buffers instead of sklearn's pairwise setup
+            vec1 = np.asarray(embedding1, dtype=np.float32)
+            vec2 = np.asarray(embedding2, dtype=np.float32)
+            # SimSIMD reports distance 0 (similarity 1) when both vectors are
+            # zero; the other kernels score any zero vector 0
+            if not vec1.any() or not vec2.any():
+                return 0.0
+            return float(1.0 - simsimd.cosine(vec1, vec2))
+
+        if njit is not None:
+            # JIT-compiled loop when SimSIMD wheels aren't available
+            vec1 = np.ascontiguousarray(embedding1, dtype=np.float32)
+            vec2 = np.ascontiguousarray(embedding2, dtype=np.float32)
+            return float(_cosine(vec1, vec2))
+
         # Convert to numpy arrays
         vec1 = np.array(embedding1).reshape(1, -1)
         vec2 = np.array(embedding2).reshape(1, -1)
@@ -217,7 +367,6 @@ def cosine_similarity_score(embedding1: List[float], embedding2: List[float]) ->
         return float(similarity)
     except Exception as e:
         logger.error(f"Error calculating cosine similarity: {e}")
-        print(f"SIMILARITY: Cosine similarity failed, using fallback similarity")
         return _fallback_similarity(embedding1, embedding2)
 
 def _fallback_similarity(embedding1: List[float], embedding2: List[float]) -> float:
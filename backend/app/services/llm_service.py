@@ -3,53 +3,119 @@ LLM service for generating responses using Azure OpenAI.
 Handles RAG prompting and response generation.
 """
 import re
-from typing import List, Dict, Optional
-from openai import AzureOpenAI
+import hashlib
+from typing import AsyncIterator, List, Dict, Optional
+from openai import AsyncAzureOpenAI
+from app.core.cache import TTLCache
 from app.core.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize Azure OpenAI client using environment variables
-client = AzureOpenAI(
+# Initialize Azure OpenAI client using environment variables. The async
+# client keeps the event loop free while a completion is in flight.
+client = AsyncAzureOpenAI(
     api_key=settings.AZURE_OPENAI_API_KEY,
     azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
     api_version=settings.AZURE_OPENAI_API_VERSION,
 )
 
-async def call_llm(prompt: str) -> str:
-    """Call Azure OpenAI API with the given prompt."""
+SYSTEM_PROMPT = "You are a document-grounded assistant. Answer only from the provided context."
+LLM_TEMPERATURE = 0.2
+
+# Completions for identical prompts. Prompts embed the retrieved context, so
+# a hit means the same question against the same chunks.
+_completion_cache = TTLCache(maxsize=1024, ttl=3600)
+
+
+def _completion_cache_key(system_prompt: str, prompt: str) -> bytes:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(system_prompt.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(prompt.encode("utf-8"))
+    return digest.digest()
+
+
+def _messages(prompt: str) -> List[Dict]:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+
+
+async def call_llm(prompt: str, use_cache: bool = True) -> str:
+    """Call Azure OpenAI API with the given prompt, reusing answers to identical prompts."""
+    key = _completion_cache_key(SYSTEM_PROMPT, prompt)
+    if use_cache:
+        cached = _completion_cache.get(key)
+        if cached is not None:
+            return cached
+
     try:
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": "You are a document-grounded assistant. Answer only from the provided context."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2,
+            messages=_messages(prompt),
+            temperature=LLM_TEMPERATURE,
         )
 
-        return response.choices[0].message.content.strip()
+        answer = response.choices[0].message.content.strip()
 
     except Exception as e:
         logger.error(f"❌ Azure OpenAI call failed: {e}")
         raise e
 
-async def generate_response(query: str, context_chunks: List[Dict]) -> Dict:
-    """Generate response using RAG approach."""
-    if not context_chunks:
-        return {
-            "response": "I couldn't find specific information about that in your document. This might be because: 1) The content wasn't properly extracted from the PDF, 2) The question needs different keywords, or 3) The information isn't in the uploaded document. Try rephrasing your question or re-uploading the document.",
-            "citations": [],
-            "has_context": False
-        }
+    if use_cache:
+        _completion_cache.set(key, answer)
+    return answer
+
+
+async def stream_llm(prompt: str, use_cache: bool = True) -> AsyncIterator[str]:
+    """
+    Stream the completion for a prompt as text deltas.
+
+    Shares call_llm's cache: a cached answer is yielded in one piece, and a
+    streamed answer is cached once the stream completes.
+    """
+    key = _completion_cache_key(SYSTEM_PROMPT, prompt)
+    if use_cache:
+        cached = _completion_cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    try:
+        response = await client.chat.completions.create(
+            model=settings.AZURE_OPENAI_DEPLOYMENT,
+            messages=_messages(prompt),
+            temperature=LLM_TEMPERATURE,
+            stream=True,
+        )
+    except Exception as e:
+        logger.error(f"❌ Azure OpenAI call failed: {e}")
+        raise e
+
+    parts = []
+    async for chunk in response:
+        # Azure sends content-filter results as chunks without choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+
+    if use_cache:
+        _completion_cache.set(key, "".join(parts).strip())
 
+
+def build_rag_prompt(query: str, context_chunks: List[Dict]) -> str:
+    """Prompt answering the query from the retrieved chunks only."""
     context_text = "\n\n".join(
         f"Chunk {i+1}:\n{chunk['content']}"
         for i, chunk in enumerate(context_chunks)
     )
 
-    prompt = f"""
+    return f"""
 You are a document-based assistant.
 
 Rules:
@@ -67,9 +133,20 @@ Question:
 {query}
 """
 
-    # Call LLM
-    llm_answer = await call_llm(prompt)
 
+def build_smalltalk_prompt(query: str) -> str:
+    """Prompt for a brief reply to a greeting or acknowledgement."""
+    return f"""
+Reply briefly and politely to this conversational message.
+Do not cite any sources.
+
+Message:
+{query}
+"""
+
+
+def rag_response(llm_answer: str, context_chunks: List[Dict]) -> Dict:
+    """Response data for an answer generated from the given chunks."""
     citations = [
         {
             "chunk_id": chunk["chunk_id"],
@@ -82,9 +159,45 @@ Question:
     return {
         "response": llm_answer,
         "citations": citations,
-        "has_context": True
+        "has_context": True,
+        "chunks_found": len(citations)
+    }
+
+
+def smalltalk_response(llm_answer: str) -> Dict:
+    """Response data for a small-talk reply, which never cites sources."""
+    return {
+        "response": llm_answer,
+        "citations": [],
+        "has_context": False,
+        "chunks_found": 0
     }
 
+
+def not_found_response() -> Dict:
+    """Response data when retrieval found nothing to answer from."""
+    return {
+        "response": "I couldn't find specific information about that in your document. This might be because: 1) The content wasn't properly extracted from the PDF, 2) The question needs different keywords, or 3) The information isn't in the uploaded document. Try rephrasing your question or re-uploading the document.",
+        "citations": [],
+        "has_context": False,
+        "chunks_found": 0
+    }
+
+
+async def generate_response(query: str, context_chunks: List[Dict]) -> Dict:
+    """Generate response using RAG approach."""
+    if not context_chunks:
+        return not_found_response()
+
+    # Call LLM
+    llm_answer = await call_llm(build_rag_prompt(query, context_chunks))
+    return rag_response(llm_answer, context_chunks)
+
+async def generate_smalltalk_response(query: str) -> Dict:
+    """Reply to a greeting or acknowledgement without document context."""
+    llm_answer = await call_llm(build_smalltalk_prompt(query))
+    return smalltalk_response(llm_answer)
+
 async def format_rag_prompt(query: str, context_chunks: List[Dict]) -> str:
     """Format RAG prompt for LLM."""
     if not context_chunks:
@@ -0,0 +1,94 @@
+"""
+Bounded background queue for document processing.
+A fixed set of worker coroutines drains the queue, so concurrent uploads get
+backpressure instead of spawning unbounded processing tasks.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when the processing queue cannot accept more work."""
+
+
+class ProcessingQueue:
+    """Fixed-size job queue drained by a fixed number of worker coroutines."""
+
+    def __init__(self):
+        self.queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+    def start(self, handler: Callable[..., Awaitable[None]], workers: int, maxsize: int):
+        """Create the queue and spawn the worker coroutines."""
+        if self.queue is not None:
+            return
+
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._workers = [
+            asyncio.create_task(self._worker(handler), name=f"processing-worker-{i}")
+            for i in range(workers)
+        ]
+
+    async def _worker(self, handler: Callable[..., Awaitable[None]]):
+        """Run queued jobs one at a time until cancelled."""
+        while True:
+            job = await self.queue.get()
+            try:
+                await handler(*job)
+            except Exception as e:
+                # Handlers record their own failures; keep the worker alive
+                logger.error(f"❌ Processing job failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def is_full(self) -> bool:
+        """Whether a new job would currently be rejected."""
+        return self.queue is None or self.queue.full()
+
+    def submit(self, *job):
+        """
+        Enqueue a job without waiting.
+
+        Raises:
+            QueueFullError: If the queue isn't running or is at capacity
+        """
+        if self.queue is None:
+            raise QueueFullError("Processing queue is not running")
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFullError("Processing queue is full")
+
+    async def put(self, *job):
+        """
+        Enqueue a job, waiting for room; for internal work that shouldn't be shed.
+
+        Raises:
+            QueueFullError: If the queue isn't running
+        """
+        if self.queue is None:
+            raise QueueFullError("Processing queue is not running")
+        await self.queue.put(job)
+
+    async def stop(self, drain_timeout: float = 30.0):
+        """Let queued jobs finish (up to drain_timeout seconds), then stop the workers."""
+        if self.queue is None:
+            return
+
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ {self.queue.qsize()} processing jobs left undrained at shutdown")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self.queue = None
+
+
+# Global document processing queue
+document_queue = ProcessingQueue()
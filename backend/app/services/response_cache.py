@@ -0,0 +1,260 @@
+"""
+Response cache for chat answers.
+Stores generated RAG responses so repeated questions skip retrieval and the LLM:
+an in-process tier that also matches near-duplicate wording, backed by Redis.
+"""
+import re
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+import orjson
+from sklearn.feature_extraction.text import HashingVectorizer
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(message: str) -> str:
+    """Case- and whitespace-normalize a message for cache lookups."""
+    return " ".join(message.lower().split())
+
+
+# Tokens that flip a question's answer while barely moving its vector:
+# numbers and negations
+_GUARD_TOKEN_RE = re.compile(r"\d+|n't\b|\b(?:not|no|never|none|nor|neither|without|cannot)\b")
+
+
+def _guard_tokens(normalized: str) -> tuple:
+    """Numbers and negations of a message, which a near-duplicate must share exactly."""
+    return tuple(sorted(_GUARD_TOKEN_RE.findall(normalized)))
+
+
+class SemanticResponseCache:
+    """
+    In-process ring buffer of recent responses, matched by exact text or by
+    near-duplicate wording within the same document. Near-duplicates must also
+    contain exactly the same numbers and negations.
+
+    Query embeddings change with the active embedding strategy, so they can't
+    be compared across requests. Messages are instead projected with a
+    dedicated hashing vectorizer, whose vector space never changes.
+    """
+
+    def __init__(self, capacity: int = 1024, threshold: float = 0.95, n_features: int = 1024):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.n_features = n_features
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features,
+            # Keep single-character tokens such as digits
+            token_pattern=r"(?u)\b\w+\b",
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm="l2"
+        )
+        # Unit-length message vectors, one row per slot; empty slots stay zero
+        self._vectors = np.zeros((capacity, n_features), dtype=np.float32)
+        # slot -> (cache key, document ID, expiry, response data, guard tokens)
+        self._slots: List[Optional[tuple]] = [None] * capacity
+        self._slot_by_key: Dict[str, int] = {}
+        self._next_slot = 0
+
+    def embed(self, normalized: str) -> np.ndarray:
+        """Unit-length hashing vector of a normalized message."""
+        return self._vectorizer.transform([normalized]).toarray()[0].astype(np.float32)
+
+    def _live_payload(self, slot: int, document_id: Optional[str]) -> Optional[Dict]:
+        entry = self._slots[slot]
+        if entry is None or entry[1] != document_id or entry[2] <= time.monotonic():
+            return None
+        return entry[3]
+
+    def get(self, key: str, document_id: Optional[str], normalized: str) -> Optional[Dict]:
+        """Return cached response data for an identical or near-identical message."""
+        slot = self._slot_by_key.get(key)
+        if slot is not None:
+            payload = self._live_payload(slot, document_id)
+            if payload is not None:
+                return payload
+
+        # One matrix-vector product scores the message against every cached one
+        similarities = self._vectors @ self.embed(normalized)
+        candidates = np.flatnonzero(similarities >= self.threshold)
+        guard = _guard_tokens(normalized)
+        for slot in candidates[np.argsort(-similarities[candidates])]:
+            payload = self._live_payload(int(slot), document_id)
+            if payload is not None and self._slots[slot][4] == guard:
+                return payload
+        return None
+
+    def set(self, key: str, document_id: Optional[str], normalized: str, response_data: Dict):
+        """Store response data, overwriting the oldest slot once the buffer is full."""
+        slot = self._slot_by_key.get(key)
+        if slot is None:
+            slot = self._next_slot
+            self._next_slot = (slot + 1) % self.capacity
+            evicted = self._slots[slot]
+            if evicted is not None:
+                self._slot_by_key.pop(evicted[0], None)
+
+        self._vectors[slot] = self.embed(normalized)
+        self._slots[slot] = (
+            key, document_id, time.monotonic() + settings.response_cache_ttl,
+            response_data, _guard_tokens(normalized)
+        )
+        self._slot_by_key[key] = slot
+
+
+# RediSearch index over the Redis entries: a document tag plus the message
+# vector, so near-duplicates are found server-side across workers
+REDIS_KEY_PREFIX = "chat:v3:"
+REDIS_INDEX_NAME = "chat_responses"
+
+# How many nearest stored messages a Redis lookup checks against the guard tokens
+REDIS_KNN_CANDIDATES = 3
+
+
+def _escape_tag(value: str) -> str:
+    """Escape a RediSearch TAG value (IDs contain '-')."""
+    return re.sub(r"([^A-Za-z0-9_])", r"\\\1", value)
+
+
+class ResponseCache:
+    """
+    Two-tier cache of chat responses, scoped per document: in-process, then Redis.
+
+    Both tiers match near-duplicate messages on the same stable hashing
+    vectors and guard tokens. Redis entries are hashes holding the response
+    JSON and the message vector; when the server has the RediSearch module,
+    a KNN query finds near-duplicates, otherwise lookups are exact-key only.
+    """
+
+    def __init__(self):
+        self.client = None
+        self._disabled = not settings.redis_url
+        self.local = SemanticResponseCache()
+        # None until the index has been created (True) or found unsupported (False)
+        self._semantic: Optional[bool] = None
+
+    def _get_client(self):
+        """Create the Redis client on first use; disables the cache if unavailable."""
+        if self.client is None and not self._disabled:
+            try:
+                import redis.asyncio as redis
+                self.client = redis.from_url(settings.redis_url)
+            except ImportError:
+                logger.warning("⚠️ redis not installed, chat response cache disabled")
+                self._disabled = True
+        return self.client
+
+    async def _ensure_index(self, client) -> bool:
+        """Create the vector index once; False if the server has no RediSearch."""
+        if self._semantic is None:
+            try:
+                await client.execute_command(
+                    "FT.CREATE", REDIS_INDEX_NAME, "ON", "HASH", "PREFIX", 1, REDIS_KEY_PREFIX,
+                    "SCHEMA", "document", "TAG",
+                    "vector", "VECTOR", "FLAT", 6,
+                    "TYPE", "FLOAT32", "DIM", self.local.n_features, "DISTANCE_METRIC", "COSINE"
+                )
+                self._semantic = True
+            except Exception as e:
+                if "already exists" in str(e).lower():
+                    self._semantic = True
+                else:
+                    logger.warning(f"⚠️ RediSearch unavailable, Redis response cache is exact-match only: {e}")
+                    self._semantic = False
+        return self._semantic
+
+    @staticmethod
+    def _make_key(document_id: Optional[str], normalized: str) -> str:
+        """
+        Build the cache key from the document and the normalized message.
+
+        The key uses the case- and whitespace-normalized text rather than an
+        embedding, so it is identical across workers and embedding strategies.
+        """
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{REDIS_KEY_PREFIX}{document_id or 'none'}:{digest}"
+
+    async def _search_similar(self, client, document_id: Optional[str], normalized: str) -> Optional[bytes]:
+        """Response JSON of the nearest stored message that passes the threshold and guard."""
+        vector = self.local.embed(normalized)
+        if not vector.any():
+            # Nothing survived tokenization; cosine distance is undefined
+            return None
+        query = (
+            f"(@document:{{{_escape_tag(document_id or 'none')}}})"
+            f"=>[KNN {REDIS_KNN_CANDIDATES} @vector $vec AS distance]"
+        )
+        reply = await client.execute_command(
+            "FT.SEARCH", REDIS_INDEX_NAME, query,
+            "PARAMS", 2, "vec", vector.tobytes(),
+            "SORTBY", "distance", "RETURN", 3, "response", "guard", "distance",
+            "LIMIT", 0, REDIS_KNN_CANDIDATES, "DIALECT", 2
+        )
+        guard = " ".join(_guard_tokens(normalized)).encode("utf-8")
+        # [total, key, [field, value, ...], key, [...], ...]
+        for fields in reply[2::2]:
+            entry = dict(zip(fields[::2], fields[1::2]))
+            if not 1.0 - float(entry[b"distance"]) >= self.local.threshold:
+                break
+            if entry.get(b"guard", b"") == guard:
+                return entry[b"response"]
+        return None
+
+    async def get(self, document_id: Optional[str], message: str) -> Optional[Dict]:
+        """Return the cached response data for a message, if any."""
+        normalized = _normalize(message)
+        key = self._make_key(document_id, normalized)
+
+        cached = self.local.get(key, document_id, normalized)
+        if cached is not None:
+            return cached
+
+        client = self._get_client()
+        if client is None:
+            return None
+
+        try:
+            cached = await client.hget(key, "response")
+            if not cached and await self._ensure_index(client):
+                cached = await self._search_similar(client, document_id, normalized)
+            if not cached:
+                return None
+            response_data = orjson.loads(cached)
+            self.local.set(key, document_id, normalized, response_data)
+            return response_data
+        except Exception as e:
+            logger.warning(f"⚠️ Response cache lookup failed: {e}")
+            return None
+
+    async def set(self, document_id: Optional[str], message: str, response_data: Dict):
+        """Store response data for a message with the configured TTL."""
+        normalized = _normalize(message)
+        key = self._make_key(document_id, normalized)
+        self.local.set(key, document_id, normalized, response_data)
+
+        client = self._get_client()
+        if client is None:
+            return
+
+        try:
+            await self._ensure_index(client)
+            async with client.pipeline(transaction=True) as pipe:
+                pipe.hset(key, mapping={
+                    "response": orjson.dumps(response_data),
+                    "document": document_id or "none",
+                    "guard": " ".join(_guard_tokens(normalized)),
+                    "vector": self.local.embed(normalized).tobytes(),
+                })
+                pipe.expire(key, settings.response_cache_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Response cache store failed: {e}")
+
+
+# Global response cache instance
+response_cache = ResponseCache()
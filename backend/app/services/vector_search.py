@@ -2,42 +2,234 @@
 Vector search service for finding similar document chunks.
 Handles similarity search and ranking.
 """
+import asyncio
+import heapq
+import itertools
+from dataclasses import dataclass
 import asyncpg
-from typing import List, Dict, Optional
+import numpy as np
+from typing import AsyncIterator, List, Dict, Optional, Tuple, Union
 import logging
+from app.core.cache import TTLCache
 from app.core.database import db_manager
 from app.core.supabase_client import supabase_manager
-from app.services.embedding_service import cosine_similarity_score
+from app.services.document_processor import DocumentChunks
+from app.services.embedding_service import EMBEDDING_DIM, LEGACY_STRATEGY, cosine_similarity_score
+from app.services.embedding_codec import (
+    encode_embeddings, decode_embedding, quantize_query, normalize_embeddings, row_norms,
+    cosine_scores_batch, int8_cosine_scores_batch, rank_chunks
+)
 
 logger = logging.getLogger(__name__)
 
+# Rows stored as FLOAT[] before quantization move into the vector column, so
+# search never decodes them element by element again
+BACKFILL_VECTOR_QUERY = """
+UPDATE document_embeddings
+SET "embeddingVec" = embedding::real[]::vector
+WHERE "embeddingVec" IS NULL AND "embeddingQ" IS NULL
+  AND array_length(embedding, 1) = $1
+"""
+
+# Bump whenever the DDL in this module changes; startup skips all of it when
+# the database already records this version
+SCHEMA_VERSION = 3
+
+SCHEMA_META_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS schema_meta (
+    id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    version INTEGER NOT NULL,
+    "vectorIndex" VARCHAR,
+    "updatedAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+SCHEMA_META_QUERY = 'SELECT version, "vectorIndex" FROM schema_meta WHERE id = 1'
+
+SCHEMA_META_UPSERT_QUERY = """
+INSERT INTO schema_meta (id, version, "vectorIndex") VALUES (1, $1, $2)
+ON CONFLICT (id) DO UPDATE
+SET version = EXCLUDED.version, "vectorIndex" = EXCLUDED."vectorIndex", "updatedAt" = CURRENT_TIMESTAMP
+"""
+
+# Session-level advisory lock serializing startup migrations across workers;
+# session rather than transaction scope because CREATE INDEX CONCURRENTLY
+# can't run inside a transaction
+SCHEMA_LOCK_KEY = 0x646f6343  # "docC"
+SCHEMA_LOCK_QUERY = "SELECT pg_advisory_lock($1)"
+SCHEMA_UNLOCK_QUERY = "SELECT pg_advisory_unlock($1)"
+
+async def _fetch_schema_meta(conn) -> Optional[asyncpg.Record]:
+    try:
+        return await conn.fetchrow(SCHEMA_META_QUERY)
+    except asyncpg.UndefinedTableError:
+        return None
+
+async def ensure_schema() -> bool:
+    """
+    Bring the database schema up to SCHEMA_VERSION.
+
+    A current database costs a single query; the extension, table and index
+    DDL only runs when the recorded version is missing or behind. A current
+    schema recorded without a vector index retries just the pgvector setup.
+    Workers starting together take an advisory lock, so one runs the DDL.
+
+    Returns:
+        True if the DDL ran, False if the schema was already current
+    """
+    async with db_manager.get_connection() as conn:
+        row = await _fetch_schema_meta(conn)
+        if row and row['version'] >= SCHEMA_VERSION and row['vectorIndex'] is not None:
+            db_manager.use_vector_index(row['vectorIndex'], EMBEDDING_DIM)
+            return False
+
+        await conn.execute(SCHEMA_LOCK_QUERY, SCHEMA_LOCK_KEY)
+        try:
+            # Another worker may have migrated while this one waited for the lock
+            row = await _fetch_schema_meta(conn)
+            if row and row['version'] >= SCHEMA_VERSION:
+                if row['vectorIndex'] is not None:
+                    db_manager.use_vector_index(row['vectorIndex'], EMBEDDING_DIM)
+                    return False
+                # Recorded without pgvector: retry only the vector setup
+                await enable_vector_search()
+                if db_manager.vector_index is None:
+                    return False
+            else:
+                async def _create_embeddings_schema():
+                    await create_embeddings_table()
+                    await enable_vector_search()
+
+                # The chat tables depend on neither, so both chains run concurrently
+                await asyncio.gather(_create_embeddings_schema(), create_chat_tables())
+                await conn.execute(SCHEMA_META_TABLE_QUERY)
+
+            await conn.execute(SCHEMA_META_UPSERT_QUERY, SCHEMA_VERSION, db_manager.vector_index)
+        finally:
+            await conn.execute(SCHEMA_UNLOCK_QUERY, SCHEMA_LOCK_KEY)
+
+    logger.info(f"✅ Database schema migrated to version {SCHEMA_VERSION}")
+    return True
+
+# Hash partitions of document_embeddings; a document-filtered search only
+# touches the partitions (and per-partition HNSW indexes) holding its documents
+EMBEDDING_PARTITIONS = 16
+
+EMBEDDINGS_PARTITIONED_QUERY = """
+SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('document_embeddings')
+"""
+
+# Unique keys on a partitioned table must include the partition key, so
+# chunks are unique per ("documentId", "chunkId"). Tables created before
+# partitioning keep their layout and get the same unique index.
+EMBEDDINGS_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS document_embeddings (
+    id SERIAL,
+    "documentId" VARCHAR NOT NULL,
+    "chunkId" VARCHAR NOT NULL,
+    "chunkIndex" INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    embedding FLOAT[] NOT NULL,
+    "pageNumber" INTEGER,
+    "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, "documentId"),
+    FOREIGN KEY ("documentId") REFERENCES documents(id) ON DELETE CASCADE
+) PARTITION BY HASH ("documentId")
+"""
+
+EMBEDDINGS_PARTITIONS_QUERY = "\n".join(
+    f"CREATE TABLE IF NOT EXISTS document_embeddings_p{remainder} PARTITION OF document_embeddings "
+    f"FOR VALUES WITH (MODULUS {EMBEDDING_PARTITIONS}, REMAINDER {remainder});"
+    for remainder in range(EMBEDDING_PARTITIONS)
+)
+
+# Completed documents with no recorded strategy were embedded by the old
+# corpus-fitted TF-IDF (or whichever model happened to be loaded), which no
+# query can match. Their chunks are dropped, so neither the vector backfill
+# nor search sees them, and the documents go back to PROCESSING until
+# requeue_legacy_documents re-embeds them.
+LEGACY_DOCUMENTS_QUERY = """
+WITH legacy AS (
+    UPDATE documents SET "embeddingModel" = $1, status = 'PROCESSING'
+    WHERE "embeddingModel" IS NULL AND status = 'COMPLETED'
+    RETURNING id
+)
+DELETE FROM document_embeddings WHERE "documentId" IN (SELECT id FROM legacy)
+"""
+
 async def create_embeddings_table():
     """Create the embeddings table if it doesn't exist - using Prisma-compatible column names."""
     query = """
-    CREATE TABLE IF NOT EXISTS document_embeddings (
-        id SERIAL PRIMARY KEY,
-        "documentId" VARCHAR NOT NULL,
-        "chunkId" VARCHAR UNIQUE NOT NULL,
-        "chunkIndex" INTEGER NOT NULL,
-        content TEXT NOT NULL,
-        embedding FLOAT[] NOT NULL,
-        "pageNumber" INTEGER,
-        "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY ("documentId") REFERENCES documents(id) ON DELETE CASCADE
-    );
-
+    CREATE UNIQUE INDEX IF NOT EXISTS "document_embeddings_documentId_chunkId_key"
+    ON document_embeddings("documentId", "chunkId");
     CREATE INDEX IF NOT EXISTS idx_document_embeddings_documentId ON document_embeddings("documentId");
     CREATE INDEX IF NOT EXISTS idx_document_embeddings_chunkId ON document_embeddings("chunkId");
+
+    -- int8-quantized embeddings; "embedding" stays for rows written before quantization
+    ALTER TABLE document_embeddings ADD COLUMN IF NOT EXISTS "embeddingQ" BYTEA;
+    ALTER TABLE document_embeddings ADD COLUMN IF NOT EXISTS "embeddingScale" REAL;
+
+    -- SHA-256 of the uploaded bytes, used to reuse embeddings of identical uploads
+    ALTER TABLE documents ADD COLUMN IF NOT EXISTS "contentSha" VARCHAR;
+    CREATE INDEX IF NOT EXISTS idx_documents_contentSha ON documents("contentSha");
+
+    -- Embedding strategy the chunks were embedded with, so queries match it
+    ALTER TABLE documents ADD COLUMN IF NOT EXISTS "embeddingModel" VARCHAR;
+
+    -- Model embeddings by SHA-256 of the chunk text, packed float32
+    CREATE TABLE IF NOT EXISTS embedding_cache (
+        hash BYTEA NOT NULL,
+        model VARCHAR NOT NULL,
+        embedding BYTEA NOT NULL,
+        "createdAt" TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (hash, model)
+    );
     """
 
     try:
         async with db_manager.get_connection() as conn:
-            await conn.execute(query)
+            async with conn.transaction():
+                await conn.execute(EMBEDDINGS_TABLE_QUERY)
+                if await conn.fetchval(EMBEDDINGS_PARTITIONED_QUERY):
+                    await conn.execute(EMBEDDINGS_PARTITIONS_QUERY)
+                await conn.execute(query)
+                result = await conn.execute(LEGACY_DOCUMENTS_QUERY, LEGACY_STRATEGY)
         logger.info("✅ Embeddings table created/verified")
+        dropped = int(result.split()[-1])
+        if dropped:
+            logger.info(f"✅ Dropped {dropped} legacy embeddings for re-embedding")
     except Exception as e:
         logger.error(f"❌ Failed to create embeddings table: {e}")
         raise
 
+async def enable_vector_search():
+    """Set up the pgvector column, HNSW index and backfill, if the extension is available."""
+    # The vector column needs the extension first
+    try:
+        await db_manager.enable_pgvector_extension()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not enable pgvector: {e}")
+
+    try:
+        await db_manager.create_vector_index(EMBEDDING_DIM)
+        logger.info("✅ pgvector column and HNSW index created/verified")
+        result = await db_manager.execute(BACKFILL_VECTOR_QUERY, EMBEDDING_DIM)
+        backfilled = int(result.split()[-1])
+        if backfilled:
+            logger.info(f"✅ Moved {backfilled} FLOAT[] embeddings into the vector column")
+    except Exception as e:
+        # Without pgvector, search keeps ranking the int8 embeddings in Python
+        logger.warning(f"⚠️ pgvector index unavailable, using in-process search: {e}")
+
+# Composite indexes for the session list and history reads (names match the
+# Prisma @@index defaults) plus a GIN index for "documentIds" membership tests
+CHAT_INDEXES = (
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "chat_sessions_userId_updatedAt_idx" '
+    'ON chat_sessions("userId", "updatedAt")',
+    'CREATE INDEX CONCURRENTLY IF NOT EXISTS "chat_sessions_documentIds_idx" '
+    'ON chat_sessions USING GIN ("documentIds")',
+)
+
 async def create_chat_tables():
     """Create the chat tables if they don't exist - using Prisma-compatible column names."""
     query = """
@@ -65,79 +257,187 @@ async def create_chat_tables():
     CREATE INDEX IF NOT EXISTS idx_chat_sessions_updatedAt ON chat_sessions("updatedAt");
     CREATE INDEX IF NOT EXISTS idx_chat_messages_sessionId ON chat_messages("sessionId");
     CREATE INDEX IF NOT EXISTS idx_chat_messages_createdAt ON chat_messages("createdAt");
+    -- Same name as the Prisma @@index([sessionId, createdAt]) so the two never duplicate
+    CREATE INDEX IF NOT EXISTS "chat_messages_sessionId_createdAt_idx" ON chat_messages("sessionId", "createdAt");
     """
 
     try:
         async with db_manager.get_connection() as conn:
             await conn.execute(query)
+            # CONCURRENTLY can't run inside the multi-statement block above;
+            # building these on a live table this way doesn't block writes
+            for index_sql in CHAT_INDEXES:
+                await conn.execute(index_sql)
         logger.info("✅ Chat tables created/verified")
     except Exception as e:
         logger.error(f"❌ Failed to create chat tables: {e}")
         raise
 
+EMBEDDING_COLUMNS = (
+    "documentId", "chunkId", "chunkIndex", "content",
+    "embedding", "embeddingQ", "embeddingScale", "pageNumber"
+)
+EMBEDDING_VECTOR_COLUMNS = EMBEDDING_COLUMNS + ("embeddingVec",)
+
+# Per-connection staging table; rows vanish at commit so it is always empty
+EMBEDDINGS_STAGE_QUERY = """
+CREATE TEMP TABLE IF NOT EXISTS document_embeddings_stage
+(LIKE document_embeddings INCLUDING DEFAULTS) ON COMMIT DELETE ROWS
+"""
+
+def _stage_upsert_query(columns) -> str:
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    updates = ", ".join(
+        f'"{column}" = EXCLUDED."{column}"' for column in columns if column not in ("documentId", "chunkId")
+    )
+    return (
+        f"INSERT INTO document_embeddings ({quoted}) "
+        f"SELECT {quoted} FROM document_embeddings_stage "
+        f'ON CONFLICT ("documentId", "chunkId") DO UPDATE SET {updates}'
+    )
+
+UPSERT_STAGED_EMBEDDINGS_QUERY = _stage_upsert_query(EMBEDDING_COLUMNS)
+UPSERT_STAGED_VECTOR_EMBEDDINGS_QUERY = _stage_upsert_query(EMBEDDING_VECTOR_COLUMNS)
+
 async def store_embeddings_in_database(
     document_id: str,
-    chunks: List[Dict],
-    embeddings: List[List[float]]
+    chunks: DocumentChunks,
+    embeddings: Union[np.ndarray, List[List[float]]]
 ):
     """Store document chunks and their embeddings in PostgreSQL."""
-    print(f"💾 VECTOR_DB: Starting to store embeddings in database")
-    print(f"💾 VECTOR_DB: Document ID: {document_id}")
-    print(f"💾 VECTOR_DB: Chunks: {len(chunks)}, Embeddings: {len(embeddings)}")
+    logger.debug("VECTOR_DB: storing %s embeddings for document %s", len(embeddings), document_id)
 
     if len(chunks) != len(embeddings):
         error_msg = f"Number of chunks ({len(chunks)}) and embeddings ({len(embeddings)}) must match"
-        print(f"❌ VECTOR_DB: {error_msg}")
+        logger.error(f"❌ {error_msg}")
         raise ValueError(error_msg)
 
-    insert_query = """
-    INSERT INTO document_embeddings ("documentId", "chunkId", "chunkIndex", content, embedding, "pageNumber")
-    VALUES ($1, $2, $3, $4, $5, $6)
-    ON CONFLICT ("chunkId") DO UPDATE SET
-        content = EXCLUDED.content,
-        embedding = EXCLUDED.embedding,
-        "pageNumber" = EXCLUDED."pageNumber"
-    """
-
-    print(f"💾 VECTOR_DB: Prepared insert query")
+    # Store unit-length int8 embeddings plus their scale; the float array
+    # column is left empty for new rows
+    embeddings = normalize_embeddings(embeddings)
+    records = []
+    for chunk_id, chunk_index, content, page_number, (quantized, scale) in zip(
+        chunks.chunk_ids,
+        chunks.chunk_indices.tolist(),
+        chunks.contents,
+        chunks.page_numbers.tolist(),
+        encode_embeddings(embeddings)
+    ):
+        records.append((
+            document_id,
+            chunk_id,
+            chunk_index,
+            content,
+            [],
+            quantized,
+            scale,
+            page_number
+        ))
+
+    columns, upsert_query = EMBEDDING_COLUMNS, UPSERT_STAGED_EMBEDDINGS_QUERY
+    if db_manager.vector_enabled and embeddings.shape[1:] == (EMBEDDING_DIM,):
+        # Full-precision copy for the HNSW index; the registered codec
+        # sends each float32 row as a binary vector
+        columns, upsert_query = EMBEDDING_VECTOR_COLUMNS, UPSERT_STAGED_VECTOR_EMBEDDINGS_QUERY
+        records = [record + (vector,) for record, vector in zip(records, embeddings)]
 
     try:
-        print(f"💾 VECTOR_DB: Getting database connection...")
         async with db_manager.get_connection() as conn:
-            print(f"✅ VECTOR_DB: Database connection established")
-
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                print(f"💾 VECTOR_DB: Storing embedding {i+1}/{len(chunks)} - chunk_id: {chunk['chunk_id']}")
-                print(f"💾 VECTOR_DB: Chunk content length: {len(chunk['content'])}")
-                print(f"💾 VECTOR_DB: Embedding dimension: {len(embedding)}")
-
-                try:
-                    await conn.execute(
-                        insert_query,
-                        document_id,
-                        chunk["chunk_id"],
-                        chunk["chunk_index"],
-                        chunk["content"],
-                        embedding,
-                        chunk.get("page_number")
-                    )
-                    print(f"✅ VECTOR_DB: Stored embedding {i+1} successfully")
-                except Exception as chunk_error:
-                    print(f"❌ VECTOR_DB: Failed to store embedding {i+1}: {chunk_error}")
-                    raise
-
-        print(f"🎉 VECTOR_DB: Successfully stored all {len(chunks)} embeddings in database")
+            # Binary COPY into the staging table, then one set-based upsert,
+            # so a retried batch overwrites its chunks instead of failing
+            async with conn.transaction():
+                await conn.execute(EMBEDDINGS_STAGE_QUERY)
+                await conn.copy_records_to_table(
+                    "document_embeddings_stage",
+                    records=records,
+                    columns=columns
+                )
+                await conn.execute(upsert_query)
+
+        invalidate_corpus_cache(document_id)
         logger.info(f"✅ Stored {len(chunks)} embeddings in database")
 
     except Exception as e:
-        print(f"❌ VECTOR_DB: Critical error storing embeddings: {e}")
         logger.error(f"❌ Failed to store embeddings: {e}")
         raise
 
+EMBEDDING_CACHE_LOOKUP_QUERY = """
+SELECT hash, embedding FROM embedding_cache
+WHERE hash = ANY($1::bytea[]) AND model = $2
+"""
+
+EMBEDDING_CACHE_STORE_QUERY = """
+INSERT INTO embedding_cache (hash, model, embedding)
+SELECT hash, $3, embedding FROM unnest($1::bytea[], $2::bytea[]) AS c(hash, embedding)
+ON CONFLICT (hash, model) DO NOTHING
+"""
+
+async def fetch_cached_embeddings(hashes: List[bytes], model: str) -> Dict[bytes, np.ndarray]:
+    """Look up persisted embeddings of chunk texts by content hash in one query."""
+    try:
+        rows = await db_manager.fetch(EMBEDDING_CACHE_LOOKUP_QUERY, hashes, model)
+        return {row['hash']: np.frombuffer(row['embedding'], dtype=np.float32) for row in rows}
+    except Exception as e:
+        logger.warning(f"⚠️ Embedding cache lookup failed: {e}")
+        return {}
+
+async def store_cached_embeddings(hashes: List[bytes], model: str, embeddings: np.ndarray):
+    """Persist freshly computed embeddings; existing entries are left untouched."""
+    try:
+        packed = [row.tobytes() for row in np.asarray(embeddings, dtype=np.float32)]
+        await db_manager.execute(EMBEDDING_CACHE_STORE_QUERY, hashes, packed, model)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update embedding cache: {e}")
+
+COPY_EMBEDDINGS_QUERY = """
+INSERT INTO document_embeddings (
+    "documentId", "chunkId", "chunkIndex", content,
+    embedding, "embeddingQ", "embeddingScale", "pageNumber"
+)
+SELECT $2, 'chunk_' || "chunkIndex" || '_' || substr(md5($2 || "chunkId"), 1, 8),
+       "chunkIndex", content, embedding, "embeddingQ", "embeddingScale", "pageNumber"
+FROM document_embeddings
+WHERE "documentId" = $1
+"""
+
+COPY_EMBEDDINGS_VECTOR_QUERY = """
+INSERT INTO document_embeddings (
+    "documentId", "chunkId", "chunkIndex", content,
+    embedding, "embeddingQ", "embeddingScale", "pageNumber", "embeddingVec"
+)
+SELECT $2, 'chunk_' || "chunkIndex" || '_' || substr(md5($2 || "chunkId"), 1, 8),
+       "chunkIndex", content, embedding, "embeddingQ", "embeddingScale", "pageNumber", "embeddingVec"
+FROM document_embeddings
+WHERE "documentId" = $1
+"""
+
+async def copy_document_embeddings(source_document_id: str, target_document_id: str) -> int:
+    """
+    Copy every chunk and embedding of one document to another.
+
+    Used when an upload is byte-identical to an already processed document.
+    Chunk IDs are derived from the target document and the source chunk ID,
+    keeping the chunk_<index>_<hex8> format while staying unique.
+
+    Returns:
+        Number of embeddings copied
+    """
+    query = COPY_EMBEDDINGS_VECTOR_QUERY if db_manager.vector_enabled else COPY_EMBEDDINGS_QUERY
+
+    try:
+        result = await db_manager.execute(query, source_document_id, target_document_id)
+        copied_count = int(result.split()[-1])
+        invalidate_corpus_cache(target_document_id)
+        logger.info(f"✅ Copied {copied_count} embeddings from {source_document_id} to {target_document_id}")
+        return copied_count
+    except Exception as e:
+        logger.error(f"❌ Failed to copy embeddings: {e}")
+        raise
+
 async def store_embeddings_in_supabase_vectors(
     document_id: str,
-    chunks: List[Dict],
-    embeddings: List[List[float]]
+    chunks: DocumentChunks,
+    embeddings: Union[np.ndarray, List[List[float]]]
 ):
     """Store embeddings in Supabase vector store (if available)."""
     try:
@@ -145,14 +445,20 @@ async def store_embeddings_in_supabase_vectors(
 
         # Prepare data for Supabase
         vector_data = []
-        for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        for chunk_id, chunk_index, content, page_number, embedding in zip(
+            chunks.chunk_ids,
+            chunks.chunk_indices.tolist(),
+            chunks.contents,
+            chunks.page_numbers.tolist(),
+            embeddings
+        ):
             vector_data.append({
                 "document_id": document_id,
-                "chunk_id": chunk["chunk_id"],
-                "chunk_index": chunk["chunk_index"],
-                "content": chunk["content"],
-                "embedding": embedding,
-                "page_number": chunk.get("page_number")
+                "chunk_id": chunk_id,
+                "chunk_index": chunk_index,
+                "content": content,
+                "embedding": np.asarray(embedding, dtype=np.float32).tolist(),
+                "page_number": page_number
             })
 
         # Insert into Supabase vector table
@@ -164,6 +470,171 @@ async def store_embeddings_in_supabase_vectors(
         # Fallback to regular database
         await store_embeddings_in_database(document_id, chunks, embeddings)
 
+# Rows per cursor fetch in the in-process search
+SEARCH_FETCH_SIZE = 1024
+
+# Blocks at least this large are scored in a worker thread; BLAS and SimSIMD
+# release the GIL, so the event loop keeps serving requests meanwhile
+SCORE_IN_THREAD_ROWS = 256
+
+@dataclass
+class CorpusBlock:
+    """One fetched block of chunk rows, grouped and stacked for scoring."""
+    quantized_rows: List[asyncpg.Record]
+    quantized_matrix: np.ndarray
+    quantized_norms: np.ndarray
+    float_rows: List[asyncpg.Record]
+    float_matrix: np.ndarray
+    float_norms: np.ndarray
+    other_rows: List[asyncpg.Record]
+
+# Scoring-ready corpus blocks per (document filter, unindexed-only, dimension).
+# Writes drop affected entries; the TTL bounds staleness from writes made by
+# other processes.
+_corpus_cache = TTLCache(maxsize=64, ttl=300)
+_corpus_generation = 0
+
+def invalidate_corpus_cache(document_id: str):
+    """Forget cached corpora that include a document whose chunks changed."""
+    global _corpus_generation
+    _corpus_generation += 1
+    _corpus_cache.discard_where(lambda key: key[0] is None or document_id in key[0])
+
+def _build_corpus_block(rows: List[asyncpg.Record], dims: int) -> CorpusBlock:
+    """
+    Group rows by how they are scored and stack each group into a matrix.
+
+    Quantized chunks are scored against an int8 copy of the query and rows
+    written before quantization against the float query; only rows with a
+    different dimension fall back to per-chunk scoring.
+    """
+    quantized_rows = []
+    float_rows = []
+    other_rows = []
+    for row in rows:
+        chunk_q = row['embeddingQ']
+        if chunk_q is not None:
+            if dims and len(chunk_q) == dims:
+                quantized_rows.append(row)
+            else:
+                other_rows.append(row)
+        elif dims and len(row['embedding']) == dims:
+            float_rows.append(row)
+        else:
+            other_rows.append(row)
+
+    quantized_matrix = np.frombuffer(
+        b"".join(row['embeddingQ'] for row in quantized_rows), dtype=np.int8
+    ).reshape(len(quantized_rows), dims)
+    float_matrix = np.array([row['embedding'] for row in float_rows], dtype=np.float32).reshape(len(float_rows), dims)
+    # Row norms are computed once per block, so cached blocks score with
+    # plain dot products
+    return CorpusBlock(
+        quantized_rows, quantized_matrix, row_norms(quantized_matrix),
+        float_rows, float_matrix, row_norms(float_matrix),
+        other_rows
+    )
+
+def _score_block(
+    block: CorpusBlock,
+    query_matrix: np.ndarray,
+    queries_q: np.ndarray,
+    limit: int
+) -> List[List[Tuple[float, asyncpg.Record]]]:
+    """
+    Score one corpus block against every query and return each query's best candidates.
+
+    Each group is scored for all queries with one matrix product.
+    """
+    scored = [[] for _ in range(len(query_matrix))]
+    if block.quantized_rows:
+        scores = int8_cosine_scores_batch(queries_q, block.quantized_matrix, block.quantized_norms)
+        for candidates, query_scores in zip(scored, scores):
+            for index in rank_chunks(query_scores, limit):
+                candidates.append((float(query_scores[index]), block.quantized_rows[index]))
+
+    if block.float_rows:
+        scores = cosine_scores_batch(query_matrix, block.float_matrix, block.float_norms)
+        for candidates, query_scores in zip(scored, scores):
+            for index in rank_chunks(query_scores, limit):
+                candidates.append((float(query_scores[index]), block.float_rows[index]))
+
+    for row in block.other_rows:
+        try:
+            chunk_embedding = row['embedding']
+            if row['embeddingQ'] is not None:
+                chunk_embedding = decode_embedding(row['embeddingQ'], row['embeddingScale'])
+            for candidates, query_embedding in zip(scored, query_matrix):
+                candidates.append((cosine_similarity_score(query_embedding, chunk_embedding), row))
+        except Exception as chunk_error:
+            logger.warning(f"⚠️ Failed to score chunk {row['chunkId']}: {chunk_error}")
+
+    return scored
+
+async def _iter_corpus_blocks(cache_key: tuple, query: str, params: list, dims: int) -> AsyncIterator[CorpusBlock]:
+    """
+    Yield the corpus blocks for a search, from the cache when possible.
+
+    On a miss, rows stream through a server-side cursor and each block is
+    yielded as soon as it is built, then the full set is cached unless a
+    write invalidated it meanwhile.
+    """
+    blocks = _corpus_cache.get(cache_key)
+    if blocks is not None:
+        for block in blocks:
+            yield block
+        return
+
+    generation = _corpus_generation
+    blocks = []
+    async with db_manager.get_connection() as conn:
+        async with conn.transaction():
+            cursor = await conn.cursor(query, *params)
+            while True:
+                rows = await cursor.fetch(SEARCH_FETCH_SIZE)
+                if not rows:
+                    break
+                block = _build_corpus_block(rows, dims)
+                blocks.append(block)
+                yield block
+
+    if generation == _corpus_generation:
+        _corpus_cache.set(cache_key, blocks)
+
+# Ranking reads only the slim columns; content is fetched for the winners.
+# One constant per filter combination, so each connection prepares every
+# variant once and asyncpg's statement cache reuses it afterwards.
+_CORPUS_SELECT = """
+SELECT "documentId", "chunkId", embedding, "embeddingQ", "embeddingScale"
+FROM document_embeddings
+"""
+
+CORPUS_QUERIES = {
+    # (unindexed rows only, document filter)
+    (False, False): _CORPUS_SELECT,
+    (False, True): _CORPUS_SELECT + 'WHERE "documentId" = ANY($1::varchar[])',
+    (True, False): _CORPUS_SELECT + 'WHERE "embeddingVec" IS NULL',
+    (True, True): _CORPUS_SELECT + 'WHERE "embeddingVec" IS NULL AND "documentId" = ANY($1::varchar[])',
+}
+
+# chunkId is only unique within a document, so details are matched on both columns
+CHUNK_DETAILS_QUERY = """
+SELECT "documentId", "chunkId", content, "pageNumber"
+FROM document_embeddings
+WHERE ("documentId", "chunkId") IN (
+    SELECT * FROM unnest($1::varchar[], $2::varchar[])
+)
+"""
+
+def _hit_result(hit) -> Dict:
+    return {
+        "chunk_id": hit.id,
+        "content": hit.content,
+        "page_number": hit.page_number,
+        "document_id": hit.document_id,
+        "similarity": hit.similarity
+    }
+
 async def search_similar_chunks(
     query_embedding: List[float],
     document_ids: Optional[List[str]] = None,
@@ -171,80 +642,198 @@ async def search_similar_chunks(
     similarity_threshold: float = 0.0  # Lowered to 0.0 for debugging
 ) -> List[Dict]:
     """Search for similar chunks using cosine similarity."""
+    results = await search_similar_chunks_batch([query_embedding], document_ids, limit, similarity_threshold)
+    return results[0]
 
-    print(f"VECTOR_SEARCH: Starting similarity search")
-    print(f"VECTOR_SEARCH: Query embedding dimension: {len(query_embedding)}")
-    print(f"VECTOR_SEARCH: Document IDs filter: {document_ids}")
-    print(f"VECTOR_SEARCH: Similarity threshold: {similarity_threshold}")
-
-    # Base query
-    base_query = """
-    SELECT "chunkId", content, "pageNumber", "documentId", embedding
-    FROM document_embeddings
+async def search_similar_chunks_batch(
+    query_embeddings: List[List[float]],
+    document_ids: Optional[List[str]] = None,
+    limit: int = 5,
+    similarity_threshold: float = 0.0
+) -> List[List[Dict]]:
     """
+    Search for the chunks most similar to each of several query embeddings.
 
-    params = []
-    where_conditions = []
+    All queries must share one dimension. Each corpus block is scored against
+    every query with a single matrix product instead of one pass per query.
+    """
+    if not query_embeddings:
+        return []
 
-    # Add document filter if specified
+    query_matrix = np.array(query_embeddings, dtype=np.float32)
+    indexed_results = [[] for _ in query_embeddings]
+    unindexed_only = False
+    if db_manager.vector_enabled and query_matrix.shape[1] == EMBEDDING_DIM:
+        # pgvector ranks every indexed chunk inside the database; only rows
+        # stored before the vector column existed are fetched and scored below
+        try:
+            if len(query_matrix) == 1:
+                hits_per_query = [await db_manager.vector_similarity_search(
+                    query_matrix[0], document_ids, limit, similarity_threshold
+                )]
+            else:
+                hits_per_query = await db_manager.vector_similarity_search_batch(
+                    list(query_matrix), document_ids, limit, similarity_threshold
+                )
+            indexed_results = [[_hit_result(hit) for hit in hits] for hits in hits_per_query]
+            # Document-filtered searches are ranked exactly, but a short HNSW
+            # answer may have missed rows, so then every chunk is scored below
+            # and the indexed hits are only a fallback if that fails
+            unindexed_only = bool(document_ids) or all(len(hits) >= limit for hits in hits_per_query)
+        except Exception as e:
+            logger.warning(f"⚠️ pgvector search failed, scoring every chunk in Python: {e}")
+
+    query, params = CORPUS_QUERIES[(unindexed_only, bool(document_ids))], []
     if document_ids:
-        where_conditions.append(f'"documentId" = ANY(${len(params) + 1})')
         params.append(document_ids)
 
-    # Construct full query
-    if where_conditions:
-        query = base_query + " WHERE " + " AND ".join(where_conditions)
-    else:
-        query = base_query
-
-    print(f"VECTOR_SEARCH: SQL Query: {query}")
-    print(f"VECTOR_SEARCH: Query parameters: {params}")
-
     try:
-        async with db_manager.get_connection() as conn:
-            rows = await conn.fetch(query, *params)
-            print(f"VECTOR_SEARCH: Found {len(rows)} chunks in database")
-
-            if len(rows) == 0:
-                print("VECTOR_SEARCH: No chunks found in database - check if document was processed")
-                return []
-
-            # Calculate similarities
-            results = []
-            for i, row in enumerate(rows):
-                try:
-                    chunk_embedding = row['embedding']
-                    print(f"VECTOR_SEARCH: Chunk {i+1} embedding dimension: {len(chunk_embedding)}")
-
-                    similarity = cosine_similarity_score(query_embedding, chunk_embedding)
-                    print(f"VECTOR_SEARCH: Chunk {i+1} similarity: {similarity:.4f}")
-
-                    if similarity >= similarity_threshold:
-                        results.append({
-                            "chunk_id": row['chunkId'],
-                            "content": row['content'],
-                            "page_number": row['pageNumber'],
-                            "document_id": row['documentId'],
-                            "similarity": similarity
-                        })
-                        print(f"VECTOR_SEARCH: Chunk {i+1} added to results (similarity: {similarity:.4f})")
-                    else:
-                        print(f"VECTOR_SEARCH: Chunk {i+1} filtered out (similarity: {similarity:.4f} < {similarity_threshold})")
-
-                except Exception as chunk_error:
-                    print(f"VECTOR_SEARCH: Error processing chunk {i+1}: {chunk_error}")
-
-            # Sort by similarity (highest first) and limit
-            results.sort(key=lambda x: x['similarity'], reverse=True)
-            final_results = results[:limit]
-
-            print(f"VECTOR_SEARCH: Returning {len(final_results)} results after filtering and sorting")
-            return final_results
+        # Score the corpus block by block into a running top-k heap per query
+        queries_q = np.stack([quantize_query(embedding) for embedding in query_matrix])
+        dims = queries_q.shape[1]
+        cache_key = (tuple(sorted(document_ids)) if document_ids else None, unindexed_only, dims)
+        heaps = [[] for _ in query_embeddings]
+        sequence = itertools.count()
+        row_count = 0
+        async for block in _iter_corpus_blocks(cache_key, query, params, dims):
+            block_rows = len(block.quantized_rows) + len(block.float_rows) + len(block.other_rows)
+            row_count += block_rows
+            if block_rows * len(query_matrix) >= SCORE_IN_THREAD_ROWS:
+                block_scores = await asyncio.to_thread(_score_block, block, query_matrix, queries_q, limit)
+            else:
+                block_scores = _score_block(block, query_matrix, queries_q, limit)
+            for heap, candidates in zip(heaps, block_scores):
+                for similarity, row in candidates:
+                    if similarity < similarity_threshold:
+                        continue
+                    # Negated sequence keeps the earlier row on ties
+                    entry = (similarity, -next(sequence), row)
+                    if len(heap) < limit:
+                        heapq.heappush(heap, entry)
+                    elif limit > 0:
+                        heapq.heappushpop(heap, entry)
+
+        # Second pass: content and location of the top-k chunks only
+        top_keys = list({(row['documentId'], row['chunkId']) for heap in heaps for _, _, row in heap})
+        details = {}
+        if top_keys:
+            document_keys, chunk_keys = zip(*top_keys)
+            rows = await db_manager.fetch(CHUNK_DETAILS_QUERY, list(document_keys), list(chunk_keys))
+            details = {(row['documentId'], row['chunkId']): row for row in rows}
+
+        final_results = []
+        for heap, indexed in zip(heaps, indexed_results):
+            results = [
+                {
+                    "chunk_id": row['chunkId'],
+                    "content": details[key]['content'],
+                    "page_number": details[key]['pageNumber'],
+                    "document_id": row['documentId'],
+                    "similarity": similarity
+                }
+                for similarity, _, row in sorted(heap, reverse=True)
+                for key in [(row['documentId'], row['chunkId'])]
+                # Skip chunks deleted since the corpus was read
+                if key in details
+            ]
+            if indexed and unindexed_only:
+                results = sorted(
+                    indexed + results,
+                    key=lambda result: result["similarity"],
+                    reverse=True
+                )[:limit]
+            final_results.append(results)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            kept = [result["similarity"] for results in final_results for result in results]
+            logger.debug(
+                "VECTOR_SEARCH: queries=%d dims=%d indexed=%d scored=%d kept=%d top=%.4f",
+                len(query_matrix), query_matrix.shape[1], sum(map(len, indexed_results)),
+                row_count, len(kept), max(kept, default=0.0)
+            )
+        return final_results
 
     except Exception as e:
-        print(f"VECTOR_SEARCH: Vector search failed: {e}")
         logger.error(f"❌ Vector search failed: {e}")
-        return []
+        return indexed_results
+
+class ChunkSearchBatcher:
+    """
+    Coalesces concurrent chunk searches into batched searches.
+
+    Searches over the same documents that arrive within a few milliseconds
+    of each other are scored together by search_similar_chunks_batch.
+    """
+
+    def __init__(self, max_batch: int = 32, max_wait: float = 0.005):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[tuple, List[float], asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        # Strong references to running flushes so they aren't garbage collected
+        self._flushes = set()
+
+    async def submit(
+        self,
+        query_embedding: List[float],
+        document_ids: Optional[List[str]] = None,
+        limit: int = 5,
+        similarity_threshold: float = 0.0
+    ) -> List[Dict]:
+        """Queue a search and wait for its results."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = (tuple(document_ids or ()), limit, similarity_threshold, len(query_embedding))
+        self._pending.append((key, query_embedding, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._start_flush()
+        elif self._timer is None:
+            self._timer = loop.create_task(self._flush_after_wait())
+
+        return await future
+
+    async def _flush_after_wait(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._start_flush()
+
+    def _start_flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        groups: Dict[tuple, List[Tuple[List[float], asyncio.Future]]] = {}
+        for key, query_embedding, future in batch:
+            groups.setdefault(key, []).append((query_embedding, future))
+        loop = asyncio.get_running_loop()
+        for key, group in groups.items():
+            task = loop.create_task(self._flush(key, group))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    @staticmethod
+    async def _flush(key: tuple, group: List[Tuple[List[float], asyncio.Future]]):
+        document_ids, limit, similarity_threshold, _ = key
+        try:
+            results = await search_similar_chunks_batch(
+                [query_embedding for query_embedding, _ in group],
+                list(document_ids) or None,
+                limit,
+                similarity_threshold
+            )
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+
+# Global batcher for request-path chunk searches
+chunk_search_batcher = ChunkSearchBatcher()
 
 async def get_document_chunks(document_id: str) -> List[Dict]:
     """Get all chunks for a specific document."""
@@ -268,7 +857,8 @@ async def delete_document_embeddings(document_id: str):
     query = 'DELETE FROM document_embeddings WHERE "documentId" = $1'
 
     try:
-        result = await db_manager.execute_query(query, document_id)
+        result = await db_manager.execute(query, document_id)
+        invalidate_corpus_cache(document_id)
         logger.info(f"✅ Deleted embeddings for document {document_id}")
         return result
     except Exception as e:
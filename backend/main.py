@@ -2,26 +2,34 @@
 AI Knowledge Assistant API
 RAG (Retrieval-Augmented Generation) backend with FastAPI
 """
+import os
+import logging
+import importlib.util
 import uvicorn
 import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
 from app.core.config import settings
 from app.core.database import db_manager
+from app.core.logging_config import setup_logging, shutdown_logging
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 
 async def _background_model_loading():
     """Load embedding model in background without blocking startup."""
     try:
-        from app.services.embedding_service import load_embedding_model_async
+        from app.services.embedding_service import load_embedding_model_async, warm_similarity_kernel
         await load_embedding_model_async()
+        await asyncio.to_thread(warm_similarity_kernel)
         print("✅ Background model loading completed")
     except Exception as e:
         print(f"⚠️ Background model loading failed: {e}")
-        print("⚠️ Will use TF-IDF fallback for embeddings")
+        print("⚠️ Will use hashing fallback for embeddings")
 
 
 @asynccontextmanager
@@ -29,28 +37,37 @@ async def lifespan(app: FastAPI):
     """Application lifespan manager for startup and shutdown tasks."""
     # Startup
     print("🚀 Starting AI Knowledge Assistant API...")
+    logger.info("Event loop: %s", type(asyncio.get_running_loop()).__module__)
+
+    # Start the bounded document processing workers
+    from app.api.documents import process_document_background
+    from app.services.processing_queue import document_queue
+    document_queue.start(
+        process_document_background,
+        workers=settings.processing_workers or min(os.cpu_count() or 1, 4),
+        maxsize=settings.processing_queue_size,
+    )
+
+    # Load the embedding model in the background (non-blocking); it doesn't
+    # need the database, so it overlaps with connecting and the schema check
+    print("🔄 Attempting to load embedding model in background...")
+    asyncio.create_task(_background_model_loading())
 
     try:
         # Initialize database connection
         await db_manager.connect()
         print("✅ Database connection established")
 
-        # Enable pgvector extension
-        await db_manager.enable_pgvector_extension()
-        print("✅ pgvector extension enabled")
-
-        # Create embeddings table
-        from app.services.vector_search import create_embeddings_table, create_chat_tables
-        await create_embeddings_table()
-        print("✅ Embeddings table created")
+        # Run schema DDL only when the recorded schema version is behind
+        from app.services.vector_search import ensure_schema
+        if await ensure_schema():
+            print("✅ Database schema migrated")
+        else:
+            print("✅ Database schema is current")
 
-        # Create chat tables
-        await create_chat_tables()
-        print("✅ Chat tables created")
-
-        # Try to load embedding model in background (non-blocking)
-        print("🔄 Attempting to load embedding model in background...")
-        asyncio.create_task(_background_model_loading())
+        # Re-embed documents the migration found without a recorded strategy
+        from app.api.documents import requeue_legacy_documents
+        asyncio.create_task(requeue_legacy_documents())
 
     except Exception as e:
         print(f"❌ Startup failed: {e}")
@@ -60,9 +77,20 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     print("🛑 Shutting down AI Knowledge Assistant API...")
+    await document_queue.stop()
+    print("✅ Document processing queue drained")
     await db_manager.disconnect()
     print("✅ Database connection closed")
 
+    from app.core.supabase_client import supabase_manager
+    await supabase_manager.close()
+
+    from app.services.document_processor import shutdown_process_pool
+    shutdown_process_pool()
+    print("✅ Document processing pool stopped")
+
+    shutdown_logging()
+
 
 # Create FastAPI application with lifespan management
 app = FastAPI(
@@ -70,6 +98,7 @@ app = FastAPI(
     description="RAG-based document chat API with vector similarity search",
     version="1.0.0",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware
@@ -135,11 +164,19 @@ app.include_router(documents.router, prefix="/api/documents", tags=["documents"]
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 
 
+def _has_module(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
         reload=settings.debug,
+        workers=None if settings.debug else settings.web_workers,
+        # uvloop/httptools are not available on every platform (e.g. Windows)
+        loop="uvloop" if _has_module("uvloop") else "asyncio",
+        http="httptools" if _has_module("httptools") else "h11",
         log_level="info"
     )
\ No newline at end of file